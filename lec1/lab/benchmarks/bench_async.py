@@ -0,0 +1,92 @@
+import asyncio
+import io
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'example'))
+
+from tokenizer import tokenize
+from iterative_parser import parse_iterative
+from resolver import resolve
+from interpreter import interpret, RunContext
+from ir_exec import compile_ir
+from cooperative import interpret_async, Scheduler, DEFAULT_SLICE_STEPS
+
+# 在事件循环中执行很多个程序: 比较同步执行 (interpret、run_ir) 和 interpret_async / Scheduler 的总耗时，
+# 以及执行期间事件循环的响应延迟 (另一个协程两次被调度之间的最长间隔)
+# 每个 interpret_async 各自编译一次模块，同时执行的协程越多，事件循环转一圈越慢；
+# Scheduler 对同一个模块只编译一次，每个时间片之后都让出事件循环
+SOURCE = '''
+function fib(n) {
+    if (n < 2) return n;
+    return fib(n - 1) + fib(n - 2);
+}
+function main() {
+    i = 0;
+    s = 0;
+    while (i < %d) {
+        s = s + i;
+        i = i + 1;
+    }
+    print(s);
+    return fib(%d);
+}
+'''
+
+# 执行 work 的同时，测量事件循环的最长间隔
+async def measure(work):
+    done = False
+    worst = 0.0
+    last = time.perf_counter()
+
+    async def ticker():
+        nonlocal worst, last
+        while not done:
+            await asyncio.sleep(0)
+            now = time.perf_counter()
+            worst = max(worst, now - last)
+            last = now
+
+    tick = asyncio.ensure_future(ticker())
+    start = time.perf_counter()
+    results = await work()
+    elapsed = time.perf_counter() - start
+    done = True
+    await tick
+    # 同步执行时 ticker 一直等到全部执行完才有机会运行
+    worst = max(worst, time.perf_counter() - last)
+    return elapsed, worst, results
+
+def main():
+    runs = int(sys.argv[1]) if len(sys.argv) > 1 else 1000
+    slice_steps = int(sys.argv[2]) if len(sys.argv) > 2 else DEFAULT_SLICE_STEPS
+    module = resolve(parse_iterative(tokenize(SOURCE % (200, 12))))
+    run = compile_ir(module)
+
+    async def sync_tree():
+        return [interpret(module, context=RunContext(output=io.StringIO())) for _ in range(runs)]
+
+    async def sync_ir():
+        return [run(io.StringIO()) for _ in range(runs)]
+
+    async def async_each():
+        return await asyncio.gather(*[interpret_async(module, slice_steps=slice_steps, output=io.StringIO())
+                                      for _ in range(runs)])
+
+    async def scheduler():
+        s = Scheduler(slice_steps)
+        return await asyncio.gather(*[s.submit(module, output=io.StringIO()) for _ in range(runs)])
+
+    print(f"{runs} 个程序，时间片 {slice_steps} 步")
+    print(f"{'':<24}{'总耗时':>10}{'最长间隔':>12}")
+    results: set[float] = set()
+    for name, work in (('interpret (同步)', sync_tree), ('run_ir (同步)', sync_ir),
+                       ('interpret_async', async_each), ('Scheduler', scheduler)):
+        elapsed, worst, values = asyncio.run(measure(work))
+        results.update(values)
+        print(f"{name:<24}{elapsed * 1000:>10.1f}ms{worst * 1000:>10.2f}ms")
+    assert len(results) == 1, results
+
+if __name__ == '__main__':
+    main()
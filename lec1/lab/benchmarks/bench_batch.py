@@ -0,0 +1,60 @@
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'example'))
+
+import numpy as np
+from tokenizer import tokenize
+from parser import parse
+from batch import interpret_batch
+import transpiler
+
+# 打分函数: 纯浮点运算，带分支和次数随输入变化的循环
+SOURCE = '''
+scale = 0.5;
+function score(a, b) {
+    s = a * scale - b / 4;
+    if (s < 0) s = -s;
+    n = 0;
+    while (s > 1) {
+        s = s / 2;
+        n = n + 1;
+        if (n > 5) break;
+    }
+    if (a > b) return s + n;
+    return s - n;
+}
+'''
+
+# 比较批量执行和逐行调用 (翻译成 Python 后逐行调用，是逐行执行最快的方式) 的耗时
+# 逐行调用太慢，行数超过 max_scalar_rows 时不再测
+def main():
+    max_scalar_rows = int(float(sys.argv[1])) if len(sys.argv) > 1 else 10 ** 5
+    module = parse(tokenize(SOURCE))
+    py_module = transpiler.compile_module(parse(tokenize(SOURCE)))
+    py_module.init()
+    scalar_score = py_module.FUNCTIONS['score']
+    rng = np.random.default_rng(0)
+
+    print(f"{'行数':<12}{'批量':>12}{'逐行':>12}{'加速比':>10}")
+    for exponent in range(3, 8):
+        rows = 10 ** exponent
+        a = rng.uniform(-100, 100, rows)
+        b = rng.uniform(-100, 100, rows)
+
+        start = time.perf_counter()
+        result = interpret_batch(module, 'score', a, b)
+        batch_time = time.perf_counter() - start
+
+        if rows <= max_scalar_rows:
+            start = time.perf_counter()
+            expected = [scalar_score(x, y) for x, y in zip(a.tolist(), b.tolist())]
+            scalar_time = time.perf_counter() - start
+            assert np.array_equal(result, expected)
+            print(f"{rows:<12}{batch_time * 1000:>10.1f}ms{scalar_time * 1000:>10.1f}ms{scalar_time / batch_time:>9.1f}x")
+        else:
+            print(f"{rows:<12}{batch_time * 1000:>10.1f}ms{'-':>12}{'-':>10}")
+
+if __name__ == '__main__':
+    main()
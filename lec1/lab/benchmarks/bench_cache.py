@@ -0,0 +1,42 @@
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+from bench_tokenizer import generate_source
+
+# 比较编译缓存冷启动和热启动时运行 slang.py 的总耗时
+# 生成的程序里没有 main 函数，耗时基本都在启动和前端上
+def run_slang(filename: str, *options: str) -> float:
+    here = os.path.dirname(os.path.abspath(__file__))
+    start = time.perf_counter()
+    subprocess.run([sys.executable, os.path.join(here, '..', 'example', 'slang.py'), filename, *options],
+                   check=True, stdout=subprocess.DEVNULL)
+    return time.perf_counter() - start
+
+def main():
+    size = int(float(sys.argv[1]) * 1024 * 1024) if len(sys.argv) > 1 else 1024 * 1024
+    source = generate_source(size)
+    print(f"源代码大小: {len(source.encode('utf-8')) / 1024 / 1024:.1f} MB")
+
+    work_dir = tempfile.mkdtemp()
+    try:
+        filename = os.path.join(work_dir, 'program.slang')
+        with open(filename, 'w', encoding='utf-8') as f:
+            f.write(source)
+        cache_dir = os.path.join(work_dir, 'cache')
+
+        for backend in ('tree', 'flat'):
+            no_cache = run_slang(filename, '--backend', backend, '--no-cache')
+            shutil.rmtree(cache_dir, ignore_errors=True)
+            cold = run_slang(filename, '--backend', backend, '--cache-dir', cache_dir)
+            warm = min(run_slang(filename, '--backend', backend, '--cache-dir', cache_dir) for _ in range(3))
+            print(f"{backend:<6} 不用缓存 {no_cache:>6.2f}s  冷启动 {cold:>6.2f}s  热启动 {warm:>6.2f}s"
+                  f"  ({no_cache / warm:.1f}x)")
+    finally:
+        shutil.rmtree(work_dir)
+
+if __name__ == '__main__':
+    main()
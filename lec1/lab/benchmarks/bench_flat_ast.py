@@ -0,0 +1,57 @@
+import os
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'example'))
+
+from tokenizer import tokenize
+from parser import parse
+from resolver import resolve
+from interpreter import interpret
+from flat_ast import flatten, interpret_flat, view
+from bench_tokenizer import generate_source
+
+# 比较 dataclass 语法树和扁平语法树占用的内存，以及在两者上执行的耗时
+def measure_memory(build):
+    tracemalloc.start()
+    tree = build()
+    retained, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return tree, retained
+
+def best_of(runs, run):
+    best = float('inf')
+    for _ in range(runs):
+        start = time.perf_counter()
+        run()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+def main():
+    size = int(float(sys.argv[1]) * 1024 * 1024) if len(sys.argv) > 1 else 2 * 1024 * 1024
+    source = generate_source(size)
+    tokens = tokenize(source)
+    print(f"源代码大小: {len(source.encode('utf-8')) / 1024 / 1024:.1f} MB")
+
+    module, tree_bytes = measure_memory(lambda: resolve(parse(tokens)))
+    # 构建扁平语法树时临时用到的 dataclass 语法树不计入
+    flat_module, flat_bytes = measure_memory(lambda: flatten(module))
+    print(f"dataclass 语法树  占用 {tree_bytes / 1024 / 1024:>7.1f} MB")
+    print(f"扁平语法树        占用 {flat_bytes / 1024 / 1024:>7.1f} MB  "
+          f"({len(flat_module.kinds)} 个结点, {tree_bytes / flat_bytes:.1f}x)")
+
+    # 执行用 benchmarks 目录下的 fib.slang，比较遍历速度
+    with open(os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fib.slang'), encoding='utf-8') as file:
+        program = resolve(parse(tokenize(file.read())))
+    flat_program = flatten(program)
+    # 三种执行方式的结果必须一致
+    results = { interpret(program), interpret_flat(flat_program), interpret(view(flat_program)) }
+    assert len(results) == 1, results
+    for name, run in (('interpret', lambda: interpret(program)),
+                      ('interpret_flat', lambda: interpret_flat(flat_program)),
+                      ('interpret(view)', lambda: interpret(view(flat_program)))):
+        print(f"{name:<18}{best_of(3, run) * 1000:>8.0f} ms")
+
+if __name__ == '__main__':
+    main()
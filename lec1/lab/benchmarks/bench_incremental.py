@@ -0,0 +1,54 @@
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'example'))
+
+from tokenizer import tokenize_compact
+from iterative_parser import parse_iterative
+from incremental import parse_source, reparse, diff_edit
+
+# 编辑文件中间的一个函数之后，完整地重新分析和增量分析 (reparse) 的耗时
+# 增量分析只重新扫描、解析被编辑的函数，耗时基本不随文件变大而增加；
+# watch 模式还要比较新旧文件找出编辑的位置 (diff_edit)，这一步按块比较，文件很大时才明显
+FUNCTION = '''
+# 第 %d 个函数
+function f%d(n) {
+    i = 0;
+    s = 0;
+    while (i < n) {
+        if (i / 2 == 0) s = s + i * 3; else s = s - 1;
+        i = i + 1;
+    }
+    return s + g%d;
+}
+g%d = %d;
+'''
+
+def best_of(runs, run):
+    best = float('inf')
+    for _ in range(runs):
+        start = time.perf_counter()
+        result = run()
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+def main():
+    print(f"{'函数个数':<10}{'文件大小':>10}{'完整分析':>12}{'增量分析':>12}{'diff_edit':>12}")
+    for count in (100, 1000, 10000):
+        source = ''.join(FUNCTION % (i, i, i, i, i) for i in range(count))
+        parsed = parse_source(source)
+        # 把中间那个函数里的 3 改成 4
+        offset = source.index('i * 3', len(source) // 2) + 4
+        new_source = source[:offset] + '4' + source[offset + 1:]
+
+        full, module = best_of(3, lambda: parse_iterative(tokenize_compact(new_source)))
+        incremental, result = best_of(20, lambda: reparse(parsed, offset, 1, '4'))
+        diff, edit = best_of(20, lambda: diff_edit(source, new_source))
+        assert result.module == module and edit == (offset, 1, '4')
+        assert result.reparsed_items == 1
+        print(f"{count:<14}{len(source) // 1024:>8}KB{full * 1000:>12.2f}ms{incremental * 1000:>10.2f}ms"
+              f"{diff * 1000:>10.2f}ms")
+
+if __name__ == '__main__':
+    main()
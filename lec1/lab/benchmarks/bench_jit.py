@@ -0,0 +1,34 @@
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'example'))
+
+from tokenizer import tokenize
+from iterative_parser import parse_iterative
+from resolver import resolve
+from interpreter import interpret
+from tracing import TraceJIT
+
+# 比较语法树解释器在开启跟踪编译 (见 tracing.py) 前后的耗时，以及跟踪编译的统计
+def main():
+    here = os.path.dirname(os.path.abspath(__file__))
+    filenames = sys.argv[1:] or [os.path.join(here, name) for name in
+                                 ('arith_loop.slang', 'nested_loop.slang', 'continue_loop.slang', 'fib.slang')]
+    print(f"{'程序':<24}{'tree':>12}{'tree + jit':>12}{'加速':>8}")
+    for filename in filenames:
+        with open(filename, 'r', encoding='utf-8') as f:
+            module = resolve(parse_iterative(tokenize(f.read())))
+        start = time.perf_counter()
+        expected = interpret(module)
+        plain = time.perf_counter() - start
+        jit = TraceJIT()
+        start = time.perf_counter()
+        result = interpret(module, jit=jit)
+        traced = time.perf_counter() - start
+        assert result == expected, (result, expected)
+        print(f"{os.path.basename(filename):<24}{plain * 1000:>10.1f}ms{traced * 1000:>10.1f}ms{plain / traced:>7.1f}x")
+        print(f"    {jit.report()}")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,82 @@
+import io
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'example'))
+
+from tokenizer import tokenize
+from iterative_parser import parse_iterative
+from resolver import resolve
+from natives import BUILTINS, NativeFunction
+from ir_exec import compile_ir
+from sinks import BufferedSink, LineSink, NullSink, CaptureSink
+
+# 比较 print 输出到各种输出目标的耗时 (都写到 /dev/null，只测格式化和系统调用的开销)
+# 用 IR 执行器执行，解释本身的开销小，耗时主要在 print 上
+#   print(*args)  原来的实现: 每个实参和分隔符都 write 一次
+#   line          每行 write + flush 一次，和终端上一样，每行一次系统调用
+#   buffered      攒够 64KB 才写一次
+SOURCE = '''
+function main() {
+    i = 0;
+    while (i < %d) {
+        print(i, i * 2, i / 4);
+        i = i + 1;
+    }
+    return i;
+}
+'''
+
+def legacy_print(*args, output=None):
+    print(*args, file=output)
+    return 0.0
+
+# 编译时 print 链接到 legacy_print
+def compile_legacy(module):
+    saved = BUILTINS['print']
+    BUILTINS['print'] = NativeFunction('print', legacy_print, None, False, True)
+    try:
+        return compile_ir(module)
+    finally:
+        BUILTINS['print'] = saved
+
+def best_of(runs, run):
+    best = float('inf')
+    for _ in range(runs):
+        start = time.perf_counter()
+        run()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+def main():
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+    module = resolve(parse_iterative(tokenize(SOURCE % n)))
+    legacy, current = compile_legacy(module), compile_ir(module)
+    # 输出和原来的 print(*args) 逐字节相同
+    expected, capture = io.StringIO(), CaptureSink()
+    legacy(expected)
+    current(capture)
+    assert capture.getvalue() == expected.getvalue()
+
+    with open(os.devnull, 'w') as devnull:
+        def run(compiled, sink):
+            def run():
+                compiled(sink)
+                sink.flush()
+            return run
+
+        runs = (('print(*args) + 文件', run(legacy, devnull)),
+                ('print(*args) + 每行 flush', run(legacy, LineSink(devnull))),
+                ('文件', run(current, devnull)),
+                ('line', run(current, LineSink(devnull))),
+                ('buffered', run(current, BufferedSink(devnull))),
+                ('null', run(current, NullSink())))
+        baseline = None
+        for name, work in runs:
+            elapsed = best_of(5, work)
+            baseline = baseline or elapsed
+            print(f"{name:<24}{elapsed * 1000:>10.1f}ms{baseline / elapsed:>8.2f}x")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,51 @@
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'example'))
+
+from tokenizer import tokenize
+from iterative_parser import parse_iterative
+from parallel import run_many, gil_enabled
+
+# run_many() 的扩展性: 用 1 到 N 个 worker 执行同一批互相独立的程序，报告吞吐量 (程序数 / 秒)
+# 线程池和进程池分别测量；有 GIL 的 CPython 上线程池不会随核数变快
+SOURCE = '''
+seed = %d;
+function fib(n) {
+    if (n < 2) return n;
+    return fib(n - 1) + fib(n - 2);
+}
+function main() {
+    i = 0;
+    s = seed;
+    while (i < 200) {
+        s = s + i * 2 - 1;
+        if (i == 100) print(s);
+        i = i + 1;
+    }
+    return s + fib(12);
+}
+'''
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 400
+    max_workers = int(sys.argv[2]) if len(sys.argv) > 2 else (os.cpu_count() or 1)
+    modules = [parse_iterative(tokenize(SOURCE % i)) for i in range(count)]
+    expected = [result.value for result in run_many(modules, workers=1, executor='thread')]
+    print(f"Python {sys.version.split()[0]}，GIL {'开启' if gil_enabled() else '关闭'}，{count} 个程序")
+
+    workers_list = sorted({1, 2, 4, 8, 16, 32, 64, max_workers} & set(range(1, max_workers + 1)))
+    print(f"{'worker 数':<12}" + ''.join(f"{name + ' (程序/秒)':>20}" for name in ('thread', 'process')))
+    for workers in workers_list:
+        row = f"{workers:<12}"
+        for executor in ('thread', 'process'):
+            start = time.perf_counter()
+            results = run_many(modules, workers=workers, executor=executor)
+            elapsed = time.perf_counter() - start
+            assert [result.value for result in results] == expected
+            row += f"{count / elapsed:>20.1f}"
+        print(row)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,60 @@
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'example'))
+
+from tokenizer import tokenize
+from parser import parse
+from interpreter import interpret
+import compiler
+import vm
+
+# 比较语法树解释器 (用 Python 的调用栈执行 slang 的函数调用) 和字节码虚拟机 (显式的调用栈) 的递归能力
+#   sum        普通递归，深度为 n
+#   countdown  尾递归，虚拟机复用栈帧，深度始终为 1
+#   fib        调用很多但深度很浅，看调用本身的开销
+SOURCE = '''
+function sum(n) {
+    if (n == 0) return 0;
+    return n + sum(n - 1);
+}
+function countdown(n, acc) {
+    if (n == 0) return acc;
+    return countdown(n - 1, acc + n);
+}
+function fib(n) {
+    if (n < 2) return n;
+    return fib(n - 1) + fib(n - 2);
+}
+function main() {
+    return %s;
+}
+'''
+
+def run_tree(call):
+    return interpret(parse(tokenize(SOURCE % call)))
+
+def run_vm(call):
+    return vm.run(compiler.compile_module(parse(tokenize(SOURCE % call))), max_depth=10 ** 7)
+
+def measure(run, call):
+    start = time.perf_counter()
+    try:
+        result = f"{run(call):.0f}"
+    except RecursionError:
+        result = 'RecursionError'
+    return result, time.perf_counter() - start
+
+def main():
+    calls = ['sum(500)', 'sum(50000)', 'sum(200000)', 'countdown(200000, 0)', 'fib(22)']
+    print(f"{'程序':<24}{'语法树解释器':>28}{'字节码虚拟机':>28}")
+    for call in calls:
+        cells = []
+        for run in (run_tree, run_vm):
+            result, seconds = measure(run, call)
+            cells.append(f"{result} ({seconds * 1000:.0f}ms)")
+        print(f"{call:<24}{cells[0]:>28}{cells[1]:>28}")
+
+if __name__ == '__main__':
+    main()
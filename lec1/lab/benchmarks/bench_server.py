@@ -0,0 +1,101 @@
+import json
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+SLANG = os.path.join(HERE, '..', 'example', 'slang.py')
+
+# 比较每次调用的延迟: 常驻服务 (slang.py --serve) 中调用一个已经载入的函数，和每次启动新的 slang.py 进程
+# 新进程分别测有编译缓存和没有编译缓存 (--no-cache) 两种情况
+SOURCE = '''
+scale = 3;
+function f(x) {
+    i = 0;
+    s = 0;
+    while (i < 10) {
+        s = s + x * scale + i;
+        i = i + 1;
+    }
+    return s;
+}
+function main() {
+    return f(7);
+}
+'''
+
+def percentile(samples: list[float], p: int) -> float:
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, len(ordered) * p // 100)]
+
+def report(name: str, samples: list[float]):
+    print(f"{name:<28}{percentile(samples, 50) * 1000:>10.3f}ms{percentile(samples, 95) * 1000:>10.3f}ms")
+
+def main():
+    calls = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    processes = int(sys.argv[2]) if len(sys.argv) > 2 else 20
+    with tempfile.TemporaryDirectory() as directory:
+        filename = os.path.join(directory, 'program.slang')
+        with open(filename, 'w', encoding='utf-8') as f:
+            f.write(SOURCE)
+        env = dict(os.environ, SLANG_CACHE_DIR=os.path.join(directory, 'cache'))
+
+        print(f"{'方式':<28}{'中位数':>12}{'p95':>12}")
+        for name, extra in (('新进程 (无编译缓存)', ['--no-cache']), ('新进程 (编译缓存命中)', [])):
+            samples = []
+            for _ in range(processes):
+                start = time.perf_counter()
+                subprocess.run([sys.executable, SLANG, filename] + extra, env=env, check=True, capture_output=True)
+                samples.append(time.perf_counter() - start)
+            report(name, samples)
+
+        # 标准输入输出
+        server = subprocess.Popen([sys.executable, SLANG, '--serve'], env=env, text=True,
+                                  stdin=subprocess.PIPE, stdout=subprocess.PIPE)
+        def request(message: dict) -> dict:
+            server.stdin.write(json.dumps(message) + '\n')
+            server.stdin.flush()
+            return json.loads(server.stdout.readline())
+        assert request({'op': 'load', 'module': 'p', 'path': filename})['ok']
+        samples = []
+        for i in range(calls):
+            start = time.perf_counter()
+            reply = request({'op': 'call', 'module': 'p', 'function': 'f', 'args': [i]})
+            samples.append(time.perf_counter() - start)
+            assert reply['ok'], reply
+        report('常驻服务 (标准输入输出)', samples)
+        server.stdin.close()
+        server.wait()
+
+        # Unix 套接字
+        if hasattr(socket, 'AF_UNIX'):
+            path = os.path.join(directory, 'slang.sock')
+            server = subprocess.Popen([sys.executable, SLANG, '--serve', '--socket', path], env=env,
+                                      stderr=subprocess.DEVNULL)
+            try:
+                while not os.path.exists(path):
+                    time.sleep(0.01)
+                with socket.socket(socket.AF_UNIX) as connection:
+                    connection.connect(path)
+                    stream = connection.makefile('rw', encoding='utf-8')
+                    def request(message: dict) -> dict:
+                        stream.write(json.dumps(message) + '\n')
+                        stream.flush()
+                        return json.loads(stream.readline())
+                    assert request({'op': 'load', 'module': 'p', 'path': filename})['ok']
+                    samples = []
+                    for i in range(calls):
+                        start = time.perf_counter()
+                        reply = request({'op': 'call', 'module': 'p', 'function': 'f', 'args': [i]})
+                        samples.append(time.perf_counter() - start)
+                        assert reply['ok'], reply
+                    report('常驻服务 (Unix 套接字)', samples)
+            finally:
+                server.terminate()
+                server.wait()
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,32 @@
+import os
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'example'))
+
+from tokenizer import tokenize, tokenize_compact
+from parser import parse
+from bench_tokenizer import generate_source
+
+# 用 tracemalloc 比较 Token 列表和紧凑词元表占用的内存，以及从两者解析的耗时
+def main():
+    size = int(float(sys.argv[1]) * 1024 * 1024) if len(sys.argv) > 1 else 4 * 1024 * 1024
+    source = generate_source(size)
+    print(f"源代码大小: {len(source.encode('utf-8')) / 1024 / 1024:.1f} MB")
+
+    for name, scan in (('tokenize', tokenize), ('tokenize_compact', tokenize_compact)):
+        tracemalloc.start()
+        tokens = scan(source)
+        retained, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+        start = time.perf_counter()
+        parse(tokens)
+        elapsed = time.perf_counter() - start
+        print(f"{name:<18}{len(tokens):>10} 个词元  占用 {retained / 1024 / 1024:>7.1f} MB"
+              f"  峰值 {peak / 1024 / 1024:>7.1f} MB  解析 {elapsed:.2f}s")
+        del tokens
+
+if __name__ == '__main__':
+    main()
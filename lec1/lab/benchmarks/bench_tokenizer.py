@@ -0,0 +1,52 @@
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'example'))
+
+from tokenizer import tokenize, tokenize_simple, iter_tokens_from_file
+
+# 把 example.slang 重复多次 (函数改名避免重复)，生成指定大小的源代码
+def generate_source(size: int) -> str:
+    here = os.path.dirname(os.path.abspath(__file__))
+    with open(os.path.join(here, '..', 'example', 'example.slang'), 'r', encoding='utf-8') as f:
+        template = f.read()
+    parts: list[str] = []
+    total = 0
+    index = 0
+    while total < size:
+        part = template.replace('foo', f'foo{index}').replace('bar', f'bar{index}') \
+            .replace('noArg', f'noArg{index}').replace('main', f'main{index}')
+        parts.append(part)
+        total += len(part)
+        index += 1
+    return ''.join(parts)
+
+# 比较逐字符扫描和正则扫描的吞吐量 (MB/s)
+def main():
+    size = int(float(sys.argv[1]) * 1024 * 1024) if len(sys.argv) > 1 else 4 * 1024 * 1024
+    source = generate_source(size)
+    megabytes = len(source.encode('utf-8')) / 1024 / 1024
+
+    with tempfile.NamedTemporaryFile('w', encoding='utf-8', suffix='.slang', delete=False) as f:
+        f.write(source)
+        filename = f.name
+
+    try:
+        cases = {
+            'tokenize_simple': lambda: tokenize_simple(source),
+            'tokenize': lambda: tokenize(source),
+            'iter_tokens_from_file': lambda: sum(1 for _ in iter_tokens_from_file(filename)),
+        }
+        print(f"源代码大小: {megabytes:.1f} MB")
+        for name, case in cases.items():
+            start = time.perf_counter()
+            case()
+            elapsed = time.perf_counter() - start
+            print(f"{name:<24}{elapsed:>8.2f}s{megabytes / elapsed:>10.2f} MB/s")
+    finally:
+        os.remove(filename)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,54 @@
+import os
+import sys
+import time
+
+# 基准测试脚本放在 example 目录之外，需要手动把 example 加进模块搜索路径
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'example'))
+
+from tokenizer import tokenize
+from parser import parse
+from interpreter import interpret
+from flat_ast import flatten, interpret_flat, view
+import closure
+import transpiler
+import compiler
+import vm
+import ir_exec
+
+BACKENDS = {
+    'tree': interpret,
+    'flat': lambda module: interpret_flat(flatten(module)),
+    # 树遍历解释器在扁平语法树的视图上执行，和 tree 比较可以发现视图和语法树不一致的地方
+    'view': lambda module: interpret(view(flatten(module))),
+    'closure': lambda module: closure.compile_module(module)(),
+    'vm': lambda module: vm.run(compiler.compile_module(module)),
+    'py': lambda module: transpiler.compile_module(module).run(),
+    'ir': ir_exec.run_ir,
+}
+
+# 比较各个执行后端在同一程序上的耗时 (包含编译时间，不含词法和语法分析)
+def main():
+    here = os.path.dirname(os.path.abspath(__file__))
+    filenames = sys.argv[1:] or sorted(
+        os.path.join(here, name) for name in os.listdir(here) if name.endswith('.slang'))
+    repeat = 3
+
+    print(f"{'程序':<20}" + ''.join(f"{name:>12}" for name in BACKENDS))
+    for filename in filenames:
+        with open(filename, 'r', encoding='utf-8') as f:
+            module = parse(tokenize(f.read()))
+        timings: list[str] = []
+        results: set[float] = set()
+        for backend in BACKENDS.values():
+            best = float('inf')
+            for _ in range(repeat):
+                start = time.perf_counter()
+                results.add(backend(module))
+                best = min(best, time.perf_counter() - start)
+            timings.append(f"{best * 1000:>10.1f}ms")
+        # 所有后端的结果必须一致
+        assert len(results) == 1, results
+        print(f"{os.path.basename(filename):<20}" + ''.join(timings))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,204 @@
+import argparse
+import contextlib
+import json
+import os
+import platform
+import statistics
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'example'))
+
+from tokenizer import tokenize
+from iterative_parser import parse_iterative
+from resolver import resolve
+from interpreter import interpret
+from bench_tokenizer import generate_source
+
+# 基准测试套件: 对每个工作负载分别测量词法分析、语法分析 (含作用域解析) 和解释执行三个阶段
+#
+#   python suite.py                          运行全部工作负载，打印结果
+#   python suite.py -o result.json           同时把结果写成 JSON
+#   python suite.py --baseline base.json     和之前保存的结果比较，中位数变慢超过阈值的记为性能回退
+#
+# 每个阶段先预热 warmup 次，再计时 repeat 次，报告中位数、p95、最小值和平均值。
+# 峰值内存用 tracemalloc 另外单独跑一次测量，不影响计时。
+# 有性能回退时退出码为 1，可以直接放进 CI。
+
+FORMAT_VERSION = 1
+PHASES = ('tokenize', 'parse', 'interpret')
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+def read_file(name: str) -> str:
+    with open(os.path.join(HERE, name), 'r', encoding='utf-8') as f:
+        return f.read()
+
+# 一个很长的表达式: terms 项相加，每项是一个小的乘除运算
+# 解析出来的语法树是左嵌套的，项数太多时树遍历解释器会超出递归深度，所以写成多条语句
+def generate_expressions(statements: int, terms: int) -> str:
+    lines = ['function main() {', '    x = 1.5;', '    total = 0;']
+    for i in range(statements):
+        expr = ' + '.join(f'(x * {j % 7 + 1} - {i % 5} / {j % 3 + 1})' for j in range(terms))
+        lines.append(f'    total = total + {expr};')
+    lines += ['    return total;', '}', '']
+    return '\n'.join(lines)
+
+# 工作负载: 名字 -> 生成源代码的函数 (大的源代码用到时才生成)
+WORKLOADS = {
+    'arith_loop': lambda: read_file('arith_loop.slang'),
+    'nested_loop': lambda: read_file('nested_loop.slang'),
+    'continue_loop': lambda: read_file('continue_loop.slang'),
+    'fib': lambda: read_file('fib.slang'),
+    'deep_recursion': lambda: read_file('deep_recursion.slang'),
+    'huge_expressions': lambda: generate_expressions(100, 200),
+    'large_source_2mb': lambda: generate_source(2 * 1024 * 1024),
+}
+
+# print 的输出丢掉，不计入测量
+def run_quietly(run):
+    with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+        return run()
+
+def summarize(samples: list[float]) -> dict[str, float]:
+    ordered = sorted(samples)
+    # p95 取排序后第 ceil(0.95 n) 个样本
+    p95 = ordered[max(0, -(-len(ordered) * 95 // 100) - 1)]
+    return {
+        'median': statistics.median(ordered),
+        'p95': p95,
+        'min': ordered[0],
+        'mean': statistics.fmean(ordered),
+    }
+
+def measure(run, warmup: int, repeat: int) -> dict[str, float]:
+    for _ in range(warmup):
+        run()
+    samples: list[float] = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        run()
+        samples.append(time.perf_counter() - start)
+    result = summarize(samples)
+    result['runs'] = repeat
+
+    tracemalloc.start()
+    try:
+        run()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    result['peak_memory'] = peak
+    return result
+
+def run_workload(source: str, warmup: int, repeat: int) -> dict[str, dict[str, float]]:
+    tokens = tokenize(source)
+    module = resolve(parse_iterative(tokens))
+    return {
+        'tokenize': measure(lambda: tokenize(source), warmup, repeat),
+        'parse': measure(lambda: resolve(parse_iterative(tokens)), warmup, repeat),
+        'interpret': measure(lambda: run_quietly(lambda: interpret(module)), warmup, repeat),
+    }
+
+def environment() -> dict[str, str]:
+    return {
+        'python': platform.python_version(),
+        'implementation': platform.python_implementation(),
+        'machine': platform.machine(),
+        'system': platform.system(),
+    }
+
+# 比较中位数，返回 (工作负载, 阶段, 基准值, 当前值, 变化比例, 是否回退) 的列表
+# 太快的阶段 (基准和当前都小于 min_time 秒) 噪声太大，不算回退
+def compare(current: dict, baseline: dict, threshold: float, min_time: float = 1e-3) -> list[tuple]:
+    rows = []
+    for name, phases in current['workloads'].items():
+        if name not in baseline.get('workloads', {}):
+            continue
+        for phase, result in phases.items():
+            old = baseline['workloads'][name].get(phase)
+            if old is None:
+                continue
+            before, after = old['median'], result['median']
+            change = after / before - 1 if before > 0 else 0.0
+            regressed = change > threshold and max(before, after) >= min_time
+            rows.append((name, phase, before, after, change, regressed))
+    return rows
+
+def format_time(seconds: float) -> str:
+    if seconds < 1e-3:
+        return f"{seconds * 1e6:.1f}us"
+    if seconds < 1:
+        return f"{seconds * 1e3:.1f}ms"
+    return f"{seconds:.2f}s"
+
+def format_memory(size: int) -> str:
+    if size < 1024 * 1024:
+        return f"{size / 1024:.1f}KB"
+    return f"{size / 1024 / 1024:.1f}MB"
+
+def main():
+    arg_parser = argparse.ArgumentParser(description="slang 基准测试套件")
+    arg_parser.add_argument('-k', '--filter', action='append', default=[],
+                            help="只运行名字包含该字符串的工作负载，可以指定多次")
+    arg_parser.add_argument('--warmup', type=int, default=1, help="每个阶段预热的次数 (默认 1)")
+    arg_parser.add_argument('--repeat', type=int, default=5, help="每个阶段计时的次数 (默认 5)")
+    arg_parser.add_argument('-o', '--output', metavar='FILE', help="把结果写成 JSON")
+    arg_parser.add_argument('--baseline', metavar='FILE', help="和之前保存的 JSON 结果比较")
+    arg_parser.add_argument('--threshold', type=float, default=0.10,
+                            help="中位数变慢超过这个比例记为性能回退 (默认 0.10，即 10%%)")
+    arg_parser.add_argument('--list', action='store_true', help="只列出所有工作负载")
+    args = arg_parser.parse_args()
+    if args.repeat <= 0 or args.warmup < 0:
+        arg_parser.error("--repeat 必须是正数，--warmup 不能是负数")
+
+    names = [name for name in WORKLOADS if not args.filter or any(f in name for f in args.filter)]
+    if args.list:
+        print('\n'.join(names))
+        return
+    # 深递归的工作负载需要比默认值更深的 Python 调用栈
+    sys.setrecursionlimit(max(sys.getrecursionlimit(), 100000))
+
+    results: dict[str, dict] = {}
+    print(f"{'工作负载':<20}{'阶段':<12}{'中位数':>10}{'p95':>10}{'最小值':>10}{'峰值内存':>12}")
+    for name in names:
+        source = WORKLOADS[name]()
+        results[name] = run_workload(source, args.warmup, args.repeat)
+        for phase in PHASES:
+            r = results[name][phase]
+            print(f"{name:<20}{phase:<12}{format_time(r['median']):>10}{format_time(r['p95']):>10}"
+                  f"{format_time(r['min']):>10}{format_memory(r['peak_memory']):>12}")
+
+    report = {
+        'format_version': FORMAT_VERSION,
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+        'environment': environment(),
+        'warmup': args.warmup,
+        'repeat': args.repeat,
+        'workloads': results,
+    }
+    if args.output is not None:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2, ensure_ascii=False)
+            f.write('\n')
+
+    if args.baseline is not None:
+        with open(args.baseline, 'r', encoding='utf-8') as f:
+            baseline = json.load(f)
+        if baseline.get('environment') != report['environment']:
+            print("注意: 基准结果是在不同的环境中测得的", file=sys.stderr)
+        rows = compare(report, baseline, args.threshold)
+        print()
+        print(f"{'工作负载':<20}{'阶段':<12}{'基准':>10}{'当前':>10}{'变化':>10}")
+        for name, phase, before, after, change, regressed in rows:
+            mark = '  <- 回退' if regressed else ''
+            print(f"{name:<20}{phase:<12}{format_time(before):>10}{format_time(after):>10}{change:>+9.1%}{mark}")
+        regressions = sum(1 for row in rows if row[-1])
+        if regressions:
+            print(f"\n{regressions} 项性能回退超过 {args.threshold:.0%}")
+            sys.exit(1)
+        print(f"\n没有超过 {args.threshold:.0%} 的性能回退")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,277 @@
+from parser import *
+from resolver import resolve
+from natives import NativeFunction
+import transpiler
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+# 批量执行: 用同一个函数处理很多行输入，每个实参是一个数组，每一行 (lane) 是一次独立的调用
+#
+# 函数体按 SIMD 的方式执行: 局部变量是数组，运算是 NumPy 的数组运算，
+# if / while 用掩码 (mask) 记录哪些 lane 在执行这条语句，while 一直循环到所有 lane 都退出循环为止。
+# 函数调用只传入需要调用的 lane，所以递归也可以向量化。
+#
+# 结果必须和逐行调用完全一样，做不到向量化的 lane 退回逐行执行 (scalar):
+#   - 执行到内置函数 (比如 print) 的 lane: 输出的顺序必须和逐行执行一致
+#   - 除数为 0、读取没有赋值的变量、循环外的 break / continue:
+#     这些 lane 逐行执行时会报错，交给逐行执行去报同样的错误
+# 调用不存在的函数、实参个数不对在翻译 (链接) 时就会报错，不会执行到。
+# 在遇到这些情况之前函数只读写局部变量，没有副作用，所以退回的 lane 可以从头重新执行。
+# 向量化的 lane 不会 print，因此最终的输出就是退回的 lane 按行号顺序输出的内容。
+#
+# 函数 (或者它调用的函数) 给全局变量赋值时，后面的行会读到前面的行写入的值，
+# 这种函数整个按行执行。
+#
+# 逐行执行用 transpiler.py 翻译成的 Python 函数，全局变量只在开始时初始化一次。
+# NumPy 是可选的依赖，只有 interpret_batch() 需要它。
+
+# 对 module 中的 func_name 函数批量求值，arrays 中的每个数组对应一个形参，形状不同时按 NumPy 的规则广播
+# 返回和输入形状相同的 float64 数组
+def interpret_batch(module: ModuleNode, func_name: str, *arrays) -> 'np.ndarray':
+    if np is None:
+        raise ImportError("interpret_batch() requires NumPy")
+    resolve(module)
+
+    function_map: dict[str, FunctionNode] = {}
+    for function in module.functions:
+        function_map[function.name] = function
+    if func_name not in function_map:
+        raise KeyError(func_name)
+    function = function_map[func_name]
+    if len(function.parameters) != len(arrays):
+        raise ValueError(f"Function {func_name} takes {len(function.parameters)} arguments, got {len(arrays)}")
+
+    columns = np.broadcast_arrays(*[np.asarray(array, dtype=np.float64) for array in arrays])
+    shape = columns[0].shape if columns else ()
+    columns = [column.ravel() for column in columns]
+    rows = columns[0].size if columns else 1
+
+    # 逐行执行用的函数，也用来初始化全局变量
+    py_module = transpiler.compile_module(module)
+    py_module.init()
+    scalar_function = py_module.FUNCTIONS[func_name]
+    def run_scalar(lanes) -> list[float]:
+        return [scalar_function(*[float(column[lane]) for column in columns]) for lane in lanes]
+
+    if writes_globals(function):
+        return np.array(run_scalar(range(rows)), dtype=np.float64).reshape(shape)
+
+    # 向量化执行时全局变量只读，直接用初始化之后的值，还没有初始化的是 None
+    global_vars = [py_module.__dict__.get(name) for name in py_module.GLOBAL_NAMES]
+
+    try:
+        with np.errstate(all='ignore'):
+            result, fallback = call_vectorized(function, columns, rows, global_vars)
+    except RecursionError:
+        # 递归太深，整个退回逐行执行
+        return np.array(run_scalar(range(rows)), dtype=np.float64).reshape(shape)
+    fallback_lanes = np.flatnonzero(fallback)
+    if fallback_lanes.size:
+        result[fallback_lanes] = run_scalar(fallback_lanes.tolist())
+    return result.reshape(shape)
+
+# 函数自己或者它 (直接或间接) 调用的函数是否给全局变量赋值
+def writes_globals(function: FunctionNode) -> bool:
+    visited: set[str] = set()
+    pending = [function]
+    while pending:
+        current = pending.pop()
+        if current.name in visited:
+            continue
+        visited.add(current.name)
+        found = False
+        def visit_expr(expr: ExpressionNode):
+            nonlocal found
+            match expr:
+                case BinaryExpr(operator='=', left=Variable()):
+                    found = found or expr.left.is_global
+                    visit_expr(expr.right)
+                case BinaryExpr():
+                    visit_expr(expr.left)
+                    visit_expr(expr.right)
+                case UnaryExpr():
+                    visit_expr(expr.operand)
+                case CallExpr():
+                    if type(expr.target) is not NativeFunction:
+                        pending.append(expr.target)
+                    for arg in expr.arguments:
+                        visit_expr(arg)
+        def visit_stat(stat: StatementNode):
+            match stat:
+                case BlockStat():
+                    for s in stat.statements:
+                        visit_stat(s)
+                case IfStat():
+                    visit_expr(stat.condition)
+                    visit_stat(stat.branch_true)
+                    if stat.branch_false is not None:
+                        visit_stat(stat.branch_false)
+                case WhileStat():
+                    visit_expr(stat.condition)
+                    visit_stat(stat.body)
+                case ExprEvalStat():
+                    visit_expr(stat.expr)
+                case ReturnStat():
+                    if stat.return_value is not None:
+                        visit_expr(stat.return_value)
+        visit_stat(current.body)
+        if found:
+            return True
+    return False
+
+# 向量化地调用一次函数，args 中每个数组有 rows 个 lane
+# 返回 (每个 lane 的返回值, 需要退回逐行执行的 lane 的掩码)
+def call_vectorized(function: FunctionNode, args: list, rows: int, global_vars: list) -> tuple:
+    # 局部变量和每个 lane 是否已经赋过值
+    local_vars = [None] * len(function.local_names)
+    assigned = [None] * len(function.local_names)
+    unassigned = np.zeros(rows, dtype=bool)
+    for slot in range(len(function.local_names)):
+        local_vars[slot] = np.zeros(rows)
+        assigned[slot] = unassigned
+    # 形参重名时以后一个为准
+    for slot, value in enumerate(args):
+        local_vars[slot] = value
+        assigned[slot] = np.ones(rows, dtype=bool)
+
+    return_value = np.zeros(rows)
+    fallback = np.zeros(rows, dtype=bool)
+    # 每层循环一项: [break 的 lane, continue 的 lane]
+    loops: list[list] = []
+
+    # 执行语句，mask 为执行这条语句的 lane，返回正常执行完这条语句的 lane
+    # 通过 return 离开的 lane 的返回值记在 return_value 中，break / continue 的 lane 记在 loops 中，
+    # 退回逐行执行的 lane 记在 fallback 中
+    def exec_stat(stat: StatementNode, mask):
+        if not mask.any():
+            return mask
+        match stat:
+            case BlockStat():
+                for s in stat.statements:
+                    mask = exec_stat(s, mask)
+                return mask
+            case IfStat():
+                condition = eval_expr(stat.condition, mask)
+                mask = mask & ~fallback
+                truth = np.not_equal(condition, 0.0)
+                done = exec_stat(stat.branch_true, mask & truth)
+                if stat.branch_false is not None:
+                    return done | exec_stat(stat.branch_false, mask & ~truth)
+                return done | (mask & ~truth)
+            case WhileStat():
+                left = np.zeros(rows, dtype=bool)
+                while mask.any():
+                    condition = eval_expr(stat.condition, mask)
+                    mask = mask & ~fallback
+                    truth = np.not_equal(condition, 0.0)
+                    left |= mask & ~truth
+                    mask = mask & truth
+                    if not mask.any():
+                        break
+                    loops.append([np.zeros(rows, dtype=bool), np.zeros(rows, dtype=bool)])
+                    mask = exec_stat(stat.body, mask)
+                    broken, continued = loops.pop()
+                    left |= broken
+                    mask = mask | continued
+                return left
+            case BreakStat() | ContinueStat():
+                if not loops:
+                    fallback[mask] = True
+                else:
+                    loops[-1][0 if isinstance(stat, BreakStat) else 1] |= mask
+                return np.zeros(rows, dtype=bool)
+            case ExprEvalStat():
+                eval_expr(stat.expr, mask)
+                return mask & ~fallback
+            case ReturnStat():
+                value = eval_expr(stat.return_value, mask) if stat.return_value is not None else 0.0
+                mask = mask & ~fallback
+                return_value[mask] = np.broadcast_to(value, rows)[mask]
+                return np.zeros(rows, dtype=bool)
+            case _:
+                raise NotImplementedError(f"Unknown statement: {stat}")
+
+    # 对 mask 中的 lane 求值，其它 lane 上的结果没有意义
+    # 返回 float (所有 lane 的值相同时) 或者数组
+    def eval_expr(expr: ExpressionNode, mask):
+        match expr:
+            case NumberConstant(value):
+                return value
+            case Variable():
+                if expr.is_global:
+                    value = global_vars[expr.slot]
+                    if value is None:
+                        fallback[mask] = True
+                        return 0.0
+                    return value
+                missing = mask & ~assigned[expr.slot]
+                if missing.any():
+                    fallback[missing] = True
+                return local_vars[expr.slot]
+            case BinaryExpr(operator='=', left=Variable()):
+                value = eval_expr(expr.right, mask)
+                var = expr.left
+                if var.is_global:
+                    # writes_globals() 已经排除了这种情况
+                    raise NotImplementedError("Global assignment in vectorized function")
+                mask = mask & ~fallback
+                local_vars[var.slot] = np.where(mask, value, local_vars[var.slot])
+                assigned[var.slot] = assigned[var.slot] | mask
+                return value
+            case BinaryExpr():
+                left = eval_expr(expr.left, mask)
+                right = eval_expr(expr.right, mask)
+                match expr.operator:
+                    case '+': return np.add(left, right)
+                    case '-': return np.subtract(left, right)
+                    case '*': return np.multiply(left, right)
+                    case '/':
+                        zero = mask & ~fallback & (np.broadcast_to(right, rows) == 0.0)
+                        if zero.any():
+                            fallback[zero] = True
+                        return np.divide(left, right)
+                    case '==': return np.equal(left, right).astype(np.float64)
+                    case '!=': return np.not_equal(left, right).astype(np.float64)
+                    case '<': return np.less(left, right).astype(np.float64)
+                    case '<=': return np.less_equal(left, right).astype(np.float64)
+                    case '>': return np.greater(left, right).astype(np.float64)
+                    case '>=': return np.greater_equal(left, right).astype(np.float64)
+                    case unexpected_op: raise NotImplementedError(f"Unknown operator: {unexpected_op}")
+            case UnaryExpr():
+                operand = eval_expr(expr.operand, mask)
+                match expr.operator:
+                    case '+': return operand
+                    case '-': return np.negative(operand)
+                    case '!': return np.equal(operand, 0.0).astype(np.float64)
+                    case unexpected_op: raise NotImplementedError(f"Unknown operator: {unexpected_op}")
+            case CallExpr():
+                return eval_call_expr(expr, mask)
+            case _:
+                raise NotImplementedError(f"Unknown expression: {expr}")
+
+    def eval_call_expr(expr: CallExpr, mask):
+        args = []
+        for arg in expr.arguments:
+            args.append(eval_expr(arg, mask))
+        mask = mask & ~fallback
+        callee = expr.target
+        # 内置函数: 这些 lane 退回逐行执行
+        if type(callee) is NativeFunction:
+            fallback[mask] = True
+            return 0.0
+        # 只把需要调用的 lane 传给被调用的函数
+        lanes = np.flatnonzero(mask)
+        result = np.zeros(rows)
+        if lanes.size:
+            sub_args = [np.broadcast_to(arg, rows)[lanes] for arg in args]
+            values, sub_fallback = call_vectorized(callee, sub_args, lanes.size, global_vars)
+            result[lanes] = values
+            fallback[lanes[sub_fallback]] = True
+        return result
+
+    exec_stat(function.body, np.ones(rows, dtype=bool))
+    # 没有 return 的 lane 返回 0.0 (return_value 初始就是 0)
+    return return_value, fallback
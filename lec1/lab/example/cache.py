@@ -0,0 +1,261 @@
+import hashlib
+import io
+import os
+import struct
+import sys
+import tempfile
+from array import array
+from typing import Iterable
+from tokenizer import iter_tokens
+from iterative_parser import parse_iterative
+from parser import ModuleNode
+from resolver import resolve
+from flat_ast import FlatModule, FlatFunction, flatten, unflatten
+from optimizer import optimize
+
+# 编译缓存: 相当于 Python 的 .pyc
+# 把解析并做完作用域解析的模块 (扁平语法树) 以紧凑的二进制格式存到缓存目录里，
+# 同一个源文件再次运行时直接读出来，完全跳过词法分析和语法分析。
+#
+# 缓存文件以 (源代码内容的哈希, 工具版本, 解析选项和启用的优化) 为键:
+#   - 源代码内容变了，哈希就变了，不会读到过期的结果
+#   - 工具版本是前端各个源文件的哈希，修改了词法分析、语法分析或者序列化格式，旧的缓存自动失效
+# 读取时校验文件头、键和内容的校验和，任何一项不符都当作没有缓存 (并删掉坏文件)
+# 缓存目录的总大小超过上限时，按最近使用时间删掉最久没用的文件 (LRU)
+#
+# 文件格式 (整数都是小端序):
+#   MAGIC  格式版本 (u16)  键 (32 字节)  内容长度 (u32)  内容的校验和 (16 字节)  内容
+#   内容由若干段组成，每段是 长度 (u32) + 数据:
+#     kinds ops xs ys zs children constants  扁平语法树的各列，直接是数组的字节
+#     strings  所有用到的名字，用 '\0' 分隔的 UTF-8
+#     meta     函数、全局变量等其余信息，整数数组，名字用 strings 中的下标表示
+
+MAGIC = b'SLGC'
+FORMAT_VERSION = 1
+HEADER = struct.Struct('<4sH32sI16s')
+SUFFIX = '.slangc'
+DEFAULT_MAX_SIZE = 64 * 1024 * 1024
+
+# 这些文件的内容决定了缓存里存的是什么
+FRONTEND_MODULES = ('tokenizer.py', 'parser.py', 'iterative_parser.py', 'resolver.py', 'optimizer.py',
+                    'flat_ast.py', 'cache.py')
+
+def default_cache_dir() -> str:
+    return os.environ.get('SLANG_CACHE_DIR') or os.path.join(os.path.expanduser('~'), '.cache', 'slang')
+
+_tool_version: bytes | None = None
+def tool_version() -> bytes:
+    global _tool_version
+    if _tool_version is None:
+        digest = hashlib.blake2b(digest_size=16)
+        here = os.path.dirname(os.path.abspath(__file__))
+        for name in FRONTEND_MODULES:
+            with open(os.path.join(here, name), 'rb') as f:
+                digest.update(f.read())
+        _tool_version = digest.digest()
+    return _tool_version
+
+def source_digest(data: bytes) -> bytes:
+    return hashlib.blake2b(data, digest_size=32).digest()
+
+def cache_key(source_hash: bytes, right_nested: bool = False, passes: Iterable[str] | None = None,
+              strict: bool = False) -> bytes:
+    digest = hashlib.blake2b(digest_size=32)
+    digest.update(source_hash)
+    digest.update(tool_version())
+    digest.update(struct.pack('<HB', FORMAT_VERSION, right_nested))
+    if passes is not None:
+        digest.update(('optimize:' + ','.join(sorted(passes))).encode('utf-8'))
+    if strict:
+        digest.update(b'strict')
+    return digest.digest()
+
+def _little_endian(data: array) -> bytes:
+    if sys.byteorder == 'big':
+        data = array(data.typecode, data)
+        data.byteswap()
+    return data.tobytes()
+
+def _from_little_endian(typecode: str, data: bytes) -> array:
+    result = array(typecode)
+    result.frombytes(data)
+    if sys.byteorder == 'big':
+        result.byteswap()
+    return result
+
+def dump_module(flat: FlatModule) -> bytes:
+    # 名字池放在最前面，这样 VARIABLE / CALL_EXPR 结点里的下标不需要改
+    strings: list[str] = list(flat.names)
+    string_index = { name: i for i, name in enumerate(strings) }
+    def intern(name: str) -> int:
+        if name not in string_index:
+            string_index[name] = len(strings)
+            strings.append(name)
+        return string_index[name]
+    def intern_list(names: list[str]) -> list[int]:
+        return [len(names)] + [intern(name) for name in names]
+
+    meta = [len(flat.names), len(flat.functions)]
+    for function in flat.functions:
+        meta.append(intern(function.name))
+        meta.append(function.body)
+        meta.extend(intern_list(function.parameters))
+        meta.extend(intern_list(function.local_names))
+    meta.append(len(flat.global_vars))
+    meta.extend(flat.global_vars)
+    meta.extend(intern_list(flat.global_names))
+    meta.extend(intern_list(flat.local_names))
+
+    sections = [
+        flat.kinds.tobytes(),
+        flat.ops.tobytes(),
+        _little_endian(flat.xs),
+        _little_endian(flat.ys),
+        _little_endian(flat.zs),
+        _little_endian(flat.children),
+        _little_endian(array('d', flat.constants)),
+        '\0'.join(strings).encode('utf-8'),
+        _little_endian(array('i', meta)),
+    ]
+    return b''.join(struct.pack('<I', len(section)) + section for section in sections)
+
+def load_module(payload: bytes) -> FlatModule:
+    sections: list[bytes] = []
+    offset = 0
+    while offset < len(payload):
+        (length,) = struct.unpack_from('<I', payload, offset)
+        offset += 4
+        sections.append(payload[offset:offset + length])
+        offset += length
+    if len(sections) != 9 or offset != len(payload):
+        raise ValueError("Malformed cache payload")
+    kinds, ops, xs, ys, zs, children, constants, strings, meta = sections
+
+    flat = FlatModule()
+    flat.kinds.frombytes(kinds)
+    flat.ops.frombytes(ops)
+    flat.xs = _from_little_endian('i', xs)
+    flat.ys = _from_little_endian('i', ys)
+    flat.zs = _from_little_endian('i', zs)
+    flat.children = _from_little_endian('i', children)
+    flat.constants = _from_little_endian('d', constants).tolist()
+    names = strings.decode('utf-8').split('\0') if strings else []
+    values = iter(_from_little_endian('i', meta).tolist())
+
+    def read_list() -> list[str]:
+        return [names[next(values)] for _ in range(next(values))]
+
+    flat.names = names[:next(values)]
+    for _ in range(next(values)):
+        name = names[next(values)]
+        body = next(values)
+        parameters = read_list()
+        local_names = read_list()
+        flat.functions.append(FlatFunction(name, parameters, body, local_names))
+    flat.global_vars = [next(values) for _ in range(next(values))]
+    flat.global_names = read_list()
+    flat.local_names = read_list()
+    return flat
+
+def _cache_path(cache_dir: str, key: bytes) -> str:
+    return os.path.join(cache_dir, key.hex() + SUFFIX)
+
+# 读取缓存，没有或者校验失败时返回 None
+def load_cached(cache_dir: str, key: bytes) -> FlatModule | None:
+    path = _cache_path(cache_dir, key)
+    try:
+        with open(path, 'rb') as f:
+            data = f.read()
+    except OSError:
+        return None
+    try:
+        magic, version, stored_key, length, checksum = HEADER.unpack_from(data)
+        payload = data[HEADER.size:]
+        if magic != MAGIC or version != FORMAT_VERSION or stored_key != key or length != len(payload):
+            raise ValueError("Cache header mismatch")
+        if hashlib.blake2b(payload, digest_size=16).digest() != checksum:
+            raise ValueError("Cache checksum mismatch")
+        flat = load_module(payload)
+    except (ValueError, IndexError, StopIteration, struct.error, UnicodeDecodeError):
+        _remove(path)
+        return None
+    # 记录最近一次使用的时间，淘汰时按它排序
+    try:
+        os.utime(path)
+    except OSError:
+        pass
+    return flat
+
+def store_cached(cache_dir: str, key: bytes, flat: FlatModule, max_size: int = DEFAULT_MAX_SIZE):
+    payload = dump_module(flat)
+    checksum = hashlib.blake2b(payload, digest_size=16).digest()
+    data = HEADER.pack(MAGIC, FORMAT_VERSION, key, len(payload), checksum) + payload
+    if len(data) > max_size:
+        return
+    os.makedirs(cache_dir, exist_ok=True)
+    # 先写临时文件再改名，同时运行的其它进程不会读到写了一半的文件
+    fd, temp_path = tempfile.mkstemp(dir=cache_dir, suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(data)
+        os.replace(temp_path, _cache_path(cache_dir, key))
+    except BaseException:
+        _remove(temp_path)
+        raise
+    evict(cache_dir, max_size)
+
+# 缓存目录超过 max_size 字节时，从最久没有使用的文件开始删
+def evict(cache_dir: str, max_size: int = DEFAULT_MAX_SIZE):
+    entries: list[tuple[float, int, str]] = []
+    total = 0
+    for entry in os.scandir(cache_dir):
+        if entry.name.endswith(SUFFIX) and entry.is_file():
+            stat = entry.stat()
+            entries.append((stat.st_mtime, stat.st_size, entry.path))
+            total += stat.st_size
+    entries.sort()
+    for _, size, path in entries:
+        if total <= max_size:
+            break
+        _remove(path)
+        total -= size
+
+def _remove(path: str):
+    try:
+        os.remove(path)
+    except OSError:
+        pass
+
+# 读入源文件并得到作用域解析过的扁平语法树，能用缓存就用缓存
+# as_tree=True 时返回普通的语法树: 没有命中时直接返回刚解析出的语法树，省掉一次还原
+# passes 不为 None 时缓存的是优化过的语法树，只有没命中、真正做了优化时才会填写 stats
+# strict 为 True 时在优化之前按 resolve(strict=True) 检查找不到的变量 (见 resolver.py)
+def compile_file(filename: str, cache_dir: str | None = None, right_nested: bool = False,
+                 max_size: int = DEFAULT_MAX_SIZE, as_tree: bool = False,
+                 passes: Iterable[str] | None = None, stats: dict[str, int] | None = None,
+                 strict: bool = False) -> FlatModule | ModuleNode:
+    if cache_dir is None:
+        cache_dir = default_cache_dir()
+    # 文件只读一次，算哈希和词法分析用的是同一份内容；
+    # 分两次读的话，中间文件被保存 (比如编辑器保存) 就会把新内容的语法树存在旧内容的键下
+    with open(filename, 'rb') as f:
+        data = f.read()
+    key = cache_key(source_digest(data), right_nested, passes, strict)
+    flat = load_cached(cache_dir, key)
+    if flat is not None:
+        return unflatten(flat) if as_tree else flat
+
+    # 和文本模式打开文件读到的内容一样: 换行符统一成 \n
+    source_code = io.TextIOWrapper(io.BytesIO(data), encoding='utf-8').read()
+    module = parse_iterative(iter_tokens(source_code), right_nested=right_nested)
+    if strict:
+        resolve(module, strict=True)
+    if passes is not None:
+        optimize(module, passes, stats)
+    flat = flatten(module)
+    try:
+        store_cached(cache_dir, key, flat, max_size)
+    except OSError:
+        # 缓存目录不可写时照常运行，只是没有缓存
+        pass
+    return module if as_tree else flat
@@ -0,0 +1,249 @@
+from typing import Callable
+from parser import *
+from resolver import resolve
+from natives import link_calls, NativeFunction
+from interpreter import BREAK, CONTINUE
+
+# 闭包编译: 把语法树的每个结点预先转换成一个 Python 闭包，之后只执行闭包
+# 结点类型的 match 和运算符的字符串比较只在编译时做一次，执行时不再重复
+# 语句闭包的返回值和 interpreter.py 中的语句一样，是完成信号 (None / BREAK / CONTINUE / 返回值)
+# 变量的槽位在编译时确定 (见 resolver.py)，执行时直接按下标读写局部变量和全局变量的列表
+
+# 调用不存在的函数、实参个数不对在编译 (链接) 时就会报错，见 natives.py
+def compile_module(module: ModuleNode) -> Callable[[], float]:
+    resolve(module)
+    link_calls(module)
+    global_vars: list[float | None] = []
+    local_vars: list[float | None] = []
+
+    function_map: dict[str, FunctionNode] = {}
+    for function in module.functions:
+        function_map[function.name] = function
+    # 编译后的函数体，先占位，全部编译完再填上，这样函数之间可以互相调用
+    compiled_bodies: dict[str, Callable] = {}
+
+    def compile_stat(stat: StatementNode, in_loop: bool) -> Callable:
+        match stat:
+            case BlockStat(): return compile_block_stat(stat, in_loop)
+            case IfStat(): return compile_if_stat(stat, in_loop)
+            case WhileStat(): return compile_while_stat(stat)
+            case BreakStat(): return compile_break_stat(stat, in_loop)
+            case ContinueStat(): return compile_continue_stat(stat, in_loop)
+            case ExprEvalStat(): return compile_expr_eval_stat(stat)
+            case ReturnStat(): return compile_return_stat(stat)
+            case _: raise NotImplementedError(f"Unknown statement: {stat}")
+
+    def compile_block_stat(stats: BlockStat, in_loop: bool) -> Callable:
+        body = tuple(compile_stat(stat, in_loop) for stat in stats.statements)
+        if len(body) == 1:
+            return body[0]
+        def exec_block():
+            for stat in body:
+                signal = stat()
+                if signal is not None:
+                    return signal
+            return None
+        return exec_block
+
+    def compile_if_stat(stat: IfStat, in_loop: bool) -> Callable:
+        condition = compile_expr(stat.condition)
+        branch_true = compile_stat(stat.branch_true, in_loop)
+        if stat.branch_false is None:
+            def exec_if():
+                if condition():
+                    return branch_true()
+                return None
+            return exec_if
+        branch_false = compile_stat(stat.branch_false, in_loop)
+        def exec_if_else():
+            if condition():
+                return branch_true()
+            return branch_false()
+        return exec_if_else
+
+    def compile_while_stat(stat: WhileStat) -> Callable:
+        condition = compile_expr(stat.condition)
+        body = compile_stat(stat.body, True)
+        def exec_while():
+            while condition():
+                signal = body()
+                if signal is not None:
+                    if signal is BREAK: break
+                    if signal is CONTINUE: continue
+                    return signal
+            return None
+        return exec_while
+
+    def compile_break_stat(stat: BreakStat, in_loop: bool) -> Callable:
+        # 循环外的 break 执行到时才报错，和树遍历解释器一致
+        if not in_loop:
+            def raise_outside_loop():
+                raise SyntaxError("'break' outside loop")
+            return raise_outside_loop
+        return lambda: BREAK
+
+    def compile_continue_stat(stat: ContinueStat, in_loop: bool) -> Callable:
+        # 循环外的 continue 执行到时才报错，和树遍历解释器一致
+        if not in_loop:
+            def raise_outside_loop():
+                raise SyntaxError("'continue' outside loop")
+            return raise_outside_loop
+        return lambda: CONTINUE
+
+    def compile_expr_eval_stat(stat: ExprEvalStat) -> Callable:
+        expr = compile_expr(stat.expr)
+        def exec_expr_eval():
+            expr()
+        return exec_expr_eval
+
+    def compile_return_stat(stat: ReturnStat) -> Callable:
+        if stat.return_value is None:
+            return lambda: 0.0
+        return compile_expr(stat.return_value)
+
+    def compile_expr(expr: ExpressionNode) -> Callable[[], float]:
+        match expr:
+            case NumberConstant(value): return lambda: value
+            case BinaryExpr(): return compile_binary_expr(expr)
+            case UnaryExpr(): return compile_unary_expr(expr)
+            case CallExpr(): return compile_call_expr(expr)
+            case Variable(): return compile_variable(expr)
+            case _: raise NotImplementedError(f"Unknown expression: {expr}")
+
+    # 还没有赋值的变量是 None
+    def compile_variable(var: Variable) -> Callable[[], float]:
+        name, slot, fallback_slot = var.name, var.slot, var.fallback_slot
+        if not var.is_global:
+            def get_local():
+                value = local_vars[slot]
+                if value is None: raise NameError(f"Variable not found: {name}")
+                return value
+            return get_local
+        if fallback_slot < 0:
+            def get_global():
+                value = global_vars[slot]
+                if value is None: raise NameError(f"Variable not found: {name}")
+                return value
+            return get_global
+        # 全局变量还没有初始化时读写 fallback_slot 中的局部变量
+        def get_late():
+            value = global_vars[slot]
+            if value is None: value = local_vars[fallback_slot]
+            if value is None: raise NameError(f"Variable not found: {name}")
+            return value
+        return get_late
+
+    def compile_assign(var: Variable, value: Callable[[], float]) -> Callable[[], float]:
+        slot, fallback_slot = var.slot, var.fallback_slot
+        if not var.is_global:
+            def set_local():
+                result = local_vars[slot] = value()
+                return result
+            return set_local
+        if fallback_slot < 0:
+            def set_global():
+                result = global_vars[slot] = value()
+                return result
+            return set_global
+        def set_late():
+            result = value()
+            if global_vars[slot] is not None: global_vars[slot] = result
+            else: local_vars[fallback_slot] = result
+            return result
+        return set_late
+
+    def compile_binary_expr(expr: BinaryExpr) -> Callable[[], float]:
+        # 赋值表达式
+        if expr.operator == '=' and isinstance(expr.left, Variable):
+            return compile_assign(expr.left, compile_expr(expr.right))
+        l = compile_expr(expr.left)
+        # 右操作数是常量的情况很常见 (比如 i + 1, n < 2)，单独特化省掉一次调用
+        if isinstance(expr.right, NumberConstant):
+            c = expr.right.value
+            match expr.operator:
+                case '+': return lambda: l() + c
+                case '-': return lambda: l() - c
+                case '*': return lambda: l() * c
+                case '/': return lambda: l() / c
+                case '==': return lambda: 1.0 if l() == c else 0.0
+                case '!=': return lambda: 1.0 if l() != c else 0.0
+                case '<': return lambda: 1.0 if l() < c else 0.0
+                case '<=': return lambda: 1.0 if l() <= c else 0.0
+                case '>': return lambda: 1.0 if l() > c else 0.0
+                case '>=': return lambda: 1.0 if l() >= c else 0.0
+                case unexpected_op: raise NotImplementedError(f"Unknown operator: {unexpected_op}")
+        r = compile_expr(expr.right)
+        match expr.operator:
+            case '+': return lambda: l() + r()
+            case '-': return lambda: l() - r()
+            case '*': return lambda: l() * r()
+            case '/': return lambda: l() / r()
+            case '==': return lambda: 1.0 if l() == r() else 0.0
+            case '!=': return lambda: 1.0 if l() != r() else 0.0
+            case '<': return lambda: 1.0 if l() < r() else 0.0
+            case '<=': return lambda: 1.0 if l() <= r() else 0.0
+            case '>': return lambda: 1.0 if l() > r() else 0.0
+            case '>=': return lambda: 1.0 if l() >= r() else 0.0
+            case unexpected_op: raise NotImplementedError(f"Unknown operator: {unexpected_op}")
+
+    def compile_unary_expr(expr: UnaryExpr) -> Callable[[], float]:
+        operand = compile_expr(expr.operand)
+        match expr.operator:
+            case '+': return operand
+            case '-': return lambda: -operand()
+            case '!': return lambda: 0.0 if operand() else 1.0
+            case unexpected_op: raise NotImplementedError(f"Unknown operator: {unexpected_op}")
+
+    # 被调用的函数已经在链接时确定，实参个数也检查过了
+    def compile_call_expr(expr: CallExpr) -> Callable[[], float]:
+        args = tuple(compile_expr(arg) for arg in expr.arguments)
+        target = expr.target
+
+        if type(target) is NativeFunction:
+            function = target.function
+            # 没有 output 参数，输出写到当时的 sys.stdout
+            if target.writes_output:
+                return lambda: float(function(*[arg() for arg in args], output=None))
+            return lambda: float(function(*[arg() for arg in args]))
+
+        callee = target.name
+        # 实参就是局部变量表的开头 (见 resolver.py)，其余的局部变量还没有赋值
+        unassigned = [None] * (len(target.local_names) - len(target.parameters))
+        def call_function():
+            nonlocal local_vars
+            values = [arg() for arg in args]
+            stored_vars = local_vars
+            local_vars = values + unassigned
+            try:
+                signal = compiled_bodies[callee]()
+            finally:
+                # 出错时也要恢复调用者的局部变量，嵌入的调用者捕获异常之后还可以接着用
+                local_vars = stored_vars
+            # 函数没有 return 时默认返回 0.0
+            return 0.0 if signal is None else signal
+        return call_function
+
+    # 同名函数以最后一个为准，和 interpret() 的 function_map 一致
+    for name, function in function_map.items():
+        compiled_bodies[name] = compile_stat(function.body, False)
+    global_initializers: list[Callable[[], float]] = []
+    for var in module.global_vars:
+        assert var.operator == '=' and isinstance(var.left, Variable)
+        # 解析时已经把被赋值的变量定为全局变量
+        global_initializers.append(compile_expr(var))
+    global_count, top_local_count = len(module.global_names), len(module.local_names)
+    main_call = compile_call_expr(CallExpr('main', [], function_map['main'])) if 'main' in function_map else None
+
+    def run() -> float:
+        nonlocal global_vars, local_vars
+        # 每次运行都从干净的状态开始
+        global_vars = [None] * global_count
+        local_vars = [None] * top_local_count
+        for initializer in global_initializers:
+            initializer()
+        if main_call is not None:
+            return main_call()
+        else:
+            return 0.0
+
+    return run
@@ -0,0 +1,301 @@
+from array import array
+from dataclasses import dataclass
+from parser import *
+from resolver import resolve
+from natives import link_calls, NativeFunction
+
+# 把语法树编译成字节码，交给 vm.py 中的栈式虚拟机执行
+# 每条指令固定占两格: 操作码 + 参数 (没有参数的指令参数填 0)
+# 所有指令平铺在一个整数数组里，跳转目标就是数组下标
+# 变量按作用域解析 (resolver.py) 分配的槽位访问: 每次调用的局部变量、全局变量都是按槽位下标访问的列表
+
+# 操作码
+LOAD_CONST = 0     # 压入常量池中第 arg 个常量
+LOAD_LOCAL = 1     # 读第 arg 个局部变量，还没有赋值时抛出 NameError
+STORE_LOCAL = 2    # 写第 arg 个局部变量，值留在栈顶 (赋值表达式本身有值)
+STORE_GLOBAL = 3   # 写第 arg 个全局变量，值留在栈顶
+POP = 4            # 丢弃栈顶
+JUMP = 5           # 无条件跳转到 arg
+JUMP_IF_FALSE = 6  # 弹出栈顶，为假则跳转到 arg
+CALL = 7           # 调用第 arg 个名字对应的函数，参数个数由下一条 ARGC 指令给出
+CALL_BUILTIN = 8   # 调用内置函数表中第 arg 个内置函数，同样需要 ARGC
+ARGC = 9           # 只为 CALL / CALL_BUILTIN 携带参数个数，不单独执行
+RETURN = 10        # 弹出栈顶作为返回值，回到调用者
+ADD = 11
+SUB = 12
+MUL = 13
+DIV = 14
+EQ = 15
+NE = 16
+LT = 17
+LE = 18
+GT = 19
+GE = 20
+POS = 21
+NEG = 22
+NOT = 23
+TAIL_CALL = 24     # 尾调用: 和 CALL 一样需要 ARGC，但复用当前函数的调用栈帧，被调用函数直接返回到当前函数的调用者
+RAISE = 25         # 抛出 SyntaxError，arg 为 OUTSIDE_LOOP 中的下标；循环外的 break / continue 执行到时才报错，和树遍历解释器一致
+LOAD_GLOBAL = 26   # 读第 arg 个全局变量，还没有初始化时抛出 NameError
+# 有 fallback_slot 的全局变量 (见 resolver.py): 全局变量已经初始化时读写它，否则读写下一条 FALLBACK 给出的局部变量
+LOAD_LATE = 27
+STORE_LATE = 28
+FALLBACK = 29      # 只为 LOAD_LATE / STORE_LATE 携带局部变量的槽位，不单独执行
+
+OPCODE_NAMES = [
+    'LOAD_CONST', 'LOAD_LOCAL', 'STORE_LOCAL', 'STORE_GLOBAL', 'POP',
+    'JUMP', 'JUMP_IF_FALSE', 'CALL', 'CALL_BUILTIN', 'ARGC', 'RETURN',
+    'ADD', 'SUB', 'MUL', 'DIV', 'EQ', 'NE', 'LT', 'LE', 'GT', 'GE',
+    'POS', 'NEG', 'NOT', 'TAIL_CALL', 'RAISE', 'LOAD_GLOBAL', 'LOAD_LATE', 'STORE_LATE',
+    'FALLBACK',
+]
+
+BINARY_OPCODES = {
+    '+': ADD, '-': SUB, '*': MUL, '/': DIV,
+    '==': EQ, '!=': NE, '<': LT, '<=': LE, '>': GT, '>=': GE,
+}
+
+UNARY_OPCODES = { '+': POS, '-': NEG, '!': NOT }
+
+OUTSIDE_LOOP = ["'break' outside loop", "'continue' outside loop"]
+
+@dataclass
+class CodeObject:
+    name: str
+    parameters: list[str]
+    # 局部变量表 (形参在最前面)，LOAD_LOCAL / STORE_LOCAL 的参数是这里的下标
+    local_names: list[str]
+    code: array  # array('i')，操作码和参数交替存放
+
+@dataclass
+class Program:
+    constants: list[float]
+    # 被调用的函数名，CALL / TAIL_CALL 的参数是这里的下标
+    names: list[str]
+    # 全局变量表，LOAD_GLOBAL / STORE_GLOBAL 的参数是这里的下标
+    global_names: list[str]
+    functions: list[CodeObject]
+    # 用到的内置函数 (natives.py)，CALL_BUILTIN 的参数是这里的下标
+    natives: list[NativeFunction]
+    # 模块初始化代码: 依次初始化全局变量，然后调用 main
+    entry: CodeObject
+
+# 编译前先链接，调用不存在的函数、实参个数不对在编译时就会报错 (见 natives.py)
+def compile_module(module: ModuleNode) -> Program:
+    resolve(module)
+    link_calls(module)
+    constants: list[float] = []
+    constant_index: dict[str, int] = {}
+    names: list[str] = []
+    name_index: dict[str, int] = {}
+
+    # 常量和名字都去重后放进池子，指令里只存下标
+    def add_constant(value: float) -> int:
+        # 注意 0.0 和 -0.0 作为字典键是相等的，这里用 repr 区分开
+        key = repr(value)
+        if key not in constant_index:
+            constant_index[key] = len(constants)
+            constants.append(value)
+        return constant_index[key]
+
+    def add_name(name: str) -> int:
+        if name not in name_index:
+            name_index[name] = len(names)
+            names.append(name)
+        return name_index[name]
+
+    natives: list[NativeFunction] = []
+    native_index: dict[str, int] = {}
+
+    def add_native(native: NativeFunction) -> int:
+        if native.name not in native_index:
+            native_index[native.name] = len(natives)
+            natives.append(native)
+        return native_index[native.name]
+
+    def compile_code(name: str, parameters: list[str], local_names: list[str], emit_body) -> CodeObject:
+        code = array('i')
+        # 记录当前所在循环的 continue 目标和待回填的 break 跳转
+        loops: list[tuple[int, list[int]]] = []
+
+        def emit(op: int, arg: int = 0) -> int:
+            code.append(op)
+            code.append(arg)
+            return len(code) - 2
+
+        # 回填跳转指令的目标
+        def patch(at: int, target: int) -> None:
+            code[at + 1] = target
+
+        def compile_stat(stat: StatementNode):
+            match stat:
+                case BlockStat(): compile_block_stat(stat)
+                case IfStat(): compile_if_stat(stat)
+                case WhileStat(): compile_while_stat(stat)
+                case BreakStat(): compile_break_stat(stat)
+                case ContinueStat(): compile_continue_stat(stat)
+                case ExprEvalStat(): compile_expr_eval_stat(stat)
+                case ReturnStat(): compile_return_stat(stat)
+                case _: raise NotImplementedError(f"Unknown statement: {stat}")
+
+        def compile_block_stat(stats: BlockStat):
+            for stat in stats.statements:
+                compile_stat(stat)
+
+        def compile_if_stat(stat: IfStat):
+            compile_expr(stat.condition)
+            jump_false = emit(JUMP_IF_FALSE)
+            compile_stat(stat.branch_true)
+            if stat.branch_false is not None:
+                jump_end = emit(JUMP)
+                patch(jump_false, len(code))
+                compile_stat(stat.branch_false)
+                patch(jump_end, len(code))
+            else:
+                patch(jump_false, len(code))
+
+        def compile_while_stat(stat: WhileStat):
+            start = len(code)
+            compile_expr(stat.condition)
+            jump_false = emit(JUMP_IF_FALSE)
+            loops.append((start, []))
+            compile_stat(stat.body)
+            emit(JUMP, start)
+            _, breaks = loops.pop()
+            patch(jump_false, len(code))
+            for at in breaks:
+                patch(at, len(code))
+
+        def compile_break_stat(stat: BreakStat):
+            if not loops:
+                emit(RAISE, 0)
+                return
+            loops[-1][1].append(emit(JUMP))
+
+        def compile_continue_stat(stat: ContinueStat):
+            if not loops:
+                emit(RAISE, 1)
+                return
+            emit(JUMP, loops[-1][0])
+
+        def compile_expr_eval_stat(stat: ExprEvalStat):
+            compile_expr(stat.expr)
+            emit(POP)
+
+        def compile_return_stat(stat: ReturnStat):
+            # return f(...) 是尾调用，当前函数之后没有别的事要做，不需要保留它的栈帧
+            match stat.return_value:
+                case CallExpr(callee=callee) if type(stat.return_value.target) is not NativeFunction:
+                    for arg in stat.return_value.arguments:
+                        compile_expr(arg)
+                    emit(TAIL_CALL, add_name(callee))
+                    emit(ARGC, len(stat.return_value.arguments))
+                    return
+            if stat.return_value is not None:
+                compile_expr(stat.return_value)
+            else:
+                emit(LOAD_CONST, add_constant(0.0))
+            emit(RETURN)
+
+        def compile_expr(expr: ExpressionNode):
+            match expr:
+                case NumberConstant(value): emit(LOAD_CONST, add_constant(value))
+                case BinaryExpr(): compile_binary_expr(expr)
+                case UnaryExpr(): compile_unary_expr(expr)
+                case CallExpr(): compile_call_expr(expr)
+                case Variable(): compile_variable(expr)
+                case _: raise NotImplementedError(f"Unknown expression: {expr}")
+
+        def compile_binary_expr(expr: BinaryExpr):
+            # 赋值表达式
+            if expr.operator == '=' and isinstance(expr.left, Variable):
+                compile_expr(expr.right)
+                compile_variable(expr.left, True)
+                return
+            if expr.operator not in BINARY_OPCODES:
+                raise NotImplementedError(f"Unknown operator: {expr.operator}")
+            compile_expr(expr.left)
+            compile_expr(expr.right)
+            emit(BINARY_OPCODES[expr.operator])
+
+        def compile_variable(var: Variable, store: bool = False):
+            if not var.is_global:
+                emit(STORE_LOCAL if store else LOAD_LOCAL, var.slot)
+            elif var.fallback_slot >= 0:
+                emit(STORE_LATE if store else LOAD_LATE, var.slot)
+                emit(FALLBACK, var.fallback_slot)
+            else:
+                emit(STORE_GLOBAL if store else LOAD_GLOBAL, var.slot)
+
+        def compile_unary_expr(expr: UnaryExpr):
+            if expr.operator not in UNARY_OPCODES:
+                raise NotImplementedError(f"Unknown operator: {expr.operator}")
+            compile_expr(expr.operand)
+            emit(UNARY_OPCODES[expr.operator])
+
+        def compile_call_expr(expr: CallExpr):
+            for arg in expr.arguments:
+                compile_expr(arg)
+            # 链接时已经确定调用的是内置函数还是 slang 函数 (内置函数优先)
+            if type(expr.target) is NativeFunction:
+                emit(CALL_BUILTIN, add_native(expr.target))
+            else:
+                emit(CALL, add_name(expr.callee))
+            emit(ARGC, len(expr.arguments))
+
+        emit_body(emit, compile_stat, compile_expr)
+        return CodeObject(name, parameters, local_names, code)
+
+    def compile_function(function: FunctionNode) -> CodeObject:
+        def emit_body(emit, compile_stat, compile_expr):
+            compile_stat(function.body)
+            # 函数没有 return 时默认返回 0.0
+            emit(LOAD_CONST, add_constant(0.0))
+            emit(RETURN)
+        return compile_code(function.name, function.parameters, function.local_names, emit_body)
+
+    def compile_entry() -> CodeObject:
+        def emit_body(emit, compile_stat, compile_expr):
+            for var in module.global_vars:
+                assert var.operator == '=' and isinstance(var.left, Variable)
+                # 解析时已经把被赋值的变量定为全局变量
+                compile_expr(var)
+                emit(POP)
+            if any(function.name == 'main' for function in module.functions):
+                emit(CALL, add_name('main'))
+                emit(ARGC, 0)
+            else:
+                emit(LOAD_CONST, add_constant(0.0))
+            emit(RETURN)
+        return compile_code('<module>', [], module.local_names, emit_body)
+
+    functions = [compile_function(function) for function in module.functions]
+    entry = compile_entry()
+    return Program(constants, names, module.global_names, functions, natives, entry)
+
+# 反汇编，方便调试时查看编译结果
+def disassemble(program: Program) -> str:
+    lines: list[str] = []
+    for code_object in [program.entry] + program.functions:
+        lines.append(f"{code_object.name}({', '.join(code_object.parameters)}):")
+        code = code_object.code
+        for pc in range(0, len(code), 2):
+            op, arg = code[pc], code[pc + 1]
+            if op == LOAD_CONST:
+                detail = repr(program.constants[arg])
+            elif op in (LOAD_LOCAL, STORE_LOCAL, FALLBACK):
+                detail = code_object.local_names[arg]
+            elif op in (LOAD_GLOBAL, STORE_GLOBAL, LOAD_LATE, STORE_LATE):
+                detail = program.global_names[arg]
+            elif op in (CALL, TAIL_CALL):
+                detail = program.names[arg]
+            elif op == CALL_BUILTIN:
+                detail = program.natives[arg].name
+            elif op == RAISE:
+                detail = OUTSIDE_LOOP[arg]
+            elif op in (JUMP, JUMP_IF_FALSE, ARGC):
+                detail = str(arg)
+            else:
+                detail = ''
+            lines.append(f"  {pc:>5}  {OPCODE_NAMES[op]:<14}{detail}")
+    return '\n'.join(lines)
@@ -0,0 +1,145 @@
+import asyncio
+from collections import deque
+from typing import Iterable, TextIO
+from parser import ModuleNode
+from ir_passes import IR_PASSES
+from ir_exec import compile_ir_resumable
+
+# 在 asyncio 的事件循环中执行 slang 程序，不长时间占住事件循环
+#
+# interpret() 的语法树解释器把执行状态放在 Python 的调用栈上，执行到一半没法暂停；
+# 这里用 ir_exec.py 的执行器: 它的状态都在生成器里，每执行 slice_steps 步 (一次循环或者一次调用算一步)
+# 暂停一次，把控制权交还给事件循环。执行结果 (包括输出和报错) 和 interpret() 完全一样，
+# 只有递归很深时不同: 这里的调用不占用 Python 的调用栈，超过 max_depth 层才报错 (见 ir_exec.py)。
+#
+#   await interpret_async(module, slice_steps=1000)
+#
+# 同时执行成千上万个程序时用 Scheduler: 只占一个 asyncio 任务，按轮转 (round-robin) 的顺序
+# 每个程序执行一个时间片，每个时间片之后让出事件循环。每个程序可以有自己的步数配额，可以随时取消。
+#
+# 计数只在跳转和调用时减一次局部变量，不暂停时执行速度和 run_ir() 一样。
+
+DEFAULT_SLICE_STEPS = 1000
+
+# 超过了步数配额
+class StepQuotaExceeded(RuntimeError):
+    pass
+
+# quota 为最多执行的步数 (按时间片计，最多多执行不到一个时间片)，None 表示不限制
+# output 为 print 的输出目标，默认为 sys.stdout；任务被取消时程序停在最近一次暂停的位置
+async def interpret_async(module: ModuleNode, *, slice_steps: int = DEFAULT_SLICE_STEPS, quota: int | None = None,
+                          output: TextIO | None = None, passes: Iterable[str] = IR_PASSES) -> float:
+    execution = compile_ir_resumable(module, passes)(output, slice_steps)
+    steps = 0
+    try:
+        while True:
+            try:
+                next(execution)
+            except StopIteration as stop:
+                return stop.value
+            steps += slice_steps
+            if quota is not None and steps >= quota:
+                raise StepQuotaExceeded(f"Step quota exceeded: {quota}")
+            await asyncio.sleep(0)
+    finally:
+        execution.close()
+
+# Scheduler.submit() 返回的句柄，可以 await 得到 main 的返回值
+class ScheduledRun:
+    def __init__(self, scheduler: 'Scheduler', execution, quota: int | None, future: asyncio.Future):
+        self.scheduler = scheduler
+        self.execution = execution
+        self.quota = quota
+        self.future = future
+        # 已经执行的步数 (按时间片计)
+        self.steps = 0
+
+    def __await__(self):
+        return self.future.__await__()
+
+    def done(self) -> bool:
+        return self.future.done()
+
+    # 取消执行，返回是否真的取消了 (已经结束的不能取消)
+    def cancel(self) -> bool:
+        if self.future.done():
+            return False
+        self.execution.close()
+        self.future.cancel()
+        self.scheduler.cancelled += 1
+        return True
+
+class Scheduler:
+    def __init__(self, slice_steps: int = DEFAULT_SLICE_STEPS, passes: Iterable[str] = IR_PASSES):
+        if slice_steps <= 0:
+            raise ValueError("slice_steps must be positive")
+        self.slice_steps = slice_steps
+        self.passes = list(passes)
+        self.ready: deque[ScheduledRun] = deque()
+        # 编译过的模块: id(module) -> [module, start, 还没有结束的运行个数]
+        # 同一个模块的运行还没结束时再次提交不会重新编译；最后一个运行结束时删掉这一项，不会一直占着内存。
+        # 表项中保存着模块本身，所以表项存在期间这个 id 不会被别的模块重用
+        self.compiled: dict[int, list] = {}
+        self.task: asyncio.Task | None = None
+        self.slices = 0
+        self.completed = 0
+        self.cancelled = 0
+
+    # 提交一个程序，必须在事件循环中调用；编译出错 (比如调用不存在的函数) 时返回的句柄带着这个异常
+    def submit(self, module: ModuleNode, *, quota: int | None = None, output: TextIO | None = None) -> ScheduledRun:
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        try:
+            entry = self.compiled.get(id(module))
+            if entry is None:
+                entry = [module, compile_ir_resumable(module, self.passes), 0]
+            execution = entry[1](output, self.slice_steps)
+        except Exception as e:
+            future.set_exception(e)
+            return ScheduledRun(self, iter(()), quota, future)
+        self.compiled[id(module)] = entry
+        entry[2] += 1
+        # 不管是执行完、出错、超过配额还是被取消，结束时都会调用
+        future.add_done_callback(lambda _: self.release(module))
+        run = ScheduledRun(self, execution, quota, future)
+        self.ready.append(run)
+        if self.task is None or self.task.done():
+            self.task = loop.create_task(self.drive())
+        return run
+
+    def release(self, module: ModuleNode):
+        entry = self.compiled[id(module)]
+        entry[2] -= 1
+        if entry[2] == 0:
+            del self.compiled[id(module)]
+
+    # 轮流给每个程序一个时间片，直到没有程序可以执行
+    async def drive(self):
+        ready = self.ready
+        while ready:
+            run = ready.popleft()
+            if run.future.done():
+                continue
+            self.slices += 1
+            try:
+                next(run.execution)
+            except StopIteration as stop:
+                run.future.set_result(stop.value)
+                self.completed += 1
+            except Exception as e:
+                run.future.set_exception(e)
+                self.completed += 1
+            else:
+                run.steps += self.slice_steps
+                if run.quota is not None and run.steps >= run.quota:
+                    run.execution.close()
+                    run.future.set_exception(StepQuotaExceeded(f"Step quota exceeded: {run.quota}"))
+                    self.completed += 1
+                else:
+                    ready.append(run)
+            await asyncio.sleep(0)
+
+    # 等待所有已经提交的程序结束 (或者被取消)
+    async def join(self):
+        while self.task is not None and not self.task.done():
+            await asyncio.shield(self.task)
@@ -0,0 +1,630 @@
+from array import array
+from parser import *
+from resolver import resolve
+from interpreter import BREAK, CONTINUE
+from natives import link_calls, NativeFunction
+
+# 扁平的语法树: 所有结点存放在几列数组里 (struct of arrays)，用下标互相引用
+#
+#   kinds[i]  结点种类，见下面的常量
+#   ops[i]    运算符编号，下标对应 BINARY_OPERATORS / UNARY_OPERATORS
+#   xs[i] ys[i] zs[i]  子结点下标或者常量池、名字池、children 中的下标，含义随种类不同:
+#
+#   NUMBER_CONSTANT  x = 常量池下标
+#   VARIABLE         x = 名字池下标  y = 槽位  z = 0 局部变量，1 全局变量，2 + fallback_slot 有 fallback_slot 的全局变量
+#   ASSIGN           x = 被赋值的 VARIABLE 结点  y = 值
+#   BINARY_EXPR      x = 左操作数  y = 右操作数
+#   UNARY_EXPR       x = 操作数
+#   CALL_EXPR        x = 函数名在名字池的下标  y = 实参在 children 中的起点  z = 实参个数
+#   BLOCK_STAT       y = 语句在 children 中的起点  z = 语句条数
+#   IF_STAT          x = 条件  y = 真分支  z = 假分支 (没有时为 -1)
+#   WHILE_STAT       x = 条件  y = 循环体
+#   EXPR_EVAL_STAT   x = 表达式
+#   RETURN_STAT      x = 返回值 (没有时为 -1)
+#   BREAK_STAT / CONTINUE_STAT  无
+#
+# 调用的目标 (链接的结果，见 natives.py) 不是数组能表示的数据，保存在 targets 中，以 CALL_EXPR 结点的下标为键。
+# 它不会写进缓存，执行前每次都重新链接。
+#
+# 一个结点只占 14 个字节，而一个 dataclass 结点对象就算有 __slots__ 也要占四五十字节，子结点列表、常量还是另外的对象
+
+NUMBER_CONSTANT = 0
+VARIABLE = 1
+ASSIGN = 2
+BINARY_EXPR = 3
+UNARY_EXPR = 4
+CALL_EXPR = 5
+BLOCK_STAT = 6
+IF_STAT = 7
+WHILE_STAT = 8
+BREAK_STAT = 9
+CONTINUE_STAT = 10
+EXPR_EVAL_STAT = 11
+RETURN_STAT = 12
+
+BINARY_OPERATORS = ['+', '-', '*', '/', '==', '!=', '<', '<=', '>', '>=']
+UNARY_OPERATORS = ['+', '-', '!']
+
+class FlatFunction:
+    __slots__ = ('name', 'parameters', 'body', 'local_names')
+
+    def __init__(self, name: str, parameters: list[str], body: int, local_names: list[str]):
+        self.name = name
+        self.parameters = parameters
+        self.body = body
+        self.local_names = local_names
+
+class FlatModule:
+    __slots__ = ('kinds', 'ops', 'xs', 'ys', 'zs', 'children', 'constants', 'names',
+                 'functions', 'global_vars', 'global_names', 'local_names', 'targets', 'views')
+
+    def __init__(self):
+        self.kinds = array('B')
+        self.ops = array('B')
+        self.xs = array('i')
+        self.ys = array('i')
+        self.zs = array('i')
+        # 语句块的语句、调用的实参这类变长的子结点列表，连续存放在这里
+        self.children = array('i')
+        self.constants: list[float] = []
+        self.names: list[str] = []
+        self.functions: list[FlatFunction] = []
+        # 全局变量初始化，每项都是一个 ASSIGN 结点
+        self.global_vars: list[int] = []
+        self.global_names: list[str] = []
+        self.local_names: list[str] = []
+        # CALL_EXPR 结点下标 -> 被调用的函数 (FunctionView 或者 NativeFunction)，由 link_calls() 通过视图填写
+        self.targets: dict[int, object] = {}
+        # 每个结点的视图，第一次用 view() 访问时才创建 (见下面的 view())
+        self.views: list['_NodeView | None'] | None = None
+
+    def __len__(self) -> int:
+        return len(self.kinds)
+
+    def add(self, kind: int, op: int = 0, x: int = 0, y: int = 0, z: int = 0) -> int:
+        self.kinds.append(kind)
+        self.ops.append(op)
+        self.xs.append(x)
+        self.ys.append(y)
+        self.zs.append(z)
+        if self.views is not None:
+            self.views.append(None)
+        return len(self.kinds) - 1
+
+# VARIABLE 结点的 z
+def variable_z(is_global: bool, fallback_slot: int) -> int:
+    if not is_global:
+        return 0
+    return 2 + fallback_slot if fallback_slot >= 0 else 1
+
+# 把语法树转换成扁平的形式，顺便做作用域解析
+def flatten(module: ModuleNode) -> FlatModule:
+    resolve(module)
+    flat = FlatModule()
+    constant_index: dict[str, int] = {}
+    name_index: dict[str, int] = {}
+
+    def add_constant(value: float) -> int:
+        # 0.0 和 -0.0 作为字典键是相等的，用 repr 区分开
+        key = repr(value)
+        if key not in constant_index:
+            constant_index[key] = len(flat.constants)
+            flat.constants.append(value)
+        return constant_index[key]
+
+    def add_name(name: str) -> int:
+        if name not in name_index:
+            name_index[name] = len(flat.names)
+            flat.names.append(name)
+        return name_index[name]
+
+    # 子结点先转换，再把它们的下标连续放进 children
+    def add_children(indices: list[int]) -> int:
+        start = len(flat.children)
+        flat.children.extend(indices)
+        return start
+
+    def flatten_stat(stat: StatementNode) -> int:
+        match stat:
+            case BlockStat():
+                statements = [flatten_stat(s) for s in stat.statements]
+                return flat.add(BLOCK_STAT, y=add_children(statements), z=len(statements))
+            case IfStat():
+                condition = flatten_expr(stat.condition)
+                branch_true = flatten_stat(stat.branch_true)
+                branch_false = flatten_stat(stat.branch_false) if stat.branch_false is not None else -1
+                return flat.add(IF_STAT, x=condition, y=branch_true, z=branch_false)
+            case WhileStat():
+                condition = flatten_expr(stat.condition)
+                return flat.add(WHILE_STAT, x=condition, y=flatten_stat(stat.body))
+            case BreakStat(): return flat.add(BREAK_STAT)
+            case ContinueStat(): return flat.add(CONTINUE_STAT)
+            case ExprEvalStat(): return flat.add(EXPR_EVAL_STAT, x=flatten_expr(stat.expr))
+            case ReturnStat():
+                value = flatten_expr(stat.return_value) if stat.return_value is not None else -1
+                return flat.add(RETURN_STAT, x=value)
+            case _: raise NotImplementedError(f"Unknown statement: {stat}")
+
+    def flatten_expr(expr: ExpressionNode) -> int:
+        match expr:
+            case NumberConstant(value):
+                return flat.add(NUMBER_CONSTANT, x=add_constant(value))
+            case Variable():
+                return flat.add(VARIABLE, x=add_name(expr.name), y=expr.slot, z=variable_z(expr.is_global, expr.fallback_slot))
+            case BinaryExpr(operator='=', left=Variable()):
+                target = flatten_expr(expr.left)
+                return flat.add(ASSIGN, x=target, y=flatten_expr(expr.right))
+            case BinaryExpr():
+                if expr.operator not in BINARY_OPERATORS:
+                    raise NotImplementedError(f"Unknown operator: {expr.operator}")
+                left = flatten_expr(expr.left)
+                right = flatten_expr(expr.right)
+                return flat.add(BINARY_EXPR, BINARY_OPERATORS.index(expr.operator), left, right)
+            case UnaryExpr():
+                if expr.operator not in UNARY_OPERATORS:
+                    raise NotImplementedError(f"Unknown operator: {expr.operator}")
+                operand = flatten_expr(expr.operand)
+                return flat.add(UNARY_EXPR, UNARY_OPERATORS.index(expr.operator), operand)
+            case CallExpr():
+                args = [flatten_expr(arg) for arg in expr.arguments]
+                return flat.add(CALL_EXPR, x=add_name(expr.callee), y=add_children(args), z=len(args))
+            case _: raise NotImplementedError(f"Unknown expression: {expr}")
+
+    for function in module.functions:
+        body = flatten_stat(function.body)
+        flat.functions.append(FlatFunction(function.name, function.parameters, body, function.local_names))
+    for var in module.global_vars:
+        flat.global_vars.append(flatten_expr(var))
+    flat.global_names = module.global_names
+    flat.local_names = module.local_names
+    return flat
+
+# 从扁平的形式还原出普通的语法树，变量的槽位和各个函数的局部变量表都保留
+def unflatten(flat: FlatModule) -> ModuleNode:
+    kinds, ops, xs, ys, zs, children = flat.kinds, flat.ops, flat.xs, flat.ys, flat.zs, flat.children
+
+    def build_stat(i: int) -> StatementNode:
+        kind = kinds[i]
+        if kind == BLOCK_STAT:
+            start = ys[i]
+            return BlockStat([build_stat(child) for child in children[start:start + zs[i]]])
+        elif kind == IF_STAT:
+            branch_false = build_stat(zs[i]) if zs[i] >= 0 else None
+            return IfStat(build_expr(xs[i]), build_stat(ys[i]), branch_false)
+        elif kind == WHILE_STAT:
+            return WhileStat(build_expr(xs[i]), build_stat(ys[i]))
+        elif kind == BREAK_STAT:
+            return BreakStat()
+        elif kind == CONTINUE_STAT:
+            return ContinueStat()
+        elif kind == EXPR_EVAL_STAT:
+            return ExprEvalStat(build_expr(xs[i]))
+        elif kind == RETURN_STAT:
+            return ReturnStat(build_expr(xs[i]) if xs[i] >= 0 else None)
+        else:
+            raise NotImplementedError(f"Unknown statement kind: {kind}")
+
+    def build_expr(i: int) -> ExpressionNode:
+        kind = kinds[i]
+        if kind == NUMBER_CONSTANT:
+            return NumberConstant(flat.constants[xs[i]])
+        elif kind == VARIABLE:
+            var = Variable(flat.names[xs[i]])
+            var.slot, var.is_global = ys[i], bool(zs[i])
+            var.fallback_slot = zs[i] - 2 if zs[i] >= 2 else -1
+            return var
+        elif kind == ASSIGN:
+            return BinaryExpr('=', build_expr(xs[i]), build_expr(ys[i]))
+        elif kind == BINARY_EXPR:
+            return BinaryExpr(BINARY_OPERATORS[ops[i]], build_expr(xs[i]), build_expr(ys[i]))
+        elif kind == UNARY_EXPR:
+            return UnaryExpr(UNARY_OPERATORS[ops[i]], build_expr(xs[i]))
+        elif kind == CALL_EXPR:
+            start = ys[i]
+            return CallExpr(flat.names[xs[i]], [build_expr(arg) for arg in children[start:start + zs[i]]])
+        else:
+            raise NotImplementedError(f"Unknown expression kind: {kind}")
+
+    functions: list[FunctionNode] = []
+    for function in flat.functions:
+        node = FunctionNode(function.name, function.parameters, build_stat(function.body))
+        node.local_names = function.local_names
+        functions.append(node)
+    module = ModuleNode(functions, [build_expr(var) for var in flat.global_vars])
+    module.global_names = flat.global_names
+    module.local_names = flat.local_names
+    return module
+
+# 按下标遍历扁平语法树的解释器，语义和 interpret() 完全一致
+def interpret_flat(flat: FlatModule) -> float:
+    # 执行时转成 list，下标访问比 array 快 (array 每次取值都要新建整数对象)
+    kinds = flat.kinds.tolist()
+    ops = flat.ops.tolist()
+    xs = flat.xs.tolist()
+    ys = flat.ys.tolist()
+    zs = flat.zs.tolist()
+    children = flat.children.tolist()
+    constants = flat.constants
+    names = flat.names
+
+    def get_variable(i: int) -> float:
+        value = global_vars[ys[i]] if zs[i] else local_vars[ys[i]]
+        if value is None and zs[i] >= 2: value = local_vars[zs[i] - 2]
+        if value is None: raise NameError(f"Variable not found: {names[xs[i]]}")
+        return value
+
+    def call_function(function: FlatFunction, args: list[float]) -> float:
+        nonlocal local_vars
+        assert len(function.parameters) == len(args)
+
+        stored_states.append(local_vars)
+        local_vars = args + [None] * (len(function.local_names) - len(args))
+        signal = exec_stat(function.body)
+        local_vars = stored_states.pop()
+
+        if signal is None:
+            return 0.0
+        if signal is BREAK or signal is CONTINUE:
+            raise SyntaxError(f"'{signal.name.lower()}' outside loop")
+        return signal
+
+    # 按出现频率大致排序
+    def exec_stat(i: int):
+        kind = kinds[i]
+        if kind == EXPR_EVAL_STAT:
+            eval_expr(xs[i])
+            return None
+        elif kind == BLOCK_STAT:
+            start = ys[i]
+            for child in children[start:start + zs[i]]:
+                signal = exec_stat(child)
+                if signal is not None:
+                    return signal
+            return None
+        elif kind == IF_STAT:
+            if eval_expr(xs[i]):
+                return exec_stat(ys[i])
+            elif zs[i] >= 0:
+                return exec_stat(zs[i])
+            return None
+        elif kind == WHILE_STAT:
+            condition, body = xs[i], ys[i]
+            while eval_expr(condition):
+                signal = exec_stat(body)
+                if signal is not None:
+                    if signal is BREAK: break
+                    if signal is CONTINUE: continue
+                    return signal
+            return None
+        elif kind == RETURN_STAT:
+            return eval_expr(xs[i]) if xs[i] >= 0 else 0.0
+        elif kind == BREAK_STAT:
+            return BREAK
+        elif kind == CONTINUE_STAT:
+            return CONTINUE
+        else:
+            raise NotImplementedError(f"Unknown statement kind: {kind}")
+
+    def eval_expr(i: int) -> float:
+        kind = kinds[i]
+        if kind == VARIABLE:
+            return get_variable(i)
+        elif kind == NUMBER_CONSTANT:
+            return constants[xs[i]]
+        elif kind == BINARY_EXPR:
+            left = eval_expr(xs[i])
+            right = eval_expr(ys[i])
+            op = ops[i]
+            if op == 0: return left + right
+            elif op == 1: return left - right
+            elif op == 2: return left * right
+            elif op == 3: return left / right
+            elif op == 4: return float(left == right)
+            elif op == 5: return float(left != right)
+            elif op == 6: return float(left < right)
+            elif op == 7: return float(left <= right)
+            elif op == 8: return float(left > right)
+            else: return float(left >= right)
+        elif kind == ASSIGN:
+            value = eval_expr(ys[i])
+            target = xs[i]
+            z = zs[target]
+            if z == 1 or z and global_vars[ys[target]] is not None: global_vars[ys[target]] = value
+            elif z: local_vars[z - 2] = value
+            else: local_vars[ys[target]] = value
+            return value
+        elif kind == CALL_EXPR:
+            start = ys[i]
+            args = [eval_expr(arg) for arg in children[start:start + zs[i]]]
+            target = targets[i]
+            if type(target) is NativeFunction:
+                # 没有 output 参数，输出写到当时的 sys.stdout
+                if target.writes_output:
+                    return float(target.function(*args, output=None))
+                return float(target.function(*args))
+            return call_function(target, args)
+        elif kind == UNARY_EXPR:
+            operand = eval_expr(xs[i])
+            op = ops[i]
+            if op == 0: return operand
+            elif op == 1: return -operand
+            else: return float(not operand)
+        else:
+            raise NotImplementedError(f"Unknown expression kind: {kind}")
+
+    # 和 interpret() 一样用 link_calls() 链接，链接用到的视图用完就丢掉，不让它们一直占着内存
+    views = flat.views
+    link_calls(view(flat))
+    flat.views = views
+    targets: dict[int, NativeFunction | FlatFunction] = {}
+    for i, target in flat.targets.items():
+        targets[i] = target._function if isinstance(target, FunctionView) else target
+
+    function_map: dict[str, FlatFunction] = {}
+    global_vars: list[float | None] = [None] * len(flat.global_names)
+    stored_states: list[list[float | None]] = []
+    local_vars: list[float | None] = [None] * len(flat.local_names)
+
+    for function in flat.functions:
+        function_map[function.name] = function
+    for var in flat.global_vars:
+        target = xs[var]
+        global_vars[ys[target]] = eval_expr(ys[var])
+
+    if 'main' in function_map:
+        return call_function(function_map['main'], [])
+    else:
+        return 0.0
+
+# 视图: 用原来语法树类的接口访问扁平语法树，interpret() 等现有代码可以直接使用
+# 视图对象只保存 (扁平语法树, 下标)，访问属性时才去数组里读。
+# 每个结点的视图只创建一次，缓存在 flat.views 中，同一个结点每次访问都是同一个对象，
+# 以 id(结点) 为键的表 (profiler.py、tracing.py) 可以照常使用。
+# 视图和语法树的结点类都有 __slots__，没有 __dict__
+def view(flat: FlatModule) -> ModuleNode:
+    if flat.views is None:
+        flat.views = [None] * len(flat)
+    return ModuleView(flat)
+
+def _view_node(flat: FlatModule, i: int) -> SyntaxTreeNode | None:
+    if i < 0:
+        return None
+    node = flat.views[i]
+    if node is None:
+        node = flat.views[i] = _VIEW_CLASSES[flat.kinds[i]](flat, i)
+    return node
+
+# 每个视图类都要声明 __slots__: 语法树的结点类已经有 __slots__，两个基类都有非空的 __slots__ 时不能多重继承
+_VIEW_SLOTS = ('_flat', '_i')
+
+class _NodeView:
+    __slots__ = ()
+
+    def __init__(self, flat: FlatModule, i: int):
+        # 不调用 dataclass 生成的构造器，只保存两个引用
+        self._flat = flat
+        self._i = i
+
+    def __repr__(self) -> str:
+        return f"{type(self).__name__}({self._i})"
+
+class NumberConstantView(_NodeView, NumberConstant):
+    __slots__ = _VIEW_SLOTS
+
+    @property
+    def value(self) -> float:
+        return self._flat.constants[self._flat.xs[self._i]]
+
+class VariableView(_NodeView, Variable):
+    __slots__ = _VIEW_SLOTS
+
+    @property
+    def name(self) -> str:
+        return self._flat.names[self._flat.xs[self._i]]
+
+    @property
+    def slot(self) -> int:
+        return self._flat.ys[self._i]
+
+    @slot.setter
+    def slot(self, value: int) -> None:
+        self._flat.ys[self._i] = value
+
+    @property
+    def is_global(self) -> bool:
+        return bool(self._flat.zs[self._i])
+
+    @is_global.setter
+    def is_global(self, value: bool) -> None:
+        self._flat.zs[self._i] = variable_z(value, self.fallback_slot)
+
+    @property
+    def fallback_slot(self) -> int:
+        z = self._flat.zs[self._i]
+        return z - 2 if z >= 2 else -1
+
+    @fallback_slot.setter
+    def fallback_slot(self, value: int) -> None:
+        self._flat.zs[self._i] = variable_z(self.is_global, value)
+
+class AssignView(_NodeView, BinaryExpr):
+    __slots__ = _VIEW_SLOTS
+
+    operator = '='
+
+    @property
+    def left(self) -> Variable:
+        return _view_node(self._flat, self._flat.xs[self._i])
+
+    @property
+    def right(self) -> ExpressionNode:
+        return _view_node(self._flat, self._flat.ys[self._i])
+
+class BinaryExprView(_NodeView, BinaryExpr):
+    __slots__ = _VIEW_SLOTS
+
+    @property
+    def operator(self) -> str:
+        return BINARY_OPERATORS[self._flat.ops[self._i]]
+
+    @property
+    def left(self) -> ExpressionNode:
+        return _view_node(self._flat, self._flat.xs[self._i])
+
+    @property
+    def right(self) -> ExpressionNode:
+        return _view_node(self._flat, self._flat.ys[self._i])
+
+class UnaryExprView(_NodeView, UnaryExpr):
+    __slots__ = _VIEW_SLOTS
+
+    @property
+    def operator(self) -> str:
+        return UNARY_OPERATORS[self._flat.ops[self._i]]
+
+    @property
+    def operand(self) -> ExpressionNode:
+        return _view_node(self._flat, self._flat.xs[self._i])
+
+class CallExprView(_NodeView, CallExpr):
+    __slots__ = _VIEW_SLOTS
+
+    @property
+    def callee(self) -> str:
+        return self._flat.names[self._flat.xs[self._i]]
+
+    @property
+    def arguments(self) -> list[ExpressionNode]:
+        flat, start = self._flat, self._flat.ys[self._i]
+        return [_view_node(flat, child) for child in flat.children[start:start + flat.zs[self._i]]]
+
+    @property
+    def target(self) -> object:
+        return self._flat.targets.get(self._i)
+
+    @target.setter
+    def target(self, value: object) -> None:
+        self._flat.targets[self._i] = value
+
+class BlockStatView(_NodeView, BlockStat):
+    __slots__ = _VIEW_SLOTS
+
+    @property
+    def statements(self) -> list[StatementNode]:
+        flat, start = self._flat, self._flat.ys[self._i]
+        return [_view_node(flat, child) for child in flat.children[start:start + flat.zs[self._i]]]
+
+class IfStatView(_NodeView, IfStat):
+    __slots__ = _VIEW_SLOTS
+
+    @property
+    def condition(self) -> ExpressionNode:
+        return _view_node(self._flat, self._flat.xs[self._i])
+
+    @property
+    def branch_true(self) -> StatementNode:
+        return _view_node(self._flat, self._flat.ys[self._i])
+
+    @property
+    def branch_false(self) -> StatementNode | None:
+        return _view_node(self._flat, self._flat.zs[self._i])
+
+class WhileStatView(_NodeView, WhileStat):
+    __slots__ = _VIEW_SLOTS
+
+    @property
+    def condition(self) -> ExpressionNode:
+        return _view_node(self._flat, self._flat.xs[self._i])
+
+    @property
+    def body(self) -> StatementNode:
+        return _view_node(self._flat, self._flat.ys[self._i])
+
+class BreakStatView(_NodeView, BreakStat):
+    __slots__ = _VIEW_SLOTS
+
+class ContinueStatView(_NodeView, ContinueStat):
+    __slots__ = _VIEW_SLOTS
+
+class ExprEvalStatView(_NodeView, ExprEvalStat):
+    __slots__ = _VIEW_SLOTS
+
+    @property
+    def expr(self) -> ExpressionNode:
+        return _view_node(self._flat, self._flat.xs[self._i])
+
+class ReturnStatView(_NodeView, ReturnStat):
+    __slots__ = _VIEW_SLOTS
+
+    @property
+    def return_value(self) -> ExpressionNode | None:
+        return _view_node(self._flat, self._flat.xs[self._i])
+
+_VIEW_CLASSES = [
+    NumberConstantView, VariableView, AssignView, BinaryExprView, UnaryExprView, CallExprView,
+    BlockStatView, IfStatView, WhileStatView, BreakStatView, ContinueStatView, ExprEvalStatView,
+    ReturnStatView,
+]
+
+class FunctionView(FunctionNode):
+    __slots__ = ('_flat', '_function')
+
+    def __init__(self, flat: FlatModule, function: FlatFunction):
+        self._flat = flat
+        self._function = function
+
+    @property
+    def name(self) -> str:
+        return self._function.name
+
+    @property
+    def parameters(self) -> list[str]:
+        return self._function.parameters
+
+    @property
+    def body(self) -> BlockStat:
+        return _view_node(self._flat, self._function.body)
+
+    @property
+    def local_names(self) -> list[str]:
+        return self._function.local_names
+
+    @local_names.setter
+    def local_names(self, value: list[str]) -> None:
+        self._function.local_names = value
+
+    def __repr__(self) -> str:
+        return f"FunctionView({self._function.name})"
+
+class ModuleView(ModuleNode):
+    __slots__ = ('_flat',)
+
+    def __init__(self, flat: FlatModule):
+        self._flat = flat
+
+    @property
+    def functions(self) -> list[FunctionNode]:
+        return [FunctionView(self._flat, function) for function in self._flat.functions]
+
+    @property
+    def global_vars(self) -> list[BinaryExpr]:
+        return [_view_node(self._flat, var) for var in self._flat.global_vars]
+
+    @property
+    def global_names(self) -> list[str]:
+        return self._flat.global_names
+
+    @global_names.setter
+    def global_names(self, value: list[str]) -> None:
+        self._flat.global_names = value
+
+    @property
+    def local_names(self) -> list[str]:
+        return self._flat.local_names
+
+    @local_names.setter
+    def local_names(self, value: list[str]) -> None:
+        self._flat.local_names = value
+
+    def __repr__(self) -> str:
+        return f"ModuleView({len(self._flat)} nodes)"
@@ -0,0 +1,326 @@
+import os
+import sys
+import time
+from array import array
+from dataclasses import dataclass, field
+from tokenizer import TokenBuffer, TokenKind, tokenize_compact
+from iterative_parser import parse_iterative
+from parser import *
+
+# 增量的词法分析和语法分析: 编辑器里每改一处、watch 模式下每保存一次，不用重新分析整个文件
+#
+# 源代码按顶层项 (函数定义、全局变量的赋值) 切成若干段，每段从这一项的第一个词元开始，到下一项的第一个词元之前为止
+# (后面的空白和注释也算在这一段里，第一段还包括文件开头的空白和注释)。每段记下自己的词元和语法树结点。
+#
+#   parsed = parse_source(source_code)
+#   parsed = reparse(parsed, offset, deleted, inserted)    # 把 [offset, offset + deleted) 替换成 inserted
+#   parsed.module                                           # 和 parse_iterative(tokenize(新的源代码)) 相同
+#
+# 编辑时只重新分析改动涉及的段: 从这些段的开头重新扫描词元，直到扫描的状态和原来重新对上为止 ——
+# 也就是扫描到某一段的末尾时，最后一个词元已经完整、也不在注释中，后面的内容不管是什么都不会和它连在一起，
+# 而且这些词元恰好组成完整的顶层项 (删掉一个 '}' 可能让函数一直延续到后面的段里，这时接着扫描下一段)。
+# 然后只解析这些顶层项，其余段的词元和语法树结点原样复用。
+#
+# 增量分析出现任何问题 (比如代码有语法错误) 时退回到完整的分析，报错和 parse_iterative 完全一样。
+# 返回的模块和之前的模块共用没有改动的结点，之后需要重新做作用域解析 (resolve) 和链接 (link_calls)，
+# 这两步会覆盖掉结点上原来的结果；之前的模块不能再使用。
+
+# 源代码中的一段: 一个顶层项。整个文件中没有任何词元时只有一段，node 为 None
+@dataclass
+class SourceItem:
+    text: str
+    # 这一段的词元，位置相对于这一段的开头
+    tokens: TokenBuffer
+    node: FunctionNode | BinaryExpr | None
+
+# 各段长度的树状数组 (Fenwick tree): 修改一段的长度、求一段的起始位置、找到某个位置所在的段都只要 O(log n)
+# 每次编辑后整个文件中各段的起始位置都可能变化，逐个更新会让编辑的耗时和文件大小成正比
+class SegmentLengths:
+    def __init__(self, lengths: list[int]):
+        n = len(lengths)
+        tree = [0, *lengths]
+        for i in range(1, n + 1):
+            parent = i + (i & -i)
+            if parent <= n:
+                tree[parent] += tree[i]
+        self.tree = tree
+        self.total = sum(lengths)
+
+    def copy(self) -> 'SegmentLengths':
+        other = SegmentLengths([])
+        other.tree, other.total = self.tree[:], self.total
+        return other
+
+    # 第 index 段的长度增加 delta
+    def add(self, index: int, delta: int):
+        tree = self.tree
+        self.total += delta
+        i = index + 1
+        while i < len(tree):
+            tree[i] += delta
+            i += i & -i
+
+    # 第 index 段的起始位置，即前 index 段的总长度
+    def start(self, index: int) -> int:
+        tree = self.tree
+        total = 0
+        while index > 0:
+            total += tree[index]
+            index -= index & -index
+        return total
+
+    # 位置 offset 所在的段 (offset 在文件末尾时为最后一段)
+    def find(self, offset: int) -> int:
+        tree = self.tree
+        n = len(tree) - 1
+        index = 0
+        step = 1 << n.bit_length()
+        while step:
+            if index + step <= n and tree[index + step] <= offset:
+                index += step
+                offset -= tree[index]
+            step >>= 1
+        return min(index, n - 1)
+
+@dataclass
+class ParsedSource:
+    items: list[SourceItem]
+    module: ModuleNode
+    right_nested: bool = False
+    # 各段的长度，以及每一段的结点在 module.functions 或 module.global_vars 中的下标
+    lengths: SegmentLengths = field(default_factory=lambda: SegmentLengths([]), repr=False)
+    node_indexes: list[int] = field(default_factory=list, repr=False)
+    # 得到这个结果时重新扫描的字符数和重新解析的顶层项个数
+    relexed_chars: int = 0
+    reparsed_items: int = 0
+
+    @property
+    def source_code(self) -> str:
+        return ''.join(item.text for item in self.items)
+
+# 词元列表中各个顶层项的范围 [开始, 结束)，以及最后一个不完整的项的开始位置 (都完整时为 None)
+# 函数到函数体的 '{' 配对的 '}' 为止，全局变量的赋值到第一个 ';' 为止 (表达式中没有 '{' 和 ';')
+def split_items(kinds: array) -> tuple[list[tuple[int, int]], int | None]:
+    ranges: list[tuple[int, int]] = []
+    n = len(kinds)
+    i = 0
+    while i < n:
+        start = i
+        if kinds[i] == TokenKind.FUNCTION:
+            while i < n and kinds[i] != TokenKind.LEFT_BRACE:
+                i += 1
+            depth = 0
+            while i < n:
+                kind = kinds[i]
+                i += 1
+                if kind == TokenKind.LEFT_BRACE:
+                    depth += 1
+                elif kind == TokenKind.RIGHT_BRACE:
+                    depth -= 1
+                    if depth == 0:
+                        break
+            else:
+                return ranges, start
+        else:
+            while i < n and kinds[i] != TokenKind.SEMICOLON:
+                i += 1
+            if i == n:
+                return ranges, start
+            i += 1
+        ranges.append((start, i))
+    return ranges, None
+
+# 扫描到 text 的末尾时，后面接上任何内容都不会改变 text 中的词元
+# 末尾是标识符、数字或者可能和 '=' 组成 '==' 这样的运算符时，后面的字符可能和它连在一起；末尾在注释中时，注释会延续到后面
+def is_closed(text: str, tokens: TokenBuffer) -> bool:
+    end = tokens.ends[-1] if len(tokens) else 0
+    if len(tokens) and end == len(text):
+        return tokens.kinds[-1] not in (TokenKind.IDENTIFIER, TokenKind.NUMBER, TokenKind.ASSIGN, TokenKind.NOT,
+                                        TokenKind.LESS, TokenKind.GREATER)
+    comment = text.rfind('#', end)
+    return comment < 0 or text.find('\n', comment) >= 0
+
+# 把 text (词元为 tokens) 按 ranges 切成段，解析每一段
+def build_items(text: str, tokens: TokenBuffer, ranges: list[tuple[int, int]], right_nested: bool) -> list[SourceItem]:
+    items: list[SourceItem] = []
+    for j, (first, last) in enumerate(ranges):
+        # 第一段从 text 的开头开始，包括前面的空白和注释
+        start = tokens.starts[first] if j else 0
+        end = tokens.starts[ranges[j + 1][0]] if j + 1 < len(ranges) else len(text)
+        item_tokens = TokenBuffer(text[start:end])
+        item_tokens.kinds = tokens.kinds[first:last]
+        item_tokens.starts = array('I', [offset - start for offset in tokens.starts[first:last]])
+        item_tokens.ends = array('I', [offset - start for offset in tokens.ends[first:last]])
+        module = parse_iterative(item_tokens, right_nested)
+        nodes = [*module.functions, *module.global_vars]
+        if len(nodes) != 1:
+            raise SyntaxError("Top-level item does not parse on its own")
+        items.append(SourceItem(item_tokens.source_code, item_tokens, nodes[0]))
+    return items
+
+# 由各段组装出模块 (和各段的个数成正比，只在顶层项增加、减少或者种类改变时用到)
+def make_parsed(items: list[SourceItem], right_nested: bool, relexed_chars: int, reparsed_items: int) -> ParsedSource:
+    functions: list[FunctionNode] = []
+    global_vars: list[BinaryExpr] = []
+    node_indexes: list[int] = []
+    for item in items:
+        if type(item.node) is FunctionNode:
+            node_indexes.append(len(functions))
+            functions.append(item.node)
+        elif item.node is not None:
+            node_indexes.append(len(global_vars))
+            global_vars.append(item.node)
+        else:
+            node_indexes.append(-1)
+    return ParsedSource(items, ModuleNode(functions, global_vars), right_nested,
+                        SegmentLengths([len(item.text) for item in items]), node_indexes, relexed_chars, reparsed_items)
+
+# 完整地分析整个源代码
+def parse_source(source_code: str, right_nested: bool = False) -> ParsedSource:
+    tokens = tokenize_compact(source_code)
+    # 先完整地解析一遍，有语法错误时和 parse_iterative 一样报错
+    parse_iterative(tokens, right_nested)
+    ranges, _ = split_items(tokens.kinds)
+    if ranges:
+        items = build_items(source_code, tokens, ranges, right_nested)
+    else:
+        items = [SourceItem(source_code, tokens, None)]
+    return make_parsed(items, right_nested, len(source_code), len(ranges))
+
+# 把 parsed 的源代码中 [offset, offset + deleted) 替换成 inserted，返回新的分析结果
+def reparse(parsed: ParsedSource, offset: int, deleted: int, inserted: str) -> ParsedSource:
+    items, lengths = parsed.items, parsed.lengths
+    if offset < 0 or deleted < 0 or offset + deleted > lengths.total:
+        raise ValueError("Edit is out of range")
+
+    # 改动涉及的段 [first, last]，以及这几段编辑之后的文本
+    first = lengths.find(offset)
+    last = max(lengths.find(offset + deleted - 1), first) if deleted else first
+    local = offset - lengths.start(first)
+    text = ''.join(item.text for item in items[first:last + 1])
+    text = text[:local] + inserted + text[local + deleted:]
+    try:
+        if items[0].node is None:
+            raise SyntaxError("No top-level items to reuse")
+        while True:
+            tokens = tokenize_compact(text)
+            ranges, incomplete = split_items(tokens.kinds)
+            # 还没有和原来的词元对上，接着扫描下一段
+            if last + 1 < len(items) and (incomplete is not None or not ranges or not is_closed(text, tokens)):
+                last += 1
+                text += items[last].text
+                continue
+            # 这几段被整个删掉了，剩下的空白和注释并到前一段里
+            if not ranges and first > 0:
+                first -= 1
+                text = items[first].text + text
+                continue
+            if incomplete is not None or not ranges:
+                raise SyntaxError("Incomplete top-level item")
+            break
+        new_items = build_items(text, tokens, ranges, parsed.right_nested)
+    except Exception:
+        source_code = parsed.source_code
+        return parse_source(source_code[:offset] + inserted + source_code[offset + deleted:], parsed.right_nested)
+
+    old_items = items[first:last + 1]
+    items = items[:first] + new_items + items[last + 1:]
+    if [type(item.node) for item in old_items] == [type(item.node) for item in new_items]:
+        # 顶层项的个数和种类都没有变 (最常见的情况)，只替换改动的结点和长度
+        functions, global_vars = parsed.module.functions[:], parsed.module.global_vars[:]
+        lengths = lengths.copy()
+        for i, (old_item, new_item) in enumerate(zip(old_items, new_items)):
+            nodes = functions if type(new_item.node) is FunctionNode else global_vars
+            nodes[parsed.node_indexes[first + i]] = new_item.node
+            lengths.add(first + i, len(new_item.text) - len(old_item.text))
+        result = ParsedSource(items, ModuleNode(functions, global_vars), parsed.right_nested, lengths,
+                              parsed.node_indexes, len(text), len(new_items))
+    else:
+        result = make_parsed(items, parsed.right_nested, len(text), len(new_items))
+    return result
+
+# 比较修改前后的源代码，得到一次编辑 (offset, deleted, inserted)
+def diff_edit(old: str, new: str) -> tuple[int, int, str]:
+    prefix = common_prefix(old, new)
+    # 公共后缀不能和公共前缀重叠
+    suffix = common_suffix(old, new, min(len(old), len(new)) - prefix)
+    return prefix, len(old) - prefix - suffix, new[prefix:len(new) - suffix]
+
+# 先按块比较 (由 C 完成)，再在第一个不同的块中逐个字符比较
+def common_prefix(a: str, b: str, step: int = 4096) -> int:
+    n = min(len(a), len(b))
+    i = 0
+    while i < n and a[i:i + step] == b[i:i + step]:
+        i += step
+    end = min(i + step, n)
+    while i < end and a[i] == b[i]:
+        i += 1
+    return min(i, n)
+
+# 和 common_prefix 一样，从末尾开始比较，最多 limit 个字符
+def common_suffix(a: str, b: str, limit: int, step: int = 4096) -> int:
+    la, lb = len(a), len(b)
+    i = 0
+    while i < limit and a[max(la - i - step, 0):la - i] == b[max(lb - i - step, 0):lb - i]:
+        i += step
+    end = min(i + step, limit)
+    while i < end and a[la - i - 1] == b[lb - i - 1]:
+        i += 1
+    return min(i, limit)
+
+# 监视文件: 每次保存后增量地重新分析，然后调用 run(module)，在 stderr 上报告耗时
+# run 抛出的异常只报告，不会结束监视；按 Ctrl+C 结束
+def watch(filename: str, run, interval: float = 0.2, right_nested: bool = False):
+    # 先取修改时间再读: 读的时候文件又被修改，记下的修改时间就比内容旧，下一轮还会再读一次；
+    # 反过来会把旧的内容和新的修改时间记在一起，漏掉这次修改
+    def read() -> tuple[str, int]:
+        mtime = os.stat(filename).st_mtime_ns
+        with open(filename, 'r', encoding='utf-8') as f:
+            return f.read(), mtime
+
+    def execute(parsed: ParsedSource, parse_time: float):
+        print(f"分析: 重新扫描 {parsed.relexed_chars} 个字符，重新解析 {parsed.reparsed_items} 个顶层项"
+              f" (共 {len(parsed.items)} 个)，用时 {parse_time * 1000:.2f}ms", file=sys.stderr)
+        start = time.perf_counter()
+        try:
+            run(parsed.module)
+        except Exception as e:
+            print(f"{type(e).__name__}: {e}", file=sys.stderr)
+        print(f"执行用时 {(time.perf_counter() - start) * 1000:.2f}ms", file=sys.stderr)
+
+    source_code, mtime = read()
+    # 最近一次读到的内容，修改时间变了但内容没变时不重新执行
+    last_read = source_code
+    parsed: ParsedSource | None = None
+    start = time.perf_counter()
+    try:
+        parsed = parse_source(source_code, right_nested)
+        execute(parsed, time.perf_counter() - start)
+    except Exception as e:
+        print(f"{type(e).__name__}: {e}", file=sys.stderr)
+    try:
+        while True:
+            time.sleep(interval)
+            try:
+                if os.stat(filename).st_mtime_ns == mtime:
+                    continue
+                new_source, mtime = read()
+            except OSError:
+                continue
+            if new_source == last_read:
+                continue
+            last_read = new_source
+            start = time.perf_counter()
+            try:
+                # 有语法错误时保留上一次正确的结果，改正之后仍然和它比较
+                if parsed is None:
+                    parsed = parse_source(new_source, right_nested)
+                else:
+                    parsed = reparse(parsed, *diff_edit(source_code, new_source))
+                source_code = new_source
+            except Exception as e:
+                print(f"{type(e).__name__}: {e}", file=sys.stderr)
+                continue
+            execute(parsed, time.perf_counter() - start)
+    except KeyboardInterrupt:
+        pass
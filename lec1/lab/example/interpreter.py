@@ -1,93 +1,174 @@
+from dataclasses import dataclass, field
+from typing import TextIO
 from parser import *
+from resolver import resolve
+from purity import find_pure_functions, MemoTable
+from profiler import Profiler
+from natives import link_calls, NativeFunction
+from tracing import TraceJIT, Trace, compile_trace, DONE, BREAK_EXIT, RETURN_EXIT, GUARD
 
-def interpret(module: ModuleNode):
-    class BreakException(Exception): pass
-    class ContinueException(Exception): pass
-    class ReturnException(Exception): pass
+# 语句执行后返回一个完成信号，告诉外层接下来该怎么走:
+#   None      正常执行完毕，继续执行下一条语句
+#   BREAK     遇到了 break，一直传到最近的 while
+#   CONTINUE  遇到了 continue，一直传到最近的 while
+#   float     遇到了 return，值就是返回值，一直传到 call_function
+# 用返回值而不是异常来传递控制流，循环里频繁的 continue / break 就不用付出抛异常的代价
+class Signal:
+    def __init__(self, name: str):
+        self.name = name
 
-    def get_variable(name: str):
-        nonlocal global_vars, local_vars
-        if name in local_vars: return local_vars[name]
-        elif name in global_vars: return global_vars[name]
-        else: raise NameError(f"Variable not found: {name}")
+    def __repr__(self) -> str:
+        return self.name
 
-    def set_variable(name: str, value: float):
-        nonlocal global_vars, local_vars
-        if name in local_vars: local_vars[name] = value
-        elif name in global_vars: global_vars[name] = value
-        else: local_vars[name] = value
+BREAK = Signal('BREAK')
+CONTINUE = Signal('CONTINUE')
 
-    def call_function(function: FunctionNode, args: list[float]) -> float:
-        nonlocal function_map, stored_states, local_vars
-        stored_states.append(local_vars)
-        local_vars = { 'return-value': 0.0 }
+# 一次运行的全部可变状态: 全局变量表、调用栈上保存的局部变量表，以及 print 的输出目标
+# 每次运行 (link) 用自己的 RunContext，不同的运行之间没有共享的可变状态，可以在多个线程中同时执行
+# (正在执行的函数的局部变量表放在解释器的闭包变量里，调用时压进 stored_states)
+# output 为 None 时输出到当时的 sys.stdout
+@dataclass
+class RunContext:
+    output: TextIO | None = None
+    global_vars: list[float | None] = field(default_factory=list)
+    stored_states: list[list[float | None]] = field(default_factory=list)
+
+# memo 不为 None 时，对纯函数的调用通过这个记忆表 (见 purity.py)，结果和不记忆时完全一样
+# profiler 不为 None 时统计每个函数、语句和循环的执行情况 (见 profiler.py)
+# builtins 为可以调用的内置函数，默认为 natives.py 中全局的注册表
+# jit 不为 None 时把热的 while 循环编译成 Python 函数执行 (见 tracing.py)，结果和不编译时完全一样
+# context 为这次运行的状态，默认新建一个 (输出到 sys.stdout)
+def interpret(module: ModuleNode, memo: MemoTable | None = None, profiler: Profiler | None = None,
+              builtins: dict[str, NativeFunction] | None = None, jit: TraceJIT | None = None,
+              context: RunContext | None = None):
+    function_map, call = link(module, memo, profiler, builtins, jit, context)
+    if 'main' in function_map:
+        return call('main', [])
+    else:
+        return 0.0
+
+# 一次链接模块，之后可以多次调用其中的函数，全局变量在调用之间保留
+# 创建时按顺序初始化全局变量 (初始化表达式中的 print 也在这时输出)
+class Interpreter:
+    def __init__(self, module: ModuleNode, memo: MemoTable | None = None, profiler: Profiler | None = None,
+                 builtins: dict[str, NativeFunction] | None = None, jit: TraceJIT | None = None,
+                 context: RunContext | None = None):
+        self.module = module
+        self.context = context if context is not None else RunContext()
+        self.function_map, self._call = link(module, memo, profiler, builtins, jit, self.context)
+
+    # 调用不存在的函数时抛出 NameError，实参个数不对时抛出 TypeError，和链接 slang 中的调用时一致 (见 natives.py)
+    def call(self, name: str, *args: float) -> float:
+        if name not in self.function_map:
+            raise NameError(f"Function not found: {name}")
+        parameters = self.function_map[name].parameters
+        if len(parameters) != len(args):
+            raise TypeError(f"Function {name} takes {len(parameters)} arguments, got {len(args)}")
+        return self._call(name, [float(arg) for arg in args])
+
+    # 和 interpret() 一样调用 main，没有 main 时返回 0.0
+    def run(self) -> float:
+        if 'main' in self.function_map:
+            return self._call('main', [])
+        return 0.0
 
+    @property
+    def functions(self) -> list[str]:
+        return list(self.function_map)
+
+# 作用域解析、把调用表达式绑定到被调用的函数、准备好各个执行函数并初始化全局变量
+# 调用不存在的函数、实参个数不对在这一步报错 (见 natives.py)
+# 返回 (函数名 -> 函数, call(函数名, 实参列表))
+# linked 为 True 表示 module 已经解析、链接过 (比如 run_many() 中多个线程执行同一个模块)，不再写语法树
+def link(module: ModuleNode, memo: MemoTable | None = None, profiler: Profiler | None = None,
+         builtins: dict[str, NativeFunction] | None = None, jit: TraceJIT | None = None,
+         context: RunContext | None = None, linked: bool = False):
+    # 跟踪中的代码不经过 exec_stat，剖析结果会不完整
+    if profiler is not None and jit is not None:
+        raise ValueError("profiler and jit cannot be used together")
+
+    # 变量已经由 resolver 分配好了槽位，直接按下标访问
+    # 槽位为 None 表示变量还没有被赋值过
+    # 有 fallback_slot 的全局变量还没有初始化时，用 fallback_slot 中的局部变量 (见 resolver.py)
+    def get_variable(var: Variable):
+        value = global_vars[var.slot] if var.is_global else local_vars[var.slot]
+        if value is None and var.fallback_slot >= 0: value = local_vars[var.fallback_slot]
+        if value is None: raise NameError(f"Variable not found: {var.name}")
+        return value
+
+    def set_variable(var: Variable, value: float):
+        if var.is_global:
+            if var.fallback_slot >= 0 and global_vars[var.slot] is None: local_vars[var.fallback_slot] = value
+            else: global_vars[var.slot] = value
+        else: local_vars[var.slot] = value
+
+    def call_function(function: FunctionNode, args: list[float]) -> float:
+        nonlocal stored_states, local_vars
         assert len(function.parameters) == len(args)
-        for i in range(len(args)):
-            local_vars[function.parameters[i]] = args[i]
 
-        try:
-            exec_block_stat(function.body)
-        except ReturnException:
-            pass
+        stored_states.append(local_vars)
+        # 形参占据最前面的槽位，其余局部变量预先留好位置
+        local_vars = args + [None] * (len(function.local_names) - len(args))
 
-        return_value = local_vars['return-value']
+        signal = exec_block_stat(function.body)
         local_vars = stored_states.pop()
-        return return_value
 
-    builtin_functions = ["print"]
-    def call_builtin_function(name: str, args: list[float]) -> float:
-        match name:
-            case "print":
-                print(*args)
-                return 0.0
-            case unexpected_name: raise NotImplementedError(f"Unknown built-in function: {unexpected_name}")
+        if signal is None:
+            return 0.0
+        if signal is BREAK or signal is CONTINUE:
+            raise SyntaxError(f"'{signal.name.lower()}' outside loop")
+        return signal
 
     def exec_stat(stat: StatementNode):
         match stat:
-            case BlockStat(): exec_block_stat(stat)
-            case IfStat(): exec_if_stat(stat)
-            case WhileStat(): exec_while_stat(stat)
-            case BreakStat(): exec_break_stat(stat)
-            case ContinueStat(): exec_continue_stat(stat)
-            case ExprEvalStat(): exec_expr_eval_stat(stat)
-            case ReturnStat(): exec_return_stat(stat)
+            case BlockStat(): return exec_block_stat(stat)
+            case IfStat(): return exec_if_stat(stat)
+            case WhileStat(): return exec_while_stat(stat)
+            case BreakStat(): return exec_break_stat(stat)
+            case ContinueStat(): return exec_continue_stat(stat)
+            case ExprEvalStat(): return exec_expr_eval_stat(stat)
+            case ReturnStat(): return exec_return_stat(stat)
             case _: raise NotImplementedError(f"Unknown statement: {stat}")
 
     def exec_block_stat(stats: BlockStat):
         for stat in stats.statements:
-            exec_stat(stat)
+            signal = exec_stat(stat)
+            if signal is not None:
+                return signal
+        return None
 
     def exec_if_stat(stat: IfStat):
         condition = eval_expr(stat.condition)
         if condition:
-            exec_stat(stat.branch_true)
+            return exec_stat(stat.branch_true)
         else:
             if stat.branch_false is not None:
-                exec_stat(stat.branch_false)
+                return exec_stat(stat.branch_false)
+        return None
     
     def exec_while_stat(stat: WhileStat):
         while eval_expr(stat.condition):
-            try:
-                exec_stat(stat.body)
-            except BreakException:
-                break
-            except ContinueException:
-                continue
+            signal = exec_stat(stat.body)
+            if signal is not None:
+                if signal is BREAK: break
+                if signal is CONTINUE: continue
+                return signal
+        return None
 
     def exec_break_stat(stat: BreakStat):
-        raise BreakException()
+        return BREAK
 
     def exec_continue_stat(stat: ContinueStat):
-        raise ContinueException()
+        return CONTINUE
 
     def exec_expr_eval_stat(stat: ExprEvalStat):
         eval_expr(stat.expr)
+        return None
 
     def exec_return_stat(stat: ReturnStat):
         if stat.return_value is not None:
-            local_vars['return-value'] = eval_expr(stat.return_value)
-        raise ReturnException()
+            return eval_expr(stat.return_value)
+        return 0.0
 
     def eval_expr(expr: ExpressionNode) -> float:
         match expr:
@@ -95,14 +176,14 @@ def interpret(module: ModuleNode):
             case BinaryExpr(): return eval_binary_expr(expr)
             case UnaryExpr(): return eval_unary_expr(expr)
             case CallExpr(): return eval_call_expr(expr)
-            case Variable(name): return get_variable(name)
+            case Variable(): return get_variable(expr)
             case _: raise NotImplementedError(f"Unknown expression: {expr}")
 
     def eval_binary_expr(expr: BinaryExpr) -> float:
         # 赋值表达式
         if expr.operator == '=' and isinstance(expr.left, Variable):
             value = eval_expr(expr.right)
-            set_variable(expr.left.name, value)
+            set_variable(expr.left, value)
             return value
         left = eval_expr(expr.left)
         right = eval_expr(expr.right)
@@ -127,31 +208,143 @@ def interpret(module: ModuleNode):
             case '!': return float(not operand)
             case unexpected_op: raise NotImplementedError(f"Unknown operator: {unexpected_op}")
 
+    # 被调用的函数已经在链接时确定，实参个数也检查过了
     def eval_call_expr(expr: CallExpr) -> float:
         args: list[float] = []
         for arg in expr.arguments:
             args.append(eval_expr(arg))
-        
-        if expr.callee in builtin_functions:
-            return call_builtin_function(expr.callee, args)
-        else:
-            func = function_map[expr.callee]
+
+        func = expr.target
+        if type(func) is NativeFunction:
+            if func.writes_output:
+                return float(func.function(*args, output=output))
+            return float(func.function(*args))
+        return invoke(func, args)
+
+    def invoke(func: FunctionNode, args: list[float]) -> float:
+        if memo is None or func.name not in pure_functions:
             return call_function(func, args)
+        key = memo.key(func.name, args)
+        value = memo.get(key)
+        if value is None:
+            value = call_function(func, args)
+            memo.put(key, value)
+        return value
+
+    # 跟踪编译: 每个 while 循环 (以 id 为键) 执行循环体的次数和编译好的跟踪 (None 表示不再尝试编译)
+    # 记录路径时 recording 中记下当前这层调用 (调用深度为 recording_depth) 中每个 if 的条件是否为真
+    iteration_counts: dict[int, int] = {}
+    traces: dict[int, Trace | None] = {}
+    recording: dict[int, bool] | None = None
+    recording_depth = 0
+
+    def exec_if_stat_recorded(stat: IfStat):
+        condition = eval_expr(stat.condition)
+        if recording is not None and len(stored_states) == recording_depth:
+            recording.setdefault(id(stat), bool(condition))
+        if condition:
+            return exec_stat(stat.branch_true)
+        else:
+            if stat.branch_false is not None:
+                return exec_stat(stat.branch_false)
+        return None
+
+    def exec_while_stat_traced(stat: WhileStat):
+        nonlocal recording, recording_depth
+        key = id(stat)
+        while True:
+            trace = traces.get(key)
+            if trace is not None:
+                index, value, iterations = trace.run(local_vars, global_vars)
+                jit.trace_iterations += iterations
+                exit = trace.exits[index]
+                if exit.kind == DONE or exit.kind == BREAK_EXIT:
+                    return None
+                if exit.kind == RETURN_EXIT:
+                    return value
+                if exit.kind == GUARD:
+                    # 守卫失败: 这一次循环体剩下的部分由解释器执行
+                    jit.guard_exits += 1
+                    signal = None
+                    for s in exit.statements:
+                        signal = exec_stat(s)
+                        if signal is not None:
+                            break
+                    if signal is None or signal is CONTINUE: continue
+                    if signal is BREAK: return None
+                    return signal
+                # 有变量还没有赋值: 这一次循环由解释器执行
+                jit.entry_exits += 1
+
+            if not eval_expr(stat.condition):
+                return None
+            count = iteration_counts.get(key, 0) + 1
+            iteration_counts[key] = count
+            if count < jit.threshold or key in traces or recording is not None:
+                signal = exec_stat(stat.body)
+            else:
+                # 记录这一次循环体走过的路径，正常结束 (或者 continue) 时编译
+                recording, recording_depth = {}, len(stored_states)
+                try:
+                    signal = exec_stat(stat.body)
+                    outcomes = recording
+                finally:
+                    recording = None
+                if signal is None or signal is CONTINUE:
+                    trace = compile_trace(stat, outcomes, invoke, exec_stat, output, jit.max_trace_length)
+                    traces[key] = trace
+                    if trace is None:
+                        jit.traces_aborted += 1
+                    else:
+                        jit.traces_compiled += 1
+                        jit.sources.append(trace.source)
+            if signal is not None:
+                if signal is BREAK: return None
+                if signal is CONTINUE: continue
+                return signal
+
+    if not linked:
+        resolve(module)
+        link_calls(module, builtins)
+    if jit is not None:
+        exec_if_stat = exec_if_stat_recorded
+        exec_while_stat = exec_while_stat_traced
+
+    # 剖析时换成包装过的版本，其它函数通过闭包调用到的也是包装过的版本
+    if profiler is not None:
+        profiler.attach(module)
+        call_function = profiler.wrap_call(call_function)
+        exec_stat = profiler.wrap_stat(exec_stat)
 
     function_map: dict[str, FunctionNode] = {}
-    global_vars: dict[str, float] = {}
-    stored_states: list[dict[str, float]] = []
-    local_vars: dict[str, float] = {}
+    if context is None:
+        context = RunContext()
+    context.global_vars = [None] * len(module.global_names)
+    context.stored_states = []
+    global_vars, stored_states, output = context.global_vars, context.stored_states, context.output
+    local_vars: list[float | None] = [None] * len(module.local_names)
 
     for function in module.functions:
         function_map[function.name] = function
+    # 记下的结果只对这个模块有效，每次运行都重新开始
+    pure_functions = find_pure_functions(module, builtins) if memo is not None else set()
+    if memo is not None:
+        memo.clear()
     for var in module.global_vars:
         assert var.operator == '=' and isinstance(var.left, Variable)
-        global_vars[var.left.name] = eval_expr(var.right)
+        global_vars[var.left.slot] = eval_expr(var.right)
 
-    if 'main' in function_map:
-        main = function_map['main']
-        return_value = call_function(main, [])
-        return return_value
-    else:
-        return 0.0
+
+    # 调用出错时恢复调用前的状态，同一个模块之后还可以继续调用
+    def call(name: str, args: list[float]) -> float:
+        nonlocal local_vars
+        depth = len(stored_states)
+        saved_vars = local_vars
+        try:
+            return call_function(function_map[name], args)
+        except BaseException:
+            del stored_states[depth:]
+            local_vars = saved_vars
+            raise
+
+    return function_map, call
@@ -0,0 +1,440 @@
+from dataclasses import dataclass, field
+from parser import *
+from resolver import resolve
+from natives import link_calls, NativeFunction
+
+# 中间表示 (IR): 每个函数是一张由基本块组成的控制流图 (CFG)，值是 SSA 形式 (每个值只被定义一次)
+#
+# 指令 (Instr) 本身就是它定义的值，args 直接引用其它指令。所有的值都是浮点数，没有类型。
+#
+#   const c              常量
+#   param i              第 i 个形参
+#   undef                还没有赋值的局部变量 (执行时是 None)
+#   check v              读取局部变量: v 为 None 时抛出 NameError，否则就是 v
+#   load_global s        读取全局变量 s
+#   store_global s, v    给全局变量 s 赋值
+#   load_late s, v       全局变量 s 已经初始化时读取它，否则读取局部变量 v (v 为 None 时抛出 NameError)
+#   store_late s, v      全局变量 s 已经初始化时给它赋值，否则什么也不做 (局部变量照常记下 v)
+#   add sub mul div eq ne lt le gt ge  二元运算，比较的结果是 0.0 / 1.0
+#   neg not              一元运算 (+x 就是 x 本身，不生成指令)
+#   call f, args...      调用 slang 函数或者内置函数 (链接时已经确定，见 natives.py)
+#   phi v1, v2, ...      块的第 i 个前驱跳过来时取 vi，只出现在块的开头
+# 每个块以一条终结指令结束:
+#   jump b / branch v, b1, b2 / ret v / raise msg (循环外的 break / continue)
+#
+# lower_module() 把作用域解析过的语法树转换成 IR，用的是 Braun 等人的 SSA 构造算法:
+# 按语法树的顺序边生成指令边记录每个变量在每个块中的当前值，读取时向前驱查找，需要时插入 phi。
+# 每个 while 循环前都有一个只跳到循环头的前置块 (preheader)，循环不变量外提时放到这里。
+# 有 fallback_slot 的全局变量 (见 resolver.py) 用 load_late / store_late，
+# globals_ready 为真时 (全局变量全部初始化之后才执行的代码) 就是普通的全局变量。
+#
+# ir_passes.py 中的优化在 IR 上进行，ir_exec.py 把 IR 转换成寄存器指令后执行，
+# 执行的结果 (包括 print 的输出和报错) 和 interpret() 完全一样。
+
+BINARY_OPS = { '+': 'add', '-': 'sub', '*': 'mul', '/': 'div',
+               '==': 'eq', '!=': 'ne', '<': 'lt', '<=': 'le', '>': 'gt', '>=': 'ge' }
+UNARY_OPS = { '-': 'neg', '!': 'not' }
+TERMINATORS = ('jump', 'branch', 'ret', 'raise')
+
+@dataclass(eq=False)
+class Instr:
+    op: str
+    args: list['Instr'] = field(default_factory=list)
+    # const 的值、param 的下标、全局变量的槽位、被调用的函数、报错信息、check 的变量名
+    value: object = None
+    block: 'Block | None' = field(default=None, repr=False)
+    # branch / jump 的目标
+    targets: list['Block'] = field(default_factory=list, repr=False)
+    id: int = -1
+
+@dataclass(eq=False)
+class Block:
+    id: int
+    instrs: list[Instr] = field(default_factory=list)
+    # 前驱的顺序和 phi 的参数一一对应
+    preds: list['Block'] = field(default_factory=list, repr=False)
+
+    @property
+    def terminator(self) -> Instr | None:
+        if self.instrs and self.instrs[-1].op in TERMINATORS:
+            return self.instrs[-1]
+        return None
+
+    @property
+    def succs(self) -> list['Block']:
+        terminator = self.terminator
+        return terminator.targets if terminator is not None else []
+
+    @property
+    def phis(self) -> list[Instr]:
+        result = []
+        for instr in self.instrs:
+            if instr.op != 'phi':
+                break
+            result.append(instr)
+        return result
+
+@dataclass(eq=False)
+class IRFunction:
+    name: str
+    parameters: list[str]
+    blocks: list[Block] = field(default_factory=list)
+    # 全局变量的名字，报错和输出 IR 时用
+    global_names: list[str] = field(default_factory=list, repr=False)
+    next_id: int = 0
+    next_block_id: int = 0
+
+    @property
+    def entry(self) -> Block:
+        return self.blocks[0]
+
+    def new_block(self) -> Block:
+        block = Block(self.next_block_id)
+        self.next_block_id += 1
+        self.blocks.append(block)
+        return block
+
+    def new_instr(self, op: str, args: list[Instr] | None = None, value: object = None) -> Instr:
+        instr = Instr(op, args or [], value, id=self.next_id)
+        self.next_id += 1
+        return instr
+
+@dataclass(eq=False)
+class IRModule:
+    functions: dict[str, IRFunction]
+    # 初始化全局变量的代码，当作一个没有形参的函数
+    init: IRFunction
+    global_names: list[str]
+
+# 会抛出异常的指令: 就算结果没有用到也不能删，也不能随便移动位置
+def may_trap(instr: Instr, globals_ready: bool) -> bool:
+    match instr.op:
+        case 'div':
+            divisor = instr.args[1]
+            return not (divisor.op == 'const' and divisor.value != 0.0)
+        case 'check':
+            return True
+        case 'load_global':
+            # 全局变量全部初始化之后，读取全局变量不会出错
+            return not globals_ready
+        case 'load_late':
+            return True
+        case _:
+            return False
+
+# 有副作用的指令
+def has_effect(instr: Instr) -> bool:
+    return instr.op in ('call', 'store_global', 'store_late') or instr.op in TERMINATORS
+
+def lower_module(module: ModuleNode, globals_ready: bool = True) -> IRModule:
+    resolve(module)
+    link_calls(module)
+    function_map: dict[str, FunctionNode] = {}
+    for function in module.functions:
+        function_map[function.name] = function
+    functions = { name: lower_function(function, module.global_names, globals_ready)
+                  for name, function in function_map.items() }
+    init_function = FunctionNode('<init>', [], BlockStat(list(map(ExprEvalStat, module.global_vars))))
+    init_function.local_names = module.local_names
+    return IRModule(functions, lower_function(init_function, module.global_names), list(module.global_names))
+
+def lower_function(function: FunctionNode, global_names: list[str], globals_ready: bool = True) -> IRFunction:
+    ir = IRFunction(function.name, list(function.parameters), global_names=list(global_names))
+    # 每个局部变量 (按槽位) 在每个块中的当前值
+    current_defs: dict[int, dict[Block, Instr]] = {}
+    sealed: set[Block] = set()
+    incomplete_phis: dict[Block, dict[int, Instr]] = {}
+    loops: list[tuple[Block, Block]] = []
+
+    entry = ir.new_block()
+    sealed.add(entry)
+    undef = ir.new_instr('undef')
+    undef.block = entry
+    entry.instrs.append(undef)
+    block: Block | None = entry
+
+    # return / break / continue 之后的代码执行不到，放进一个没有前驱的块，之后会被删掉
+    def current_block() -> Block:
+        nonlocal block
+        if block is None:
+            block = ir.new_block()
+            sealed.add(block)
+        return block
+
+    def emit(op: str, args: list[Instr] | None = None, value: object = None) -> Instr:
+        at = current_block()
+        instr = ir.new_instr(op, args, value)
+        instr.block = at
+        at.instrs.append(instr)
+        return instr
+
+    def terminate(op: str, args: list[Instr] | None = None, targets: list[Block] | None = None, value: object = None):
+        nonlocal block
+        instr = emit(op, args, value)
+        for target in targets or []:
+            instr.targets.append(target)
+            target.preds.append(instr.block)
+        block = None
+
+    def write_variable(slot: int, at: Block, value: Instr):
+        current_defs.setdefault(slot, {})[at] = value
+
+    def read_variable(slot: int, at: Block) -> Instr:
+        defs = current_defs.setdefault(slot, {})
+        # 沿着唯一的前驱一直向前找，避免长串的 if 语句导致很深的递归
+        path: list[Block] = []
+        while at not in defs and at in sealed and len(at.preds) == 1:
+            path.append(at)
+            at = at.preds[0]
+        if at in defs:
+            value = defs[at]
+        elif at not in sealed:
+            # 还有前驱没有生成 (循环头)，先放一个 phi，封闭时再补上参数
+            value = new_phi(at)
+            incomplete_phis.setdefault(at, {})[slot] = value
+            defs[at] = value
+        elif not at.preds:
+            value = undef
+            defs[at] = value
+        else:
+            value = new_phi(at)
+            defs[at] = value
+            add_phi_operands(slot, value)
+        for b in path:
+            defs[b] = value
+        return value
+
+    def new_phi(at: Block) -> Instr:
+        phi = ir.new_instr('phi')
+        phi.block = at
+        at.instrs.insert(len(at.phis), phi)
+        return phi
+
+    def add_phi_operands(slot: int, phi: Instr):
+        for pred in phi.block.preds:
+            phi.args.append(read_variable(slot, pred))
+
+    def seal(at: Block):
+        for slot, phi in incomplete_phis.pop(at, {}).items():
+            add_phi_operands(slot, phi)
+        sealed.add(at)
+
+    def lower_expr(expr: ExpressionNode) -> Instr:
+        match expr:
+            case NumberConstant(value):
+                return emit('const', value=value)
+            case Variable():
+                if expr.is_global and expr.fallback_slot >= 0 and not globals_ready:
+                    return emit('load_late', [read_variable(expr.fallback_slot, current_block())], expr.slot)
+                if expr.is_global:
+                    return emit('load_global', value=expr.slot)
+                value = read_variable(expr.slot, current_block())
+                if value.op in ('undef', 'phi'):
+                    return emit('check', [value], expr.name)
+                return value
+            case BinaryExpr(operator='=', left=Variable()):
+                value = lower_expr(expr.right)
+                if expr.left.is_global and expr.left.fallback_slot >= 0 and not globals_ready:
+                    emit('store_late', [value], expr.left.slot)
+                    write_variable(expr.left.fallback_slot, current_block(), value)
+                elif expr.left.is_global:
+                    emit('store_global', [value], expr.left.slot)
+                else:
+                    write_variable(expr.left.slot, current_block(), value)
+                return value
+            case BinaryExpr():
+                left = lower_expr(expr.left)
+                right = lower_expr(expr.right)
+                return emit(BINARY_OPS[expr.operator], [left, right])
+            case UnaryExpr(operator='+'):
+                return lower_expr(expr.operand)
+            case UnaryExpr():
+                return emit(UNARY_OPS[expr.operator], [lower_expr(expr.operand)])
+            case CallExpr():
+                args = [lower_expr(arg) for arg in expr.arguments]
+                return emit('call', args, expr.target)
+            case _:
+                raise NotImplementedError(f"Unknown expression: {expr}")
+
+    def lower_stat(stat: StatementNode):
+        match stat:
+            case BlockStat():
+                for s in stat.statements:
+                    lower_stat(s)
+            case IfStat():
+                condition = lower_expr(stat.condition)
+                then_block = ir.new_block()
+                else_block = ir.new_block() if stat.branch_false is not None else None
+                join_block = ir.new_block()
+                else_block = else_block or join_block
+                terminate('branch', [condition], [then_block, else_block])
+                seal(then_block)
+                set_block(then_block)
+                lower_stat(stat.branch_true)
+                if block is not None:
+                    terminate('jump', targets=[join_block])
+                if stat.branch_false is not None:
+                    seal(else_block)
+                    set_block(else_block)
+                    lower_stat(stat.branch_false)
+                    if block is not None:
+                        terminate('jump', targets=[join_block])
+                seal(join_block)
+                set_block(join_block)
+            case WhileStat():
+                # 前置块只有一个后继，循环不变量可以放在这里
+                preheader = ir.new_block()
+                terminate('jump', targets=[preheader])
+                seal(preheader)
+                header = ir.new_block()
+                set_block(preheader)
+                terminate('jump', targets=[header])
+                set_block(header)
+                condition = lower_expr(stat.condition)
+                body = ir.new_block()
+                exit = ir.new_block()
+                terminate('branch', [condition], [body, exit])
+                seal(body)
+                set_block(body)
+                loops.append((header, exit))
+                lower_stat(stat.body)
+                loops.pop()
+                if block is not None:
+                    terminate('jump', targets=[header])
+                seal(header)
+                seal(exit)
+                set_block(exit)
+            case BreakStat() | ContinueStat():
+                name = 'break' if isinstance(stat, BreakStat) else 'continue'
+                if not loops:
+                    terminate('raise', value=f"'{name}' outside loop")
+                else:
+                    header, exit = loops[-1]
+                    terminate('jump', targets=[exit if name == 'break' else header])
+            case ExprEvalStat():
+                lower_expr(stat.expr)
+            case ReturnStat():
+                value = lower_expr(stat.return_value) if stat.return_value is not None else emit('const', value=0.0)
+                terminate('ret', [value])
+            case _:
+                raise NotImplementedError(f"Unknown statement: {stat}")
+
+    def set_block(at: Block):
+        nonlocal block
+        block = at
+
+    for i in range(len(function.parameters)):
+        param = emit('param', value=i)
+        write_variable(i, entry, param)
+    lower_stat(function.body)
+    if block is not None:
+        terminate('ret', [emit('const', value=0.0)])
+    remove_unreachable(ir)
+    return ir
+
+# 删掉从入口到达不了的块，同时删掉 phi 中对应的参数
+def remove_unreachable(ir: IRFunction):
+    reachable: set[Block] = set()
+    pending = [ir.entry]
+    while pending:
+        b = pending.pop()
+        if b in reachable:
+            continue
+        reachable.add(b)
+        pending.extend(b.succs)
+    for b in ir.blocks:
+        if b not in reachable:
+            continue
+        keep = [i for i, pred in enumerate(b.preds) if pred in reachable]
+        if len(keep) != len(b.preds):
+            b.preds = [b.preds[i] for i in keep]
+            for phi in b.phis:
+                phi.args = [phi.args[i] for i in keep]
+    ir.blocks = [b for b in ir.blocks if b in reachable]
+
+# 逆后序 (reverse post-order): 除了回边，每个块都排在它的后继之前
+def reverse_postorder(ir: IRFunction) -> list[Block]:
+    order: list[Block] = []
+    visited: set[Block] = {ir.entry}
+    stack = [(ir.entry, iter(ir.entry.succs))]
+    while stack:
+        b, succs = stack[-1]
+        for succ in succs:
+            if succ not in visited:
+                visited.add(succ)
+                stack.append((succ, iter(succ.succs)))
+                break
+        else:
+            stack.pop()
+            order.append(b)
+    order.reverse()
+    return order
+
+# 直接支配者 (Cooper, Harvey, Kennedy 的迭代算法)
+def dominators(ir: IRFunction) -> dict[Block, Block]:
+    order = reverse_postorder(ir)
+    index = { b: i for i, b in enumerate(order) }
+    idom: dict[Block, Block] = { ir.entry: ir.entry }
+    def intersect(a: Block, b: Block) -> Block:
+        while a is not b:
+            while index[a] > index[b]:
+                a = idom[a]
+            while index[b] > index[a]:
+                b = idom[b]
+        return a
+    changed = True
+    while changed:
+        changed = False
+        for b in order[1:]:
+            new_idom = None
+            for pred in b.preds:
+                if pred in idom:
+                    new_idom = pred if new_idom is None else intersect(pred, new_idom)
+            if idom.get(b) is not new_idom:
+                idom[b] = new_idom
+                changed = True
+    return idom
+
+def dominates(idom: dict[Block, Block], a: Block, b: Block) -> bool:
+    while b is not a:
+        parent = idom[b]
+        if parent is b:
+            return False
+        b = parent
+    return True
+
+# IR 的文本形式，调试用
+def dump_function(ir: IRFunction) -> str:
+    def name(instr: Instr) -> str:
+        return f"v{instr.id}"
+    def operand(instr: Instr) -> str:
+        match instr.op:
+            case 'const': return f"{name(instr)} = const {instr.value!r}"
+            case 'param': return f"{name(instr)} = param {instr.value} ({ir.parameters[instr.value]})"
+            case 'undef': return f"{name(instr)} = undef"
+            case 'check': return f"{name(instr)} = check {name(instr.args[0])} ({instr.value})"
+            case 'load_global': return f"{name(instr)} = load_global {ir.global_names[instr.value]}"
+            case 'store_global': return f"store_global {ir.global_names[instr.value]}, {name(instr.args[0])}"
+            case 'load_late': return f"{name(instr)} = load_late {ir.global_names[instr.value]}, {name(instr.args[0])}"
+            case 'store_late': return f"store_late {ir.global_names[instr.value]}, {name(instr.args[0])}"
+            case 'call':
+                args = ''.join(', ' + name(arg) for arg in instr.args)
+                return f"{name(instr)} = call {instr.value.name}{args}"
+            case 'phi':
+                pairs = ', '.join(f"[{name(arg)}, b{pred.id}]" for arg, pred in zip(instr.args, instr.block.preds))
+                return f"{name(instr)} = phi {pairs}"
+            case 'jump': return f"jump b{instr.targets[0].id}"
+            case 'branch': return f"branch {name(instr.args[0])}, b{instr.targets[0].id}, b{instr.targets[1].id}"
+            case 'ret': return f"ret {name(instr.args[0])}"
+            case 'raise': return f"raise {instr.value}"
+            case op: return f"{name(instr)} = {op} {', '.join(name(arg) for arg in instr.args)}"
+    lines = [f"function {ir.name}({', '.join(ir.parameters)}):"]
+    for b in ir.blocks:
+        preds = f"  ; preds: {', '.join(f'b{p.id}' for p in b.preds)}" if b.preds else ''
+        lines.append(f"  b{b.id}:{preds}")
+        for instr in b.instrs:
+            lines.append(f"    {operand(instr)}")
+    return '\n'.join(lines) + '\n'
+
+def dump(module: IRModule) -> str:
+    return '\n'.join(dump_function(ir) for ir in [module.init, *module.functions.values()])
@@ -0,0 +1,258 @@
+import sys
+from dataclasses import dataclass, field
+from typing import Generator, Iterable, TextIO
+from parser import ModuleNode
+from ir import *
+from ir_passes import optimize_module, IR_PASSES
+from vm import DEFAULT_MAX_DEPTH, StackOverflowError
+
+# 执行 IR: 先把每个函数转换成扁平的寄存器指令，再像 vm.py 一样用一个循环逐条执行
+#
+# 每个 SSA 值分配一个寄存器，函数的一次调用就是一个寄存器列表。常量和 undef 预先放在寄存器的初始值里。
+# phi 在跳转时用并行赋值实现: 跳到有 phi 的块之前，把每个 phi 在这条边上的取值同时写进 phi 的寄存器。
+# branch 的目标有 phi 时，在这条边上插入一小段只做赋值的代码。
+#
+# 全局变量初始化期间调用的函数可能读到还没有初始化的全局变量 (要抛出 NameError)，
+# 这时用的是另一份按这种情况优化的代码 (globals_ready=False)，初始化完成之后才换成正常优化的代码。
+#
+# 和 vm.py 一样，调用信息保存在显式的调用栈里，slang 的函数调用不占用 Python 的调用栈 (也不嵌套生成器)，
+# 递归的深度只受 max_depth 限制，超过时抛出 StackOverflowError。
+
+(MOVE, JUMP, BRANCH, RET, RAISE, CHECK, LOAD_GLOBAL, LOAD_GLOBAL_CHECKED, STORE_GLOBAL, CALL, CALL_NATIVE,
+ CALL_OUTPUT, ADD, SUB, MUL, DIV, EQ, NE, LT, LE, GT, GE, NEG, NOT, LOAD_LATE, STORE_LATE) = range(26)
+
+OPCODES = { 'add': ADD, 'sub': SUB, 'mul': MUL, 'div': DIV, 'eq': EQ, 'ne': NE, 'lt': LT, 'le': LE,
+            'gt': GT, 'ge': GE, 'neg': NEG, 'not': NOT }
+
+@dataclass(eq=False)
+class CompiledFunction:
+    name: str
+    # 每条指令是 (操作码, a, b, c)，跳转目标是指令下标
+    code: list[tuple] = field(default_factory=list)
+    # 寄存器的初始值 (常量)，以及各个形参所在的寄存器
+    registers: list = field(default_factory=list)
+    param_registers: list[int] = field(default_factory=list)
+
+def compile_function(ir: IRFunction, function_index: dict[str, int], globals_ready: bool) -> CompiledFunction:
+    compiled = CompiledFunction(ir.name)
+    register: dict[Instr, int] = {}
+    for b in ir.blocks:
+        for instr in b.instrs:
+            if instr.op not in ('store_global', 'store_late', *TERMINATORS):
+                register[instr] = len(compiled.registers)
+                compiled.registers.append(instr.value if instr.op == 'const' else None)
+    # 没有用到的形参 (比如重名的形参) 被 dce 删掉了，随便放进一个寄存器
+    scratch = len(compiled.registers)
+    compiled.registers.append(None)
+    compiled.param_registers = [scratch] * len(ir.parameters)
+    for instr in ir.entry.instrs:
+        if instr.op == 'param':
+            compiled.param_registers[instr.value] = register[instr]
+
+    # 从 pred 跳到 succ 时给 succ 的 phi 赋值
+    def moves(pred: Block, succ: Block) -> tuple:
+        k = succ.preds.index(pred)
+        phis = succ.phis
+        return (MOVE, tuple(register[phi] for phi in phis), tuple(register[phi.args[k]] for phi in phis), None)
+
+    code = compiled.code
+    start: dict[Block, int] = {}
+    # 需要回填跳转目标的位置: (指令下标, 元组中的位置, 目标块)
+    jumps: list[tuple[int, int, Block]] = []
+    # 目标有 phi 的 branch 边，最后在代码末尾生成赋值的代码: (指令下标, 元组中的位置, 当前块, 目标块)
+    edges: list[tuple[int, int, Block, Block]] = []
+    for b in reverse_postorder(ir):
+        start[b] = len(code)
+        for instr in b.instrs:
+            match instr.op:
+                case 'const' | 'param' | 'undef' | 'phi':
+                    pass
+                case 'check':
+                    code.append((CHECK, register[instr], register[instr.args[0]], instr.value))
+                case 'load_global':
+                    op = LOAD_GLOBAL if globals_ready else LOAD_GLOBAL_CHECKED
+                    code.append((op, register[instr], instr.value, ir.global_names[instr.value]))
+                case 'store_global':
+                    code.append((STORE_GLOBAL, instr.value, register[instr.args[0]], None))
+                case 'load_late':
+                    code.append((LOAD_LATE, register[instr], (instr.value, register[instr.args[0]]),
+                                 ir.global_names[instr.value]))
+                case 'store_late':
+                    code.append((STORE_LATE, instr.value, register[instr.args[0]], None))
+                case 'call':
+                    args = tuple(register[arg] for arg in instr.args)
+                    if isinstance(instr.value, NativeFunction):
+                        op = CALL_OUTPUT if instr.value.writes_output else CALL_NATIVE
+                        code.append((op, register[instr], instr.value.function, args))
+                    else:
+                        code.append((CALL, register[instr], function_index[instr.value.name], args))
+                case 'jump':
+                    target = instr.targets[0]
+                    if target.phis:
+                        code.append(moves(b, target))
+                    jumps.append((len(code), 1, target))
+                    code.append((JUMP, None, None, None))
+                case 'branch':
+                    for position, target in zip((2, 3), instr.targets):
+                        if target.phis:
+                            edges.append((len(code), position, b, target))
+                        else:
+                            jumps.append((len(code), position, target))
+                    code.append((BRANCH, register[instr.args[0]], None, None))
+                case 'ret':
+                    code.append((RET, register[instr.args[0]], None, None))
+                case 'raise':
+                    code.append((RAISE, instr.value, None, None))
+                case op:
+                    args = [register[arg] for arg in instr.args]
+                    code.append((OPCODES[op], register[instr], *args, *([None] * (2 - len(args)))))
+    for index, position, pred, target in edges:
+        jumps.append((index, position, len(code)))
+        code.append(moves(pred, target))
+        jumps.append((len(code), 1, target))
+        code.append((JUMP, None, None, None))
+    for index, position, target in jumps:
+        instr = list(code[index])
+        instr[position] = target if isinstance(target, int) else start[target]
+        code[index] = tuple(instr)
+    return compiled
+
+# 把模块转换成 IR，经过 passes 中的优化后编译，返回一个执行整个程序的函数 (和 interpret() 一样调用 main)
+# stats 不为 None 时在其中记下每种优化处理的指令个数 (见 ir_passes.py)
+def compile_ir(module: ModuleNode, passes: Iterable[str] = IR_PASSES, stats: dict[str, int] | None = None):
+    start = compile_ir_resumable(module, passes, stats)
+
+    def run(output: TextIO | None = None, max_depth: int = DEFAULT_MAX_DEPTH) -> float:
+        return finish(start(output, max_depth=max_depth))
+    return run
+
+# 执行 start() 返回的生成器直到结束，返回 main 的返回值
+def finish(execution: Generator[None, None, float]) -> float:
+    try:
+        while True:
+            next(execution)
+    except StopIteration as stop:
+        return stop.value
+
+# 和 compile_ir() 一样，但返回的 start(output, slice_steps, max_depth) 得到一个生成器，每执行 slice_steps 步暂停 (yield) 一次，
+# 结束时生成器的返回值 (StopIteration.value) 就是 main 的返回值。slice_steps 为 None 时不暂停。
+# 一步是一次跳转 (每次循环都会跳回循环头) 或者一次函数调用，两次暂停之间执行的指令数因此有上限。
+# output 为 print 的输出目标 (见 interpreter.py 的 RunContext)
+def compile_ir_resumable(module: ModuleNode, passes: Iterable[str] = IR_PASSES, stats: dict[str, int] | None = None):
+    passes = list(passes)
+    # 初始化全局变量期间用的一份，之后用的一份
+    init_module = optimize_module(lower_module(module, False), passes, False)
+    ready_module = optimize_module(lower_module(module), passes, True, stats)
+    names = list(ready_module.functions)
+    function_index = { name: i for i, name in enumerate(names) }
+    init_functions = [compile_function(init_module.functions[name], function_index, False) for name in names]
+    functions = [compile_function(ready_module.functions[name], function_index, True) for name in names]
+    init = compile_function(init_module.init, function_index, False)
+    global_count = len(ready_module.global_names)
+
+    def start(output: TextIO | None = None, slice_steps: int | None = None,
+              max_depth: int = DEFAULT_MAX_DEPTH) -> Generator[None, None, float]:
+        if slice_steps is not None and slice_steps <= 0:
+            raise ValueError("slice_steps must be positive")
+        if max_depth <= 0:
+            raise ValueError("max_depth must be positive")
+        global_vars: list[float | None] = [None] * global_count
+        # 距离下一次暂停还剩的步数，初始化全局变量和执行 main 共用
+        # 执行时放在局部变量 steps 里，开始和结束时才和 remaining 同步
+        remaining = slice_steps or sys.maxsize
+
+        # 执行 function 直到它返回，table 为它 (和它调用的函数) 用的一份代码
+        def execute(table: list[CompiledFunction], function: CompiledFunction, args: list[float]):
+            nonlocal remaining
+            steps = remaining
+            # 调用栈中每一项保存调用者的 (代码, 寄存器, 返回地址, 存放返回值的寄存器)
+            frames: list[tuple[list[tuple], list, int, int]] = []
+            code = function.code
+            regs = function.registers[:]
+            for r, arg in zip(function.param_registers, args):
+                regs[r] = arg
+            pc = 0
+            while True:
+                op, a, b, c = code[pc]
+                pc += 1
+                if op == ADD: regs[a] = regs[b] + regs[c]
+                elif op == SUB: regs[a] = regs[b] - regs[c]
+                elif op == MUL: regs[a] = regs[b] * regs[c]
+                elif op == LT: regs[a] = float(regs[b] < regs[c])
+                elif op == BRANCH: pc = b if regs[a] else c
+                elif op == JUMP:
+                    pc = a
+                    steps -= 1
+                    if not steps:
+                        steps = slice_steps
+                        yield
+                elif op == MOVE:
+                    if len(a) == 1:
+                        regs[a[0]] = regs[b[0]]
+                    else:
+                        values = [regs[r] for r in b]
+                        for r, value in zip(a, values):
+                            regs[r] = value
+                elif op == LOAD_GLOBAL: regs[a] = global_vars[b]
+                elif op == STORE_GLOBAL: global_vars[a] = regs[b]
+                elif op == CALL:
+                    steps -= 1
+                    if not steps:
+                        steps = slice_steps
+                        yield
+                    if len(frames) >= max_depth:
+                        raise StackOverflowError(f"Stack overflow: call depth exceeds {max_depth} (calling {table[b].name})")
+                    callee = table[b]
+                    args = [regs[r] for r in c]
+                    frames.append((code, regs, pc, a))
+                    code = callee.code
+                    regs = callee.registers[:]
+                    for r, arg in zip(callee.param_registers, args):
+                        regs[r] = arg
+                    pc = 0
+                elif op == CALL_NATIVE: regs[a] = float(b(*[regs[r] for r in c]))
+                elif op == CALL_OUTPUT: regs[a] = float(b(*[regs[r] for r in c], output=output))
+                elif op == DIV: regs[a] = regs[b] / regs[c]
+                elif op == EQ: regs[a] = float(regs[b] == regs[c])
+                elif op == NE: regs[a] = float(regs[b] != regs[c])
+                elif op == LE: regs[a] = float(regs[b] <= regs[c])
+                elif op == GT: regs[a] = float(regs[b] > regs[c])
+                elif op == GE: regs[a] = float(regs[b] >= regs[c])
+                elif op == NEG: regs[a] = -regs[b]
+                elif op == NOT: regs[a] = float(not regs[b])
+                elif op == RET:
+                    value = regs[a]
+                    if not frames:
+                        remaining = steps
+                        return value
+                    code, regs, pc, a = frames.pop()
+                    regs[a] = value
+                elif op == CHECK:
+                    value = regs[b]
+                    if value is None: raise NameError(f"Variable not found: {c}")
+                    regs[a] = value
+                elif op == LOAD_GLOBAL_CHECKED:
+                    value = global_vars[b]
+                    if value is None: raise NameError(f"Variable not found: {c}")
+                    regs[a] = value
+                elif op == LOAD_LATE:
+                    value = global_vars[b[0]]
+                    if value is None: value = regs[b[1]]
+                    if value is None: raise NameError(f"Variable not found: {c}")
+                    regs[a] = value
+                elif op == STORE_LATE:
+                    if global_vars[a] is not None: global_vars[a] = regs[b]
+                elif op == RAISE: raise SyntaxError(a)
+                else: raise NotImplementedError(f"Unknown opcode: {op}")
+
+        def main():
+            yield from execute(init_functions, init, [])
+            if 'main' in function_index:
+                return (yield from execute(functions, functions[function_index['main']], []))
+            return 0.0
+        return main()
+    return start
+
+def run_ir(module: ModuleNode, passes: Iterable[str] = IR_PASSES, output: TextIO | None = None,
+           max_depth: int = DEFAULT_MAX_DEPTH) -> float:
+    return compile_ir(module, passes)(output, max_depth)
@@ -0,0 +1,327 @@
+from typing import Iterable
+from ir import *
+
+# IR 上的优化，每一遍都原地修改 IRFunction
+#
+#   copy_prop  复写传播: 参数都相同的 phi、读取一定已经赋过值的变量时的 check，直接换成参数本身
+#   fold       常量折叠: 操作数都是常量的运算在编译时算好，条件是常量的 branch 换成 jump
+#   cse        公共子表达式消除: 被支配的块中重复的运算直接用之前算好的值
+#   licm       循环不变量外提: 每次循环结果都一样的运算移到循环的前置块，只算一次
+#   dce        死代码消除: 删掉结果没有用到、也没有副作用的指令
+#
+# 和 optimizer.py 一样，优化前后的行为必须完全一样:
+#   - 可能抛出异常的指令 (见 ir.py 的 may_trap) 不会被删掉，也不会提前到可能不执行它的地方
+#   - 函数调用和全局变量的赋值保持原来的次数和顺序
+#   - globals_ready 为 False 时 (初始化全局变量期间)，读取全局变量也可能报错
+
+IR_PASSES = ('copy_prop', 'fold', 'cse', 'licm', 'dce')
+
+# 满足交换律的运算，以及交换操作数之后可以换成另一种运算的比较
+COMMUTATIVE_OPS = ('add', 'mul', 'eq', 'ne')
+SWAPPED_OPS = { 'gt': 'lt', 'ge': 'le' }
+
+# 优化整个模块 (原地修改并返回)
+# stats 不为 None 时在其中记下每种优化删掉 (licm 为移动) 的指令个数
+def optimize_module(module: IRModule, passes: Iterable[str] = IR_PASSES, globals_ready: bool = True,
+                    stats: dict[str, int] | None = None) -> IRModule:
+    passes = set(passes)
+    for name in passes:
+        if name not in IR_PASSES:
+            raise ValueError(f"Unknown IR optimization pass: {name}")
+    if stats is None:
+        stats = {}
+    for name in IR_PASSES:
+        stats.setdefault(name, 0)
+    writers = global_writers(module)
+    optimize_function(module.init, passes, False, writers, stats)
+    for ir in module.functions.values():
+        optimize_function(ir, passes, globals_ready, writers, stats)
+    return module
+
+def optimize_function(ir: IRFunction, passes: set[str], globals_ready: bool, writers: set[str],
+                      stats: dict[str, int]):
+    if 'copy_prop' in passes:
+        stats['copy_prop'] += copy_propagation(ir)
+    if 'fold' in passes:
+        stats['fold'] += constant_folding(ir)
+        if 'copy_prop' in passes:
+            stats['copy_prop'] += copy_propagation(ir)
+    if 'cse' in passes:
+        stats['cse'] += common_subexpressions(ir, writers)
+    if 'licm' in passes:
+        stats['licm'] += loop_invariant_code_motion(ir, globals_ready, writers)
+    if 'dce' in passes:
+        stats['dce'] += dead_code_elimination(ir, globals_ready)
+
+# 直接或者间接给全局变量赋值的函数，调用它们之后之前读到的全局变量就不能再用了
+def global_writers(module: IRModule) -> set[str]:
+    callers: dict[str, set[str]] = {}
+    writers: set[str] = set()
+    for name, ir in module.functions.items():
+        for b in ir.blocks:
+            for instr in b.instrs:
+                if instr.op in ('store_global', 'store_late'):
+                    writers.add(name)
+                elif instr.op == 'call' and not isinstance(instr.value, NativeFunction):
+                    callers.setdefault(instr.value.name, set()).add(name)
+    pending = list(writers)
+    while pending:
+        for caller in callers.get(pending.pop(), ()):
+            if caller not in writers:
+                writers.add(caller)
+                pending.append(caller)
+    return writers
+
+def writes_globals(instr: Instr, writers: set[str]) -> bool:
+    if instr.op in ('store_global', 'store_late'):
+        return True
+    return instr.op == 'call' and not isinstance(instr.value, NativeFunction) and instr.value.name in writers
+
+# 把 replacements 中的每条指令换成对应的值，并从块中删掉
+def replace_all(ir: IRFunction, replacements: dict[Instr, Instr]):
+    if not replacements:
+        return
+    def find(value: Instr) -> Instr:
+        while value in replacements:
+            value = replacements[value]
+        return value
+    for b in ir.blocks:
+        b.instrs = [instr for instr in b.instrs if instr not in replacements]
+        for instr in b.instrs:
+            instr.args = [find(arg) for arg in instr.args]
+
+def copy_propagation(ir: IRFunction) -> int:
+    replacements: dict[Instr, Instr] = {}
+    def find(value: Instr) -> Instr:
+        while value in replacements:
+            value = replacements[value]
+        return value
+
+    # 除了自己以外只有一个不同参数的 phi 就是这个参数，替换之后别的 phi 可能也变成这样，一直做到不变为止
+    changed = True
+    while changed:
+        changed = False
+        for b in ir.blocks:
+            for phi in b.phis:
+                if phi in replacements:
+                    continue
+                values = { find(arg) for arg in phi.args } - { phi }
+                if len(values) == 1:
+                    replacements[phi] = values.pop()
+                    changed = True
+
+    # 可能还没有赋值的值: undef，以及参数中有这样的值的 phi
+    maybe_undef: set[Instr] = set()
+    phis = [phi for b in ir.blocks for phi in b.phis if phi not in replacements]
+    changed = True
+    while changed:
+        changed = False
+        for phi in phis:
+            if phi not in maybe_undef and any(
+                    find(arg).op == 'undef' or find(arg) in maybe_undef for arg in phi.args):
+                maybe_undef.add(phi)
+                changed = True
+    for b in ir.blocks:
+        for instr in b.instrs:
+            if instr.op == 'check':
+                value = find(instr.args[0])
+                if value.op != 'undef' and value not in maybe_undef:
+                    replacements[instr] = value
+    replace_all(ir, replacements)
+    return len(replacements)
+
+# 和执行时的计算方式完全相同，除数为 0 时返回 None (留到执行时报错)
+def evaluate(op: str, args: list[float]) -> float | None:
+    match op:
+        case 'add': return args[0] + args[1]
+        case 'sub': return args[0] - args[1]
+        case 'mul': return args[0] * args[1]
+        case 'div': return args[0] / args[1] if args[1] != 0.0 else None
+        case 'eq': return float(args[0] == args[1])
+        case 'ne': return float(args[0] != args[1])
+        case 'lt': return float(args[0] < args[1])
+        case 'le': return float(args[0] <= args[1])
+        case 'gt': return float(args[0] > args[1])
+        case 'ge': return float(args[0] >= args[1])
+        case 'neg': return -args[0]
+        case 'not': return float(not args[0])
+        case _: return None
+
+def constant_folding(ir: IRFunction) -> int:
+    count = 0
+    for b in reverse_postorder(ir):
+        for instr in b.instrs:
+            if instr.args and all(arg.op == 'const' for arg in instr.args):
+                value = evaluate(instr.op, [arg.value for arg in instr.args])
+                if value is not None:
+                    instr.op, instr.args, instr.value = 'const', [], value
+                    count += 1
+        terminator = b.terminator
+        if terminator is not None and terminator.op == 'branch' and terminator.args[0].op == 'const':
+            taken, skipped = terminator.targets if terminator.args[0].value else reversed(terminator.targets)
+            # 不再走的那条边: 从后继的前驱中去掉，phi 中对应的参数也去掉
+            k = skipped.preds.index(b)
+            del skipped.preds[k]
+            for phi in skipped.phis:
+                del phi.args[k]
+            terminator.op, terminator.args, terminator.targets = 'jump', [], [taken]
+            count += 1
+    remove_unreachable(ir)
+    return count
+
+# 按支配树从上往下遍历，每个块可以用支配它的块中已经算过的值
+# 读取全局变量只在一个块之内合并，遇到给全局变量赋值 (包括调用会赋值的函数) 就作废
+def common_subexpressions(ir: IRFunction, writers: set[str]) -> int:
+    idom = dominators(ir)
+    children: dict[Block, list[Block]] = {}
+    for b in reverse_postorder(ir):
+        if b is not ir.entry:
+            children.setdefault(idom[b], []).append(b)
+
+    replacements: dict[Instr, Instr] = {}
+    available: dict[tuple, Instr] = {}
+    def find(value: Instr) -> Instr:
+        while value in replacements:
+            value = replacements[value]
+        return value
+
+    def key(instr: Instr) -> tuple | None:
+        match instr.op:
+            case 'const':
+                # 0.0 和 -0.0 相等但不能互换
+                return ('const', repr(instr.value))
+            case 'check':
+                return ('check', find(instr.args[0]).id)
+            case op if op in BINARY_OPS.values():
+                left, right = (find(arg).id for arg in instr.args)
+                if op in SWAPPED_OPS:
+                    op, left, right = SWAPPED_OPS[op], right, left
+                if op in COMMUTATIVE_OPS and right < left:
+                    left, right = right, left
+                return (op, left, right)
+            case op if op in UNARY_OPS.values():
+                return (op, find(instr.args[0]).id)
+            case _:
+                return None
+
+    # 用栈模拟递归，离开一个块时撤销它加进 available 的值
+    stack: list[tuple[Block, list[tuple] | None]] = [(ir.entry, None)]
+    while stack:
+        b, added = stack.pop()
+        if added is not None:
+            for k in added:
+                del available[k]
+            continue
+        added = []
+        stack.append((b, added))
+        globals_seen: dict[int, Instr] = {}
+        for instr in b.instrs:
+            if instr.op == 'load_global':
+                if instr.value in globals_seen:
+                    replacements[instr] = globals_seen[instr.value]
+                else:
+                    globals_seen[instr.value] = instr
+                continue
+            if writes_globals(instr, writers):
+                globals_seen.clear()
+                if instr.op == 'store_global':
+                    # 之后读取这个全局变量就是刚刚存进去的值
+                    globals_seen[instr.value] = find(instr.args[0])
+                continue
+            k = key(instr)
+            if k is None:
+                continue
+            if k in available:
+                replacements[instr] = available[k]
+            else:
+                available[k] = instr
+                added.append(k)
+        for child in reversed(children.get(b, [])):
+            stack.append((child, None))
+    replace_all(ir, replacements)
+    return len(replacements)
+
+# 自然循环: 回边 tail -> header (header 支配 tail) 以及从 tail 不经过 header 能往回走到的块
+# 返回 (循环头, 循环中的块) 的列表，同一个循环头的多条回边合并，内层循环在前
+def natural_loops(ir: IRFunction, idom: dict[Block, Block]) -> list[tuple[Block, set[Block]]]:
+    loops: dict[Block, set[Block]] = {}
+    for b in ir.blocks:
+        for succ in b.succs:
+            if dominates(idom, succ, b):
+                body = loops.setdefault(succ, {succ})
+                pending = [b]
+                while pending:
+                    member = pending.pop()
+                    if member not in body:
+                        body.add(member)
+                        pending.extend(member.preds)
+    return sorted(loops.items(), key=lambda loop: len(loop[1]))
+
+def loop_invariant_code_motion(ir: IRFunction, globals_ready: bool, writers: set[str]) -> int:
+    idom = dominators(ir)
+    order = reverse_postorder(ir)
+    count = 0
+    for header, body in natural_loops(ir, idom):
+        # 循环外只有一个前驱，并且它只跳到循环头 (ir.py 中每个 while 都生成了这样的前置块)
+        outside = [pred for pred in header.preds if pred not in body]
+        if len(outside) != 1 or outside[0].succs != [header]:
+            continue
+        preheader = outside[0]
+        clobbered: set[int] = set()
+        clobbers_all = False
+        for b in body:
+            for instr in b.instrs:
+                if instr.op == 'store_global':
+                    clobbered.add(instr.value)
+                elif writes_globals(instr, writers):
+                    clobbers_all = True
+
+        hoisted: list[Instr] = []
+        def invariant(instr: Instr) -> bool:
+            return all(arg.block not in body for arg in instr.args)
+
+        for b in order:
+            if b not in body:
+                continue
+            # 循环头在每次进入循环时都会先执行，其中前面没有副作用和可能报错的指令时，
+            # 可能报错的指令也可以提前: 第一次执行到它时就会报同样的错，之后每次的结果都一样
+            at_start = b is header
+            for instr in b.instrs:
+                if instr.op == 'phi':
+                    continue
+                movable = False
+                if instr.op == 'load_global':
+                    movable = not clobbers_all and instr.value not in clobbered and (globals_ready or at_start)
+                elif instr.op in ('const', *BINARY_OPS.values(), *UNARY_OPS.values(), 'check'):
+                    movable = invariant(instr) and (not may_trap(instr, globals_ready) or at_start)
+                if movable:
+                    hoisted.append(instr)
+                    # 移出去之后 instr.block 不再属于循环，用到它的指令也就成了不变量
+                    instr.block = preheader
+                elif has_effect(instr) or may_trap(instr, globals_ready):
+                    at_start = False
+            b.instrs = [instr for instr in b.instrs if instr.block is b]
+        terminator = preheader.instrs.pop()
+        preheader.instrs += hoisted
+        preheader.instrs.append(terminator)
+        count += len(hoisted)
+    return count
+
+def dead_code_elimination(ir: IRFunction, globals_ready: bool) -> int:
+    live: set[Instr] = set()
+    pending: list[Instr] = []
+    for b in ir.blocks:
+        for instr in b.instrs:
+            if has_effect(instr) or may_trap(instr, globals_ready):
+                pending.append(instr)
+    while pending:
+        instr = pending.pop()
+        if instr not in live:
+            live.add(instr)
+            pending.extend(instr.args)
+    count = 0
+    for b in ir.blocks:
+        count += len(b.instrs)
+        b.instrs = [instr for instr in b.instrs if instr in live]
+        count -= len(b.instrs)
+    return count
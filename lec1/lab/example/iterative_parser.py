@@ -0,0 +1,229 @@
+from typing import Iterable
+from parser import *
+
+# 不使用递归的语法分析器，产生的语法树和 parser.py 中的递归下降解析器相同
+#
+# 递归下降解析器每多一个运算符、每多一层括号或语句嵌套，都要多占一层 Python 调用栈，
+# 几千项的长表达式或者嵌套很深的代码会触发 RecursionError。
+# 这里表达式用算符优先 (shunting-yard) 的方法解析，由下面的优先级表驱动一个循环；
+# 括号、函数调用、语句块、if、while 的嵌套都记录在显式的栈里，
+# 所以解析任意长、任意深的代码都不会加深 Python 调用栈。
+#
+# 递归下降解析器的文法是右递归的，a - b - c 会被解析成 a - (b - c)。
+# 这里默认按照通常的数学习惯左结合，即 (a - b) - c；
+# 传入 right_nested=True 则得到和原来完全相同的右嵌套语法树。
+
+# 二元运算符的优先级，数字越大结合得越紧
+BINARY_PRECEDENCE = {
+    '==': 1, '!=': 1, '<': 1, '<=': 1, '>': 1, '>=': 1,
+    '+': 2, '-': 2,
+    '*': 3, '/': 3,
+}
+
+UNARY_OPERATORS = ('+', '-', '!')
+
+# 运算符栈中元素的种类
+ROOT = 0    # 整个表达式的开头
+GROUP = 1   # 左括号
+CALL = 2    # 函数调用的左括号，内容为 (函数名, 已经解析出的实参)
+ASSIGN = 3  # 赋值，内容为被赋值的变量
+UNARY = 4   # 一元运算符
+BINARY = 5  # 二元运算符
+
+def parse_iterative(tokens: Iterable[Token] | TokenBuffer, right_nested: bool = False) -> ModuleNode:
+    available, advance, peek_type, peek_text, next_type, match, where = token_reader(tokens)
+
+    def parse_module() -> ModuleNode:
+        functions: list[FunctionNode] = []
+        global_vars: list[BinaryExpr] = []
+        while available():
+            match peek_type():
+                case 'function':
+                    functions.append(parse_function())
+                case 'identifier':
+                    assign = parse_expression()
+                    match(';')
+                    assert isinstance(assign, BinaryExpr) and assign.operator == '='
+                    global_vars.append(assign)
+                case unexpected_type:
+                    raise Exception(f"Unexpected token: {unexpected_type}{where()}")
+        return ModuleNode(functions, global_vars)
+
+    def parse_function() -> FunctionNode:
+        match('function')
+        name = match('identifier')
+        match('(')
+        params: list[str] = []
+        if peek_type() != ')':
+            params.append(match('identifier'))
+            while peek_type() != ')':
+                match(',')
+                params.append(match('identifier'))
+        match(')')
+        if peek_type() != '{':
+            match('{')
+        body = parse_statement()
+        return FunctionNode(name, params, body)
+
+    # 解析一条语句 (包括其中嵌套的所有语句)
+    # stack 中保存还没有解析完的复合语句，每一项的第一个元素是种类:
+    #   ['block', 已解析的语句列表]
+    #   ['if', 条件, 真分支]        真分支为 None 表示还在解析真分支
+    #   ['while', 条件]
+    def parse_statement() -> StatementNode:
+        stack: list[list] = []
+        while True:
+            # 第一步: 向下找到一条完整的语句，途中遇到的复合语句先压栈
+            match peek_type():
+                case '{':
+                    advance()
+                    if peek_type() == '}':
+                        advance()
+                        node = BlockStat([])
+                    else:
+                        stack.append(['block', []])
+                        continue
+                case 'if':
+                    match('if')
+                    match('(')
+                    condition = parse_expression()
+                    match(')')
+                    stack.append(['if', condition, None])
+                    continue
+                case 'while':
+                    match('while')
+                    match('(')
+                    condition = parse_expression()
+                    match(')')
+                    stack.append(['while', condition])
+                    continue
+                case 'continue':
+                    match('continue')
+                    match(';')
+                    node = ContinueStat()
+                case 'break':
+                    match('break')
+                    match(';')
+                    node = BreakStat()
+                case 'return':
+                    match('return')
+                    if peek_type() == ';':
+                        match(';')
+                        node = ReturnStat()
+                    else:
+                        value = parse_expression()
+                        match(';')
+                        node = ReturnStat(value)
+                case _:
+                    expr = parse_expression()
+                    match(';')
+                    node = ExprEvalStat(expr)
+
+            # 第二步: 把完整的语句交给外层的复合语句，外层因此完整的话继续向上交
+            while stack:
+                frame = stack[-1]
+                if frame[0] == 'block':
+                    frame[1].append(node)
+                    if peek_type() != '}':
+                        break
+                    advance()
+                    node = BlockStat(frame[1])
+                elif frame[0] == 'if':
+                    if frame[2] is None and peek_type() == 'else':
+                        match('else')
+                        frame[2] = node
+                        break
+                    if frame[2] is None:
+                        node = IfStat(frame[1], node)
+                    else:
+                        node = IfStat(frame[1], frame[2], node)
+                else:
+                    node = WhileStat(frame[1], node)
+                stack.pop()
+            else:
+                return node
+
+    # 解析一个表达式
+    # operands 是操作数栈，operators 是运算符栈，元素为 (种类, 内容)
+    # 每个 BINARY 在 operands 中都对应着它的左操作数
+    def parse_expression() -> ExpressionNode:
+        operands: list[ExpressionNode] = []
+        operators: list[tuple[int, object]] = [(ROOT, None)]
+        # 是否处在一个表达式的开头，只有这里可以出现赋值
+        at_start = True
+
+        while True:
+            # 期待一个操作数，先收集它前面的赋值和一元运算符
+            if at_start:
+                while available(1) and peek_type() == 'identifier' and peek_type(1) == '=':
+                    operators.append((ASSIGN, Variable(match('identifier'))))
+                    match('=')
+            while peek_type() in UNARY_OPERATORS:
+                operators.append((UNARY, next_type()))
+
+            match peek_type():
+                case 'number':
+                    operand = NumberConstant(float(match('number')))
+                case 'identifier':
+                    if available(1) and peek_type(1) == '(':
+                        callee = match('identifier')
+                        match('(')
+                        if peek_type() != ')':
+                            operators.append((CALL, (callee, [])))
+                            at_start = True
+                            continue
+                        match(')')
+                        operand = CallExpr(callee, [])
+                    else:
+                        operand = Variable(match('identifier'))
+                case '(':
+                    advance()
+                    operators.append((GROUP, None))
+                    at_start = True
+                    continue
+                case unexpected_type:
+                    raise SyntaxError(f"Unexpected token: {unexpected_type}{where()}")
+
+            # 得到了一个操作数，接下来是二元运算符，或者当前这一层 (括号、实参、整个表达式) 结束
+            while True:
+                # 一元运算符比二元运算符结合得更紧，立即结合
+                while operators[-1][0] == UNARY:
+                    operand = UnaryExpr(operators.pop()[1], operand)
+
+                precedence = BINARY_PRECEDENCE.get(peek_type()) if available() else None
+                if precedence is not None:
+                    # 先归约栈顶优先级更高的二元运算，左结合时优先级相同的也要先归约
+                    while operators[-1][0] == BINARY:
+                        top_precedence = BINARY_PRECEDENCE[operators[-1][1]]
+                        if top_precedence < precedence or (top_precedence == precedence and right_nested):
+                            break
+                        operand = BinaryExpr(operators.pop()[1], operands.pop(), operand)
+                    operands.append(operand)
+                    operators.append((BINARY, next_type()))
+                    at_start = False
+                    break
+
+                # 当前这一层结束，归约掉这一层剩下的所有运算
+                while operators[-1][0] == BINARY:
+                    operand = BinaryExpr(operators.pop()[1], operands.pop(), operand)
+                while operators[-1][0] == ASSIGN:
+                    operand = BinaryExpr('=', operators.pop()[1], operand)
+
+                kind, content = operators.pop()
+                if kind == ROOT:
+                    return operand
+                elif kind == GROUP:
+                    match(')')
+                else:
+                    callee, args = content
+                    args.append(operand)
+                    if peek_type() == ',':
+                        advance()
+                        operators.append((CALL, content))
+                        at_start = True
+                        break
+                    match(')')
+                    operand = CallExpr(callee, args)
+
+    # 调用 起始文法规则 (module) 开始匹配
+    return parse_module()
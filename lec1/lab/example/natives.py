@@ -0,0 +1,104 @@
+import sys
+from dataclasses import dataclass
+from typing import Callable, TextIO
+from parser import *
+from sinks import format_line
+
+# 内置函数 (用 Python 实现的函数) 的注册表，以及链接: 在执行前把每个调用表达式绑定到被调用的函数
+#
+# 内置函数优先于同名的 slang 函数。arity 为 None 表示接受任意个实参 (比如 print)。
+# pure 表示结果只由实参决定、没有副作用，纯函数分析 (purity.py) 会用到。
+# 内置函数的返回值总是转换成 float，和 slang 中的其它值一致。
+# writes_output 表示函数会输出 (比如 print)，调用时通过关键字参数 output 传入这次运行的输出 (见 interpreter.py 的 RunContext)。
+#
+#   import math
+#   from natives import register_builtin
+#   register_builtin('sin', math.sin, 1)
+#
+# 链接之后解释器调用函数时不再按名字查找，也不需要再检查实参个数;
+# 调用不存在的函数、实参个数不对在链接时就会报错，而不是执行到这个调用时才报错。
+# 所有后端 (interpret、interpret_flat、closure、compiler / vm、transpiler、ir) 执行前都会链接，
+# 注册的内置函数在每个后端中都可以调用，出错时报的错误也一样。
+
+@dataclass
+class NativeFunction:
+    name: str
+    function: Callable[..., float]
+    arity: int | None = None
+    pure: bool = True
+    writes_output: bool = False
+
+# output 为 None 时写到当时的 sys.stdout；一次调用只 write 一次 (见 sinks.py)
+def _print(*args: float, output: TextIO | None = None) -> float:
+    (sys.stdout if output is None else output).write(format_line(args))
+    return 0.0
+
+BUILTINS: dict[str, NativeFunction] = {}
+
+def register_builtin(name: str, function: Callable[..., float], arity: int | None, pure: bool = True,
+                     writes_output: bool = False):
+    if not name.isidentifier():
+        raise ValueError(f"Invalid builtin name: {name!r}")
+    if arity is not None and arity < 0:
+        raise ValueError("arity must be non-negative")
+    BUILTINS[name] = NativeFunction(name, function, arity, pure, writes_output)
+
+def unregister_builtin(name: str):
+    del BUILTINS[name]
+
+register_builtin('print', _print, None, pure=False, writes_output=True)
+
+# 把 module 中所有的调用表达式绑定到被调用的函数 (填写 CallExpr.target)
+# builtins 默认为全局的注册表；函数不存在时抛出 NameError，实参个数不对时抛出 TypeError
+def link_calls(module: ModuleNode, builtins: dict[str, NativeFunction] | None = None) -> ModuleNode:
+    if builtins is None:
+        builtins = BUILTINS
+    function_map: dict[str, FunctionNode] = {}
+    for function in module.functions:
+        function_map[function.name] = function
+
+    def link_call(expr: CallExpr, where: str):
+        target = builtins.get(expr.callee) or function_map.get(expr.callee)
+        if target is None:
+            raise NameError(f"Function not found: {expr.callee} (in {where})")
+        arity = target.arity if isinstance(target, NativeFunction) else len(target.parameters)
+        if arity is not None and arity != len(expr.arguments):
+            raise TypeError(f"Function {expr.callee} takes {arity} arguments, got {len(expr.arguments)} (in {where})")
+        expr.target = target
+
+    def visit_expr(expr: ExpressionNode, where: str):
+        match expr:
+            case BinaryExpr():
+                visit_expr(expr.left, where)
+                visit_expr(expr.right, where)
+            case UnaryExpr():
+                visit_expr(expr.operand, where)
+            case CallExpr():
+                for arg in expr.arguments:
+                    visit_expr(arg, where)
+                link_call(expr, where)
+
+    def visit_stat(stat: StatementNode, where: str):
+        match stat:
+            case BlockStat():
+                for s in stat.statements:
+                    visit_stat(s, where)
+            case IfStat():
+                visit_expr(stat.condition, where)
+                visit_stat(stat.branch_true, where)
+                if stat.branch_false is not None:
+                    visit_stat(stat.branch_false, where)
+            case WhileStat():
+                visit_expr(stat.condition, where)
+                visit_stat(stat.body, where)
+            case ExprEvalStat():
+                visit_expr(stat.expr, where)
+            case ReturnStat():
+                if stat.return_value is not None:
+                    visit_expr(stat.return_value, where)
+
+    for function in module.functions:
+        visit_stat(function.body, f"function {function.name}")
+    for var in module.global_vars:
+        visit_expr(var.right, "global initializer")
+    return module
@@ -0,0 +1,209 @@
+import math
+from typing import Iterable
+from parser import *
+from resolver import resolve
+
+# 语法树优化: 在 parse() 之后、执行之前化简语法树
+#
+#   fold         常量折叠: 操作数都是常量的二元、一元运算在编译时算好
+#   simplify     代数化简: x * 1、x / 1、x - 0、+x、-(-x) 换成 x，布尔上下文中 !!x 换成 x
+#   dead_branch  条件是常量的 if 只保留会执行的分支，while (0) 整个删掉
+#   unreachable  语句块中 return / break / continue 之后的语句永远执行不到，删掉
+#
+# 优化前后程序的行为必须完全一样，包括 print 的输出和浮点数的每一位:
+#   - 除数为 0 的除法不折叠，留到运行时照常报错
+#   - x + 0 不能化简: x 为 -0.0 时 x + 0 的结果是 0.0，只有 x 一定不是 -0.0 (比如比较的结果) 时才化简
+#   - 函数调用和赋值总是保留，它们的求值次数和顺序都不变
+# 删掉死代码之后重新做作用域解析，只在死代码里赋值的局部变量不再占用槽位，
+# 其它地方读取它时和优化前一样执行到才报错 (见 resolver.py)
+
+PASSES = ('fold', 'simplify', 'dead_branch', 'unreachable')
+
+COMPARISON_OPERATORS = ('==', '!=', '<', '<=', '>', '>=')
+
+# 优化 module (原地修改并返回)
+# passes 为要启用的优化，stats 不为 None 时在其中记下每种优化删掉的结点个数
+def optimize(module: ModuleNode, passes: Iterable[str] = PASSES, stats: dict[str, int] | None = None) -> ModuleNode:
+    passes = set(passes)
+    for name in passes:
+        if name not in PASSES:
+            raise ValueError(f"Unknown optimization pass: {name}")
+    if stats is None:
+        stats = {}
+    for name in PASSES:
+        stats.setdefault(name, 0)
+
+    def count_nodes(node: SyntaxTreeNode | None) -> int:
+        match node:
+            case None: return 0
+            case BlockStat(): return 1 + sum(count_nodes(s) for s in node.statements)
+            case IfStat(): return 1 + count_nodes(node.condition) + count_nodes(node.branch_true) + count_nodes(node.branch_false)
+            case WhileStat(): return 1 + count_nodes(node.condition) + count_nodes(node.body)
+            case ExprEvalStat(): return 1 + count_nodes(node.expr)
+            case ReturnStat(): return 1 + count_nodes(node.return_value)
+            case BinaryExpr(): return 1 + count_nodes(node.left) + count_nodes(node.right)
+            case UnaryExpr(): return 1 + count_nodes(node.operand)
+            case CallExpr(): return 1 + sum(count_nodes(arg) for arg in node.arguments)
+            case _: return 1
+
+    # 把 node 换成 replacement，记下这次优化删掉的结点个数
+    def replace(name: str, node: SyntaxTreeNode, replacement: SyntaxTreeNode | None):
+        stats[name] += count_nodes(node) - count_nodes(replacement)
+        return replacement
+
+    def is_positive_zero(value: float) -> bool:
+        return value == 0.0 and math.copysign(1.0, value) > 0
+
+    def is_negative_zero(value: float) -> bool:
+        return value == 0.0 and math.copysign(1.0, value) < 0
+
+    # 表达式的值是否一定是 0.0 或 1.0
+    def is_boolean(expr: ExpressionNode) -> bool:
+        match expr:
+            case BinaryExpr(operator=op) if op in COMPARISON_OPERATORS: return True
+            case UnaryExpr(operator='!'): return True
+            case NumberConstant(value): return value == 1.0 or is_positive_zero(value)
+            case _: return False
+
+    # 语句执行到最后是否一定会跳走 (return / break / continue)
+    def always_exits(stat: StatementNode) -> bool:
+        match stat:
+            case ReturnStat() | BreakStat() | ContinueStat(): return True
+            case BlockStat(): return any(always_exits(s) for s in stat.statements)
+            case IfStat(): return stat.branch_false is not None and always_exits(stat.branch_true) and always_exits(stat.branch_false)
+            case _: return False
+
+    def fold_binary(operator: str, left: float, right: float) -> float | None:
+        match operator:
+            case '+': return left + right
+            case '-': return left - right
+            case '*': return left * right
+            case '/': return left / right if right != 0.0 else None
+            case '==': return float(left == right)
+            case '!=': return float(left != right)
+            case '<': return float(left < right)
+            case '<=': return float(left <= right)
+            case '>': return float(left > right)
+            case '>=': return float(left >= right)
+            case _: return None
+
+    def fold_unary(operator: str, operand: float) -> float | None:
+        match operator:
+            case '+': return operand
+            case '-': return -operand
+            case '!': return float(not operand)
+            case _: return None
+
+    # boolean 为真表示只关心表达式的真假 (if / while 的条件，! 的操作数)
+    def optimize_expr(expr: ExpressionNode, boolean: bool = False) -> ExpressionNode:
+        match expr:
+            case BinaryExpr(operator='=', left=Variable()):
+                expr.right = optimize_expr(expr.right)
+                return expr
+            case BinaryExpr():
+                expr.left = optimize_expr(expr.left)
+                expr.right = optimize_expr(expr.right)
+                return optimize_binary(expr)
+            case UnaryExpr():
+                expr.operand = optimize_expr(expr.operand, expr.operator == '!')
+                return optimize_unary(expr, boolean)
+            case CallExpr():
+                expr.arguments = [optimize_expr(arg) for arg in expr.arguments]
+                return expr
+            case _:
+                return expr
+
+    def optimize_binary(expr: BinaryExpr) -> ExpressionNode:
+        left, right, op = expr.left, expr.right, expr.operator
+        if 'fold' in passes and isinstance(left, NumberConstant) and isinstance(right, NumberConstant):
+            value = fold_binary(op, left.value, right.value)
+            if value is not None:
+                return replace('fold', expr, NumberConstant(value))
+        if 'simplify' in passes:
+            # 以下化简对任何浮点数 (包括 -0.0、无穷大和 NaN) 都精确成立
+            if isinstance(right, NumberConstant):
+                c = right.value
+                if (op == '*' or op == '/') and c == 1.0:
+                    return replace('simplify', expr, left)
+                if op == '-' and is_positive_zero(c):
+                    return replace('simplify', expr, left)
+                if op == '+' and (is_negative_zero(c) or (c == 0.0 and is_boolean(left))):
+                    return replace('simplify', expr, left)
+            if isinstance(left, NumberConstant):
+                c = left.value
+                if op == '*' and c == 1.0:
+                    return replace('simplify', expr, right)
+                if op == '+' and (is_negative_zero(c) or (c == 0.0 and is_boolean(right))):
+                    return replace('simplify', expr, right)
+        return expr
+
+    def optimize_unary(expr: UnaryExpr, boolean: bool) -> ExpressionNode:
+        operand, op = expr.operand, expr.operator
+        if 'fold' in passes and isinstance(operand, NumberConstant):
+            value = fold_unary(op, operand.value)
+            if value is not None:
+                return replace('fold', expr, NumberConstant(value))
+        if 'simplify' in passes:
+            if op == '+':
+                return replace('simplify', expr, operand)
+            if op == '-' and isinstance(operand, UnaryExpr) and operand.operator == '-':
+                return replace('simplify', expr, operand.operand)
+            if op == '!' and isinstance(operand, UnaryExpr) and operand.operator == '!':
+                # !!x 的值是 0.0 或 1.0，只在只关心真假，或者 x 本身就是 0.0 / 1.0 时才能换成 x
+                if boolean or is_boolean(operand.operand):
+                    return replace('simplify', expr, operand.operand)
+        return expr
+
+    # 返回优化后的语句，整条语句被删掉时返回 None
+    def optimize_stat(stat: StatementNode) -> StatementNode | None:
+        match stat:
+            case BlockStat():
+                return optimize_block(stat)
+            case IfStat():
+                stat.condition = optimize_expr(stat.condition, True)
+                stat.branch_true = optimize_branch(stat.branch_true)
+                if stat.branch_false is not None:
+                    stat.branch_false = optimize_stat(stat.branch_false)
+                if 'dead_branch' in passes and isinstance(stat.condition, NumberConstant):
+                    return replace('dead_branch', stat, stat.branch_true if stat.condition.value else stat.branch_false)
+                return stat
+            case WhileStat():
+                stat.condition = optimize_expr(stat.condition, True)
+                stat.body = optimize_branch(stat.body)
+                if 'dead_branch' in passes and isinstance(stat.condition, NumberConstant) and not stat.condition.value:
+                    return replace('dead_branch', stat, None)
+                return stat
+            case ExprEvalStat():
+                stat.expr = optimize_expr(stat.expr)
+                return stat
+            case ReturnStat():
+                if stat.return_value is not None:
+                    stat.return_value = optimize_expr(stat.return_value)
+                return stat
+            case _:
+                return stat
+
+    # if 的真分支和 while 的循环体不能为空，删掉了就用空语句块代替
+    def optimize_branch(stat: StatementNode) -> StatementNode:
+        result = optimize_stat(stat)
+        return result if result is not None else BlockStat([])
+
+    def optimize_block(block: BlockStat) -> BlockStat:
+        statements: list[StatementNode] = []
+        for i, stat in enumerate(block.statements):
+            result = optimize_stat(stat)
+            if result is None:
+                continue
+            statements.append(result)
+            if 'unreachable' in passes and always_exits(result):
+                for dead in block.statements[i + 1:]:
+                    replace('unreachable', dead, None)
+                break
+        block.statements = statements
+        return block
+
+    for function in module.functions:
+        function.body = optimize_block(function.body)
+    for var in module.global_vars:
+        var.right = optimize_expr(var.right)
+    return resolve(module)
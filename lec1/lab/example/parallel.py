@@ -0,0 +1,88 @@
+import io
+import os
+import sys
+from concurrent.futures import Executor, ThreadPoolExecutor, ProcessPoolExecutor
+from dataclasses import dataclass
+from typing import Iterable
+from parser import ModuleNode
+from resolver import resolve
+from natives import link_calls
+from interpreter import link, RunContext
+
+# 在一个进程中同时执行很多个互相独立的 slang 程序
+#
+# 每次运行有自己的 RunContext (见 interpreter.py): 全局变量、调用栈和输出都不和别的运行共享，
+# print 的输出写进这次运行自己的 StringIO，不经过 sys.stdout。
+# 语法树在分发之前就解析、链接好，执行时各个线程只读语法树。
+#
+# 有 GIL 的 CPython 上多个线程不能同时执行 Python 代码，线程池只能用一个核，这时默认改用进程池
+# (模块通过 pickle 传给子进程，内置函数需要是模块级的函数)；
+# 自由线程 (free-threaded，比如 3.13t) 的 CPython 上直接用线程池，没有进程间传输的开销。
+
+@dataclass
+class RunResult:
+    # main 的返回值 (出错时为 None)，print 的全部输出，以及错误信息 ("NameError: ..."，没有出错时为 None)
+    value: float | None
+    output: str
+    error: str | None = None
+
+def gil_enabled() -> bool:
+    # Python 3.13 之前没有 sys._is_gil_enabled，总是有 GIL
+    return getattr(sys, '_is_gil_enabled', lambda: True)()
+
+# 执行一个已经解析、链接好的模块
+def run_linked(module: ModuleNode) -> RunResult:
+    context = RunContext(output=io.StringIO())
+    try:
+        function_map, call = link(module, context=context, linked=True)
+        value = call('main', []) if 'main' in function_map else 0.0
+    except Exception as e:
+        return RunResult(None, context.output.getvalue(), f"{type(e).__name__}: {e}")
+    return RunResult(value, context.output.getvalue())
+
+# 子进程中执行: 模块经过 pickle 之后链接的结果要按子进程的内置函数重新确定
+def run_in_process(module: ModuleNode) -> RunResult:
+    try:
+        link_calls(resolve(module))
+    except Exception as e:
+        return RunResult(None, '', f"{type(e).__name__}: {e}")
+    return run_linked(module)
+
+# 执行 modules 中的每个模块，按顺序返回每个模块的结果
+# workers 默认为 CPU 核数；executor 为 'thread'、'process' 或者 'auto' (有 GIL 时用进程，否则用线程)
+def run_many(modules: Iterable[ModuleNode], workers: int | None = None, executor: str = 'auto') -> list[RunResult]:
+    modules = list(modules)
+    if workers is None:
+        workers = os.cpu_count() or 1
+    if workers <= 0:
+        raise ValueError("workers must be positive")
+    if executor == 'auto':
+        executor = 'process' if gil_enabled() and workers > 1 else 'thread'
+    if executor not in ('thread', 'process'):
+        raise ValueError(f"Unknown executor: {executor}")
+
+    results: list[RunResult | None] = [None] * len(modules)
+    pending: list[int] = []
+    # 同一个模块可能出现多次，只需要链接一次
+    linked: set[int] = set()
+    for i, module in enumerate(modules):
+        if id(module) not in linked:
+            try:
+                link_calls(resolve(module))
+            except Exception as e:
+                results[i] = RunResult(None, '', f"{type(e).__name__}: {e}")
+                continue
+        linked.add(id(module))
+        pending.append(i)
+
+    pool: Executor
+    if executor == 'thread':
+        pool, run = ThreadPoolExecutor(max_workers=workers), run_linked
+    else:
+        pool, run = ProcessPoolExecutor(max_workers=workers), run_in_process
+    with pool:
+        # 进程池每次传一批模块，减少进程间通信的次数
+        chunksize = max(1, len(pending) // (workers * 4)) if executor == 'process' else 1
+        for i, result in zip(pending, pool.map(run, [modules[i] for i in pending], chunksize=chunksize)):
+            results[i] = result
+    return results
@@ -1,118 +1,213 @@
-from dataclasses import dataclass
-from tokenizer import Token
+from collections import deque
+from dataclasses import dataclass, field
+from typing import Iterable
+from tokenizer import Token, TokenBuffer, KIND_NAMES
 
 # dataclass 可以理解为只需要声明了字段就会生成构造器，比较方便
 
 class SyntaxTreeNode:
-    pass
+    __slots__ = ()
 
 class StatementNode(SyntaxTreeNode):
-    pass
+    __slots__ = ()
 
 class ExpressionNode(SyntaxTreeNode):
-    pass
+    __slots__ = ()
 
-@dataclass
+@dataclass(slots=True)
 class ModuleNode(SyntaxTreeNode):
     functions: list['FunctionNode']
     global_vars: list['BinaryExpr']
+    # 以下字段由 resolver.py 填写: 全局变量的槽位，以及初始化全局变量时用到的临时局部变量
+    global_names: list[str] = field(default_factory=list, compare=False, repr=False)
+    local_names: list[str] = field(default_factory=list, compare=False, repr=False)
 
-@dataclass
+@dataclass(slots=True)
 class FunctionNode(SyntaxTreeNode):
     name: str
     parameters: list[str]
     body: 'BlockStat'
+    # 由 resolver.py 填写: 每个局部变量槽位对应的名字，前几个槽位是形参
+    local_names: list[str] = field(default_factory=list, compare=False, repr=False)
 
-@dataclass
+@dataclass(slots=True)
 class BlockStat(StatementNode):
     statements: list[StatementNode]
 
-@dataclass
+@dataclass(slots=True)
 class IfStat(StatementNode):
     condition: ExpressionNode
     branch_true: StatementNode
     branch_false: StatementNode | None = None
 
-@dataclass
+@dataclass(slots=True)
 class WhileStat(StatementNode):
     condition: ExpressionNode
     body: StatementNode
 
+@dataclass(slots=True)
 class ContinueStat(StatementNode):
     pass
 
+@dataclass(slots=True)
 class BreakStat(StatementNode):
     pass
 
-@dataclass
+@dataclass(slots=True)
 class ExprEvalStat(StatementNode):
     expr: ExpressionNode
 
-@dataclass
+@dataclass(slots=True)
 class ReturnStat(StatementNode):
     return_value: ExpressionNode | None = None
 
-@dataclass
+@dataclass(slots=True)
 class BinaryExpr(ExpressionNode):
     operator: str
     left: ExpressionNode
     right: ExpressionNode
 
-@dataclass
+@dataclass(slots=True)
 class UnaryExpr(ExpressionNode):
     operator: str
     operand: ExpressionNode
 
-@dataclass
+@dataclass(slots=True)
 class Variable(ExpressionNode):
     name: str
+    # 由 resolver.py 填写: 变量在局部或全局变量表中的下标
+    slot: int = field(default=-1, compare=False, repr=False)
+    is_global: bool = field(default=False, compare=False, repr=False)
+    # 全局变量在初始化之前可能被这个函数赋值时 (见 resolver.py)，全局变量还没有初始化期间用的局部变量槽位，否则为 -1
+    fallback_slot: int = field(default=-1, compare=False, repr=False)
 
-@dataclass
+@dataclass(slots=True)
 class NumberConstant(ExpressionNode):
     value: float
 
-@dataclass
+@dataclass(slots=True)
 class CallExpr(ExpressionNode):
     callee: str
     arguments: list[ExpressionNode]
-
-# 递归下降解析器
-def parse(tokens: list[Token]) -> ModuleNode:
-    pos = 0
-    maxlen = len(tokens)
-
-    # 查询 (当前位置 + 偏移) 的词元是否可用，默认偏移为0
-    def available(offset: int = 0) -> bool:
-        nonlocal maxlen, pos
-        return pos + offset < maxlen
-
-    # 消费一个词元
-    def advance(count: int = 1) -> None:
-        nonlocal pos
-        pos += count
-
-    # 查询下一个词元的类型
-    def peek_type(offset: int = 0) -> str:
-        return peek(offset).type
-
-    # 查询下一个词元，但不消费
-    def peek(offset: int = 0) -> Token:
-        nonlocal tokens, pos
-        return tokens[pos + offset]
-    
-    # 查询下一个词元并消费掉
-    def next() -> Token:
-        token = peek()
+    # 由 natives.py 的 link_calls() 填写: 被调用的 FunctionNode 或者内置函数 (NativeFunction)
+    target: object = field(default=None, compare=False, repr=False)
+
+# 读取词元的一组辅助函数，递归下降解析器和 iterative_parser.py 共用
+# tokens 可以是词元列表、tokenize_compact 得到的紧凑词元表，
+# 也可以是 iter_tokens 这样逐个产生词元的迭代器
+def token_reader(tokens: Iterable[Token] | TokenBuffer):
+    if isinstance(tokens, list):
+        pos = 0
+        maxlen = len(tokens)
+
+        # 查询 (当前位置 + 偏移) 的词元是否可用，默认偏移为0
+        def available(offset: int = 0) -> bool:
+            nonlocal maxlen, pos
+            return pos + offset < maxlen
+
+        # 消费一个词元
+        def advance(count: int = 1) -> None:
+            nonlocal pos
+            pos += count
+
+        # 查询下一个词元的类型
+        def peek_type(offset: int = 0) -> str:
+            nonlocal tokens, pos
+            return tokens[pos + offset].type
+
+        # 查询下一个词元的文本
+        def peek_text(offset: int = 0) -> str:
+            nonlocal tokens, pos
+            return tokens[pos + offset].text
+
+        # 当前位置的描述，用于报错
+        def where() -> str:
+            return f" (token {pos})"
+    elif isinstance(tokens, TokenBuffer):
+        # 直接读紧凑词元表的各列，不构造 Token 对象
+        pos = 0
+        maxlen = len(tokens)
+        kinds, starts, ends = tokens.kinds, tokens.starts, tokens.ends
+        source_code = tokens.source_code
+
+        def available(offset: int = 0) -> bool:
+            return pos + offset < maxlen
+
+        def advance(count: int = 1) -> None:
+            nonlocal pos
+            pos += count
+
+        def peek_type(offset: int = 0) -> str:
+            return KIND_NAMES[kinds[pos + offset]]
+
+        # 调用者保证只对标识符和数字取文本
+        def peek_text(offset: int = 0) -> str:
+            index = pos + offset
+            return source_code[starts[index]:ends[index]]
+
+        # 紧凑词元表记录了位置，可以报出行号和列号
+        def where() -> str:
+            if pos >= maxlen:
+                return " at end of file"
+            line, column = tokens.position(pos)
+            return f" at line {line}, column {column}"
+    else:
+        # 迭代器只能向前走，用一个小窗口缓存已经取出但还没有消费的词元
+        # 解析器最多向前看两个词元，所以窗口很小
+        token_iter = iter(tokens)
+        window: deque[Token] = deque()
+        consumed = 0
+
+        def fill(count: int) -> bool:
+            while len(window) < count:
+                token = next(token_iter, None)
+                if token is None:
+                    return False
+                window.append(token)
+            return True
+
+        def available(offset: int = 0) -> bool:
+            return fill(offset + 1)
+
+        def advance(count: int = 1) -> None:
+            nonlocal consumed
+            fill(count)
+            for _ in range(count):
+                window.popleft()
+            consumed += count
+
+        def peek_type(offset: int = 0) -> str:
+            fill(offset + 1)
+            return window[offset].type
+
+        def peek_text(offset: int = 0) -> str:
+            fill(offset + 1)
+            return window[offset].text
+
+        def where() -> str:
+            return f" (token {consumed})"
+
+    # 查询下一个词元的类型并消费掉
+    def next_type() -> str:
+        token_type = peek_type()
         advance()
-        return token
+        return token_type
 
-    # 查询下一个词元并消费掉，强制要求其类型匹配某类型，否则报错
-    def match(expected_type: str) -> Token:
-        token = next()
-        got_type = token.type
+    # 消费下一个词元并返回其文本，强制要求其类型匹配某类型，否则报错
+    def match(expected_type: str) -> str:
+        got_type = peek_type()
         if got_type != expected_type:
-            raise Exception(f"got type {got_type}, but expected {expected_type}")
-        return token
+            raise Exception(f"got type {got_type}, but expected {expected_type}{where()}")
+        # 只有标识符和数字的文本有用，其他词元的文本都是空串，不必去取
+        text = peek_text() if got_type == 'identifier' or got_type == 'number' else ''
+        advance()
+        return text
+
+    return available, advance, peek_type, peek_text, next_type, match, where
+
+# 递归下降解析器
+def parse(tokens: Iterable[Token] | TokenBuffer) -> ModuleNode:
+    available, advance, peek_type, peek_text, next_type, match, where = token_reader(tokens)
 
     def parse_module() -> ModuleNode:
         functions: list[FunctionNode] = []
@@ -127,19 +222,19 @@ def parse(tokens: list[Token]) -> ModuleNode:
                     assert isinstance(assign, BinaryExpr) and assign.operator == '='
                     global_vars.append(assign)
                 case unexpected_type:
-                    raise Exception(f"Unexpected token: {unexpected_type}")
+                    raise Exception(f"Unexpected token: {unexpected_type}{where()}")
         return ModuleNode(functions, global_vars)
     
     def parse_function() -> FunctionNode:
         match('function')
-        name = match('identifier').text
+        name = match('identifier')
         match('(')
         params: list[str] = []
         if peek_type() != ')':
-            params.append(match('identifier').text)
+            params.append(match('identifier'))
             while peek_type() != ')':
                 match(',')
-                params.append(match('identifier').text)
+                params.append(match('identifier'))
         match(')')
         body = parse_statements_block()
         return FunctionNode(name, params, body)
@@ -223,7 +318,7 @@ def parse(tokens: list[Token]) -> ModuleNode:
     def parse_compare_expr() -> ExpressionNode:
         left = parse_add_expr()
         if available() and peek_type() in ('==', '!=', '<=', '<', '>=', '>'):
-            operator = next().type
+            operator = next_type()
             right = parse_compare_expr()
             return BinaryExpr(operator, left, right)
         return left
@@ -231,7 +326,7 @@ def parse(tokens: list[Token]) -> ModuleNode:
     def parse_add_expr() -> ExpressionNode:
         left = parse_mul_expr()
         if available() and peek_type() in ('+', '-'):
-            operator = next().type
+            operator = next_type()
             right = parse_add_expr()
             return BinaryExpr(operator, left, right)
         return left
@@ -239,7 +334,7 @@ def parse(tokens: list[Token]) -> ModuleNode:
     def parse_mul_expr() -> ExpressionNode:
         left = parse_unary_expr()
         if available() and peek_type() in ('*', '/'):
-            operator = next().type
+            operator = next_type()
             right = parse_mul_expr()
             return BinaryExpr(operator, left, right)
         return left
@@ -276,10 +371,10 @@ def parse(tokens: list[Token]) -> ModuleNode:
                 match(')')
                 return expr
             case unexpected_type:
-                raise SyntaxError(f"Unexpected token: {unexpected_type}")
+                raise SyntaxError(f"Unexpected token: {unexpected_type}{where()}")
             
     def parse_call_expr() -> CallExpr:
-        callee = match('identifier').text
+        callee = match('identifier')
         match('(')
         args: list[ExpressionNode] = []
         if peek_type() != ')':
@@ -291,11 +386,11 @@ def parse(tokens: list[Token]) -> ModuleNode:
         return CallExpr(callee, args)
 
     def parse_variable() -> Variable:
-        name = match('identifier').text
+        name = match('identifier')
         return Variable(name)
 
     def parse_number_constant() -> NumberConstant:
-        value = match('number').text
+        value = match('number')
         return NumberConstant(float(value))
 
     # 调用 起始文法规则 (module) 开始匹配
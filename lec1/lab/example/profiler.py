@@ -0,0 +1,161 @@
+import time
+from collections import Counter
+from dataclasses import dataclass
+from parser import *
+
+# 剖析器: 统计 slang 程序自己的热点，而不是解释器内部的 eval_expr / exec_stat
+#
+#   - 每个函数的调用次数、包含时间 (inclusive，包括它调用的函数) 和独占时间 (exclusive)
+#   - 每条语句的执行次数，每个 while 循环的进入次数和迭代次数 (循环体的执行次数)
+#   - 每条调用路径的独占时间，输出成火焰图工具 (flamegraph.pl、speedscope 等) 能读的折叠栈格式:
+#       main;foo;bar 1234     (调用路径; 独占时间，单位微秒)
+#
+# interpret(module, profiler=...) 在开始执行前用 wrap_call / wrap_stat 包装 call_function 和 exec_stat，
+# 不剖析时解释器的代码完全不变，没有任何额外开销。
+# 包装函数会多占一层 Python 调用栈，剖析时能达到的递归深度比不剖析时浅。
+# 记忆化 (--memoize) 命中的调用不会执行函数，不计入调用次数。
+
+@dataclass
+class FunctionProfile:
+    calls: int = 0
+    inclusive: float = 0.0
+    exclusive: float = 0.0
+
+class Profiler:
+    def __init__(self):
+        self.functions: dict[str, FunctionProfile] = {}
+        # 以 id(stat) 为键，statements 中保存语句本身，保证 id 不会被别的对象重用
+        self.statement_counts: Counter[int] = Counter()
+        self.statements: dict[int, tuple[str, StatementNode]] = {}
+        self.stacks: Counter[tuple[str, ...]] = Counter()
+        # 正在执行的函数: 调用路径，以及每一层的子调用花掉的时间
+        self._path: list[str] = []
+        self._child_times: list[float] = []
+        self._active: Counter[str] = Counter()
+
+    # 记下模块中的所有语句 (按源代码顺序)，报告里用来找到语句所在的函数
+    def attach(self, module: ModuleNode):
+        def visit(name: str, stat: StatementNode):
+            self.statements[id(stat)] = (name, stat)
+            match stat:
+                case BlockStat():
+                    for s in stat.statements:
+                        visit(name, s)
+                case IfStat():
+                    visit(name, stat.branch_true)
+                    if stat.branch_false is not None:
+                        visit(name, stat.branch_false)
+                case WhileStat():
+                    visit(name, stat.body)
+        for function in module.functions:
+            self.functions.setdefault(function.name, FunctionProfile())
+            visit(function.name, function.body)
+
+    def wrap_call(self, call_function):
+        functions, stacks = self.functions, self.stacks
+        path, child_times, active = self._path, self._child_times, self._active
+        clock = time.perf_counter
+
+        def profiled_call_function(function: FunctionNode, args: list[float]) -> float:
+            name = function.name
+            profile = functions.get(name)
+            if profile is None:
+                profile = functions[name] = FunctionProfile()
+            profile.calls += 1
+            path.append(name)
+            child_times.append(0.0)
+            active[name] += 1
+            start = clock()
+            try:
+                return call_function(function, args)
+            finally:
+                elapsed = clock() - start
+                exclusive = elapsed - child_times.pop()
+                profile.exclusive += exclusive
+                # 递归调用的时间已经算在最外层那次调用里了
+                active[name] -= 1
+                if not active[name]:
+                    profile.inclusive += elapsed
+                stacks[tuple(path)] += exclusive
+                path.pop()
+                if child_times:
+                    child_times[-1] += elapsed
+        return profiled_call_function
+
+    def wrap_stat(self, exec_stat):
+        counts = self.statement_counts
+
+        def profiled_exec_stat(stat: StatementNode):
+            counts[id(stat)] += 1
+            return exec_stat(stat)
+        return profiled_exec_stat
+
+    def total_time(self) -> float:
+        return sum(profile.exclusive for profile in self.functions.values())
+
+    # 折叠栈格式，每行一条调用路径，时间为 0 微秒的路径省略
+    def collapsed_stacks(self) -> str:
+        lines: list[str] = []
+        for path, seconds in sorted(self.stacks.items()):
+            microseconds = round(seconds * 1e6)
+            if microseconds > 0:
+                lines.append(f"{';'.join(path)} {microseconds}")
+        return ''.join(line + '\n' for line in lines)
+
+    # 文本报告: 函数按独占时间排序，语句和循环按执行次数排序，各列出前 top 项
+    def report(self, top: int = 20) -> str:
+        total = self.total_time()
+        lines = [f"总时间 {total * 1000:.3f}ms", '',
+                 f"{'函数':<24}{'调用次数':>12}{'包含时间':>14}{'独占时间':>14}{'占比':>8}"]
+        functions = sorted(self.functions.items(), key=lambda item: (-item[1].exclusive, item[0]))
+        for name, profile in functions[:top]:
+            share = profile.exclusive / total * 100 if total else 0.0
+            lines.append(f"{name:<24}{profile.calls:>12}{profile.inclusive * 1000:>12.3f}ms"
+                         f"{profile.exclusive * 1000:>12.3f}ms{share:>7.1f}%")
+
+        loops = [(self.statement_counts[id(stat.body)], self.statement_counts[id(stat)], name, stat)
+                 for name, stat in self.statements.values() if isinstance(stat, WhileStat)]
+        loops.sort(key=lambda item: -item[0])
+        lines += ['', f"{'循环':<48}{'进入次数':>12}{'迭代次数':>12}"]
+        for iterations, entries, name, stat in loops[:top]:
+            lines.append(f"{name + ': ' + describe_stat(stat):<48}{entries:>12}{iterations:>12}")
+
+        # 语句块只是一组语句，不单独列出
+        statements = [(count, *self.statements[key]) for key, count in self.statement_counts.items()
+                      if key in self.statements and not isinstance(self.statements[key][1], BlockStat)]
+        statements.sort(key=lambda item: -item[0])
+        lines += ['', f"{'语句':<48}{'执行次数':>12}"]
+        for count, name, stat in statements[:top]:
+            lines.append(f"{name + ': ' + describe_stat(stat):<48}{count:>12}")
+        return '\n'.join(lines) + '\n'
+
+# 报告中语句的简短写法，过长的截断
+def describe_stat(stat: StatementNode, width: int = 40) -> str:
+    match stat:
+        case BlockStat(): text = '{ ... }'
+        case IfStat(): text = f"if ({describe_expr(stat.condition)})"
+        case WhileStat(): text = f"while ({describe_expr(stat.condition)})"
+        case BreakStat(): text = 'break;'
+        case ContinueStat(): text = 'continue;'
+        case ExprEvalStat(): text = f"{describe_expr(stat.expr)};"
+        case ReturnStat() if stat.return_value is None: text = 'return;'
+        case ReturnStat(): text = f"return {describe_expr(stat.return_value)};"
+        case _: text = type(stat).__name__
+    return text if len(text) <= width else text[:width - 3] + '...'
+
+def describe_expr(expr: ExpressionNode) -> str:
+    match expr:
+        case NumberConstant(value): return f"{value:g}"
+        case Variable(): return expr.name
+        case BinaryExpr():
+            left, right = describe_expr(expr.left), describe_expr(expr.right)
+            if isinstance(expr.left, BinaryExpr) and expr.operator != '=':
+                left = f"({left})"
+            if isinstance(expr.right, BinaryExpr) and expr.operator != '=':
+                right = f"({right})"
+            return f"{left} {expr.operator} {right}"
+        case UnaryExpr():
+            operand = describe_expr(expr.operand)
+            return f"{expr.operator}({operand})" if isinstance(expr.operand, BinaryExpr) else f"{expr.operator}{operand}"
+        case CallExpr(): return f"{expr.callee}({', '.join(describe_expr(arg) for arg in expr.arguments)})"
+        case _: return type(expr).__name__
@@ -0,0 +1,143 @@
+import struct
+from collections import OrderedDict
+from parser import *
+from natives import BUILTINS, NativeFunction
+
+# 纯函数分析和记忆化 (memoization)
+#
+# 纯函数的返回值只由实参决定，用同样的实参再调用一次可以直接用上次的结果。一个函数是纯函数，当且仅当:
+#   - 不给全局变量赋值
+#   - 不调用 print 等有副作用的内置函数，不调用不存在的函数
+#   - 只调用纯函数
+#   - 只读取初始化之后就不会再变的全局变量 (只在顶层被赋值一次，函数里从不赋值)
+# 互相递归的函数也可以是纯函数: 先假设所有函数都是纯的，再反复去掉不满足条件的，直到不再变化。
+#
+# 记忆表按实参的二进制表示查找，0.0 和 -0.0、不同的 NaN 都是不同的键，查到的结果和重新执行完全一样。
+# 抛出异常的调用不会被记下来，再次调用时仍然会执行并抛出同样的异常。
+
+# builtins 默认为 natives.py 中全局的内置函数注册表，注册时 pure=False 的内置函数有副作用
+def find_pure_functions(module: ModuleNode, builtins: dict[str, NativeFunction] | None = None) -> set[str]:
+    # 需要 resolver 填好 is_global
+    if builtins is None:
+        builtins = BUILTINS
+    function_map: dict[str, FunctionNode] = {}
+    for function in module.functions:
+        function_map[function.name] = function
+
+    # 依次访问 node 下的所有表达式结点
+    def iter_exprs(node: SyntaxTreeNode):
+        pending = [node]
+        while pending:
+            node = pending.pop()
+            match node:
+                case BlockStat(): pending.extend(node.statements)
+                case IfStat():
+                    pending.append(node.condition)
+                    pending.append(node.branch_true)
+                    if node.branch_false is not None:
+                        pending.append(node.branch_false)
+                case WhileStat(): pending.extend((node.condition, node.body))
+                case ExprEvalStat(): pending.append(node.expr)
+                case ReturnStat():
+                    if node.return_value is not None:
+                        pending.append(node.return_value)
+                case BinaryExpr():
+                    yield node
+                    pending.extend((node.left, node.right))
+                case UnaryExpr():
+                    yield node
+                    pending.append(node.operand)
+                case CallExpr():
+                    yield node
+                    pending.extend(node.arguments)
+                case ExpressionNode():
+                    yield node
+
+    def assigned_globals(node: SyntaxTreeNode) -> set[str]:
+        return { expr.left.name for expr in iter_exprs(node)
+                 if isinstance(expr, BinaryExpr) and expr.operator == '=' and expr.left.is_global }
+
+    # 会变的全局变量: 顶层赋值不止一次，或者在函数里被赋值
+    initialized: set[str] = set()
+    unstable: set[str] = set()
+    for var in module.global_vars:
+        if var.left.name in initialized:
+            unstable.add(var.left.name)
+        initialized.add(var.left.name)
+        unstable |= assigned_globals(var.right)
+    for function in function_map.values():
+        unstable |= assigned_globals(function.body)
+
+    # 只看函数自身是否满足条件，同时记下它调用的函数
+    pure: set[str] = set()
+    callees: dict[str, set[str]] = {}
+    for name, function in function_map.items():
+        calls: set[str] = set()
+        locally_pure = True
+        for expr in iter_exprs(function.body):
+            match expr:
+                case Variable(name=var_name) if expr.is_global and var_name in unstable:
+                    locally_pure = False
+                case BinaryExpr(operator='=', left=Variable()) if expr.left.is_global:
+                    locally_pure = False
+                case CallExpr(callee=callee) if callee in builtins:
+                    if not builtins[callee].pure:
+                        locally_pure = False
+                case CallExpr(callee=callee) if callee not in function_map:
+                    locally_pure = False
+                case CallExpr(callee=callee):
+                    calls.add(callee)
+        if locally_pure:
+            pure.add(name)
+            callees[name] = calls
+
+    # 去掉调用了非纯函数的函数，直到不再变化
+    changed = True
+    while changed:
+        changed = False
+        for name in list(pure):
+            if not callees[name] <= pure:
+                pure.discard(name)
+                changed = True
+    return pure
+
+# 有上限的 LRU 记忆表
+# hits / misses / evictions 统计命中、未命中和因为表满而被淘汰的次数
+class MemoTable:
+    def __init__(self, maxsize: int = 4096):
+        if maxsize <= 0:
+            raise ValueError("maxsize must be positive")
+        self.maxsize = maxsize
+        self.entries: OrderedDict[tuple[str, bytes], float] = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @staticmethod
+    def key(name: str, args: list[float]) -> tuple[str, bytes]:
+        return name, struct.pack(f'<{len(args)}d', *args)
+
+    # 查不到时返回 None
+    def get(self, key: tuple[str, bytes]) -> float | None:
+        value = self.entries.get(key)
+        if value is None:
+            self.misses += 1
+            return None
+        self.entries.move_to_end(key)
+        self.hits += 1
+        return value
+
+    def put(self, key: tuple[str, bytes], value: float):
+        self.entries[key] = value
+        self.entries.move_to_end(key)
+        if len(self.entries) > self.maxsize:
+            self.entries.popitem(last=False)
+            self.evictions += 1
+
+    # 清空记下的结果，统计数据保留
+    def clear(self):
+        self.entries.clear()
+
+    def __repr__(self) -> str:
+        return (f"MemoTable(size={len(self.entries)}/{self.maxsize}, hits={self.hits}, "
+                f"misses={self.misses}, evictions={self.evictions})")
@@ -0,0 +1,163 @@
+from parser import *
+
+# 作用域解析: 在 parse() 之后运行，确定每个变量是局部变量还是全局变量，
+# 并给它分配一个固定的槽位下标。解释器执行时就可以用列表下标访问变量，
+# 不需要每次都按名字查两次字典。
+#
+# 规则和解释器原本的动态查找完全一致:
+#   - 形参总是局部变量
+#   - 给一个不是全局变量的名字赋值，会创建局部变量
+#   - 给全局变量赋值 (且没有同名形参)，写的是全局变量
+#   - 读取时局部变量优先，其次是全局变量
+#   - 读取找不到的变量时执行到才报错: 给它分配一个永远不会被赋值的局部变量槽位
+#
+# strict=True 时读取找不到的变量在解析时就抛出 NameError，不管会不会执行到 (slang.py 用这种方式)。
+# 初始化表达式读取还没有初始化的全局变量一定会出错，这时也在解析时报错。
+#
+# 全局变量按顺序初始化，初始化表达式调用的函数可能在某个全局变量初始化之前就给它赋值，
+# 这时写的是局部变量。这样的变量 (fallback_slot >= 0) 执行时按全局变量是否已经初始化来选择:
+# 已经初始化就是全局变量，否则是 fallback_slot 中的局部变量。
+# 只有顶层的初始化语句会让全局变量变成已经初始化，一次函数调用期间的选择不会变，所以和动态查找一致。
+#
+# 每次都从头解析，已经解析过的模块 (比如优化或者增量修改之后) 可以再次解析。
+
+def resolve(module: ModuleNode, strict: bool = False) -> ModuleNode:
+    global_slots: dict[str, int] = {}
+    for var in module.global_vars:
+        assert var.operator == '=' and isinstance(var.left, Variable)
+        if var.left.name not in global_slots:
+            global_slots[var.left.name] = len(global_slots)
+
+    def contains_call(expr: ExpressionNode) -> bool:
+        match expr:
+            case CallExpr(): return True
+            case BinaryExpr(): return contains_call(expr.left) or contains_call(expr.right)
+            case UnaryExpr(): return contains_call(expr.operand)
+            case _: return False
+
+    # 函数可能看到还没有初始化的全局变量: 从第一个调用了函数的初始化表达式起 (包括它自己) 才初始化的
+    late_globals: set[str] = set()
+    initialized: set[str] = set()
+    calling = False
+    for var in module.global_vars:
+        calling = calling or contains_call(var.right)
+        if calling and var.left.name not in initialized:
+            late_globals.add(var.left.name)
+        initialized.add(var.left.name)
+
+    # 按求值顺序遍历表达式，对每个变量调用 on_read / on_assign
+    def walk_stat(stat: StatementNode, on_read, on_assign):
+        match stat:
+            case BlockStat():
+                for s in stat.statements:
+                    walk_stat(s, on_read, on_assign)
+            case IfStat():
+                walk_expr(stat.condition, on_read, on_assign)
+                walk_stat(stat.branch_true, on_read, on_assign)
+                if stat.branch_false is not None:
+                    walk_stat(stat.branch_false, on_read, on_assign)
+            case WhileStat():
+                walk_expr(stat.condition, on_read, on_assign)
+                walk_stat(stat.body, on_read, on_assign)
+            case ExprEvalStat():
+                walk_expr(stat.expr, on_read, on_assign)
+            case ReturnStat():
+                if stat.return_value is not None:
+                    walk_expr(stat.return_value, on_read, on_assign)
+            case BreakStat() | ContinueStat():
+                pass
+            case _: raise NotImplementedError(f"Unknown statement: {stat}")
+
+    def walk_expr(expr: ExpressionNode, on_read, on_assign):
+        match expr:
+            case NumberConstant():
+                pass
+            case BinaryExpr(operator='=', left=Variable()):
+                walk_expr(expr.right, on_read, on_assign)
+                on_assign(expr.left)
+            case BinaryExpr():
+                walk_expr(expr.left, on_read, on_assign)
+                walk_expr(expr.right, on_read, on_assign)
+            case UnaryExpr():
+                walk_expr(expr.operand, on_read, on_assign)
+            case CallExpr():
+                for arg in expr.arguments:
+                    walk_expr(arg, on_read, on_assign)
+            case Variable():
+                on_read(expr)
+            case _: raise NotImplementedError(f"Unknown expression: {expr}")
+
+    def resolve_function(function: FunctionNode):
+        # 形参占据最前面的槽位，调用时实参列表可以直接作为局部变量表的开头
+        # 形参重名时以后一个为准，和原来依次写入字典的效果一样
+        local_names = list(function.parameters)
+        local_slots = { name: i for i, name in enumerate(local_names) }
+        fallback_slots: dict[str, int] = {}
+
+        def new_local(name: str) -> int:
+            local_names.append(name)
+            return len(local_names) - 1
+
+        # 第一遍: 找出所有局部变量，以及初始化之前可能被赋值的全局变量
+        def collect_assign(var: Variable):
+            if var.name in local_slots or var.name in fallback_slots:
+                return
+            if var.name not in global_slots:
+                local_slots[var.name] = new_local(var.name)
+            elif var.name in late_globals:
+                fallback_slots[var.name] = new_local(var.name)
+        walk_stat(function.body, lambda var: None, collect_assign)
+
+        # 第二遍: 给每个变量填上槽位
+        def bind(var: Variable):
+            var.fallback_slot = -1
+            if var.name in local_slots:
+                var.slot, var.is_global = local_slots[var.name], False
+            elif var.name in global_slots:
+                var.slot, var.is_global = global_slots[var.name], True
+                var.fallback_slot = fallback_slots.get(var.name, -1)
+            elif strict:
+                raise NameError(f"Variable not found: {var.name} (in function {function.name})")
+            else:
+                local_slots[var.name] = new_local(var.name)
+                var.slot, var.is_global = local_slots[var.name], False
+        walk_stat(function.body, bind, bind)
+
+        function.local_names = local_names
+
+    for function in module.functions:
+        resolve_function(function)
+
+    # 全局变量按顺序初始化，初始化表达式里只能看到已经初始化过的全局变量
+    # 初始化表达式中嵌套的赋值 (比如 a = (b = 1);) 会写到一个临时的局部变量表里
+    top_local_names: list[str] = []
+    top_local_slots: dict[str, int] = {}
+    defined_globals: set[str] = set()
+
+    def bind_top_read(var: Variable):
+        var.fallback_slot = -1
+        if strict and var.name not in top_local_slots and var.name not in defined_globals:
+            raise NameError(f"Variable not found: {var.name} (in global initializer)")
+        if var.name not in top_local_slots and var.name not in global_slots:
+            top_local_slots[var.name] = len(top_local_names)
+            top_local_names.append(var.name)
+        if var.name in top_local_slots:
+            var.slot, var.is_global = top_local_slots[var.name], False
+        else:
+            # 还没有初始化的全局变量执行时会报错
+            var.slot, var.is_global = global_slots[var.name], True
+
+    def bind_top_assign(var: Variable):
+        if var.name not in top_local_slots and var.name not in defined_globals:
+            top_local_slots[var.name] = len(top_local_names)
+            top_local_names.append(var.name)
+        bind_top_read(var)
+
+    for var in module.global_vars:
+        walk_expr(var.right, bind_top_read, bind_top_assign)
+        var.left.slot, var.left.is_global, var.left.fallback_slot = global_slots[var.left.name], True, -1
+        defined_globals.add(var.left.name)
+
+    module.global_names = list(global_slots)
+    module.local_names = top_local_names
+    return module
@@ -0,0 +1,169 @@
+import contextlib
+import io
+import json
+import os
+import socketserver
+import stat
+import sys
+import threading
+from collections import OrderedDict
+from typing import TextIO
+from tokenizer import tokenize
+from iterative_parser import parse_iterative
+from resolver import resolve
+from interpreter import Interpreter
+import cache
+
+# 常驻服务: 一个进程一直运行，模块载入一次之后留在内存里，之后的调用不再付出启动进程、词法分析和语法分析的代价
+#
+# 协议是 JSON Lines: 每行一个请求，每个请求回复一行，回复中带上请求的 id (如果有)
+#   {"op": "load", "module": "m", "path": "prog.slang"}       从文件载入 (经过编译缓存)
+#   {"op": "load", "module": "m", "source": "function ..."}   直接给出源代码
+#   {"op": "call", "module": "m", "function": "f", "args": [1, 2]}
+#   {"op": "run", "module": "m"}                               调用 main
+#   {"op": "unload", "module": "m"}
+#   {"op": "stats"}
+# 成功时回复 {"ok": true, ...}，call / run 的回复中有 "result" 和这次调用 print 的输出 "output"；
+# 出错时回复 {"ok": false, "error": "..."}，服务继续运行。
+#
+# 载入的模块放在容量为 capacity 的 LRU 表中，满了之后淘汰最久没用的模块，再调用它需要重新载入。
+# 每个模块的全局变量在调用之间保留 (见 interpreter.py 的 Interpreter)。
+# 可以从标准输入读请求，也可以监听 Unix 套接字；套接字上的多个连接共享同一组模块，请求逐个执行。
+
+DEFAULT_CAPACITY = 64
+
+class Server:
+    def __init__(self, capacity: int = DEFAULT_CAPACITY, cache_dir: str | None = None, use_cache: bool = True):
+        if capacity <= 0:
+            raise ValueError("capacity must be positive")
+        self.capacity = capacity
+        self.cache_dir = cache_dir
+        self.use_cache = use_cache
+        self.modules: OrderedDict[str, Interpreter] = OrderedDict()
+        self.requests = 0
+        self.evictions = 0
+        self.lock = threading.Lock()
+
+    # 处理一个请求 (已经解析的 JSON)，返回回复
+    def handle(self, request: dict) -> dict:
+        with self.lock:
+            self.requests += 1
+            try:
+                reply = self.dispatch(request)
+                reply['ok'] = True
+            except Exception as e:
+                reply = {'ok': False, 'error': f"{type(e).__name__}: {e}"}
+        if isinstance(request, dict) and 'id' in request:
+            reply['id'] = request['id']
+        return reply
+
+    def dispatch(self, request: dict) -> dict:
+        if not isinstance(request, dict):
+            raise ValueError("Request must be a JSON object")
+        match request.get('op'):
+            case 'load':
+                name = request['module']
+                output = io.StringIO()
+                with contextlib.redirect_stdout(output):
+                    interpreter = Interpreter(self.compile(request))
+                self.store(name, interpreter)
+                return {'functions': interpreter.functions, 'output': output.getvalue()}
+            case 'call':
+                interpreter = self.lookup(request['module'])
+                args = request.get('args', [])
+                if not isinstance(args, list):
+                    raise ValueError("'args' must be a list")
+                return self.capture(lambda: interpreter.call(request['function'], *args))
+            case 'run':
+                interpreter = self.lookup(request['module'])
+                return self.capture(interpreter.run)
+            case 'unload':
+                return {'unloaded': self.modules.pop(request['module'], None) is not None}
+            case 'stats':
+                return {'modules': list(self.modules), 'capacity': self.capacity,
+                        'requests': self.requests, 'evictions': self.evictions}
+            case op:
+                raise ValueError(f"Unknown op: {op}")
+
+    def compile(self, request: dict):
+        if 'source' in request:
+            return resolve(parse_iterative(tokenize(request['source'])))
+        path = request['path']
+        if not self.use_cache:
+            with open(path, 'r', encoding='utf-8') as f:
+                return resolve(parse_iterative(tokenize(f.read())))
+        return cache.compile_file(path, self.cache_dir, as_tree=True)
+
+    def store(self, name: str, interpreter: Interpreter):
+        self.modules[name] = interpreter
+        self.modules.move_to_end(name)
+        while len(self.modules) > self.capacity:
+            self.modules.popitem(last=False)
+            self.evictions += 1
+
+    def lookup(self, name: str) -> Interpreter:
+        if name not in self.modules:
+            raise KeyError(f"Module not loaded: {name}")
+        self.modules.move_to_end(name)
+        return self.modules[name]
+
+    # 调用期间 print 的输出收集起来放进回复，不会和协议本身的输出混在一起
+    def capture(self, run) -> dict:
+        output = io.StringIO()
+        with contextlib.redirect_stdout(output):
+            result = run()
+        return {'result': result, 'output': output.getvalue()}
+
+    # 处理一行请求，返回一行回复 (不带换行)
+    def handle_line(self, line: str) -> str:
+        try:
+            request = json.loads(line)
+        except json.JSONDecodeError as e:
+            reply = {'ok': False, 'error': f"Invalid JSON: {e}"}
+        else:
+            reply = self.handle(request)
+        # slang 的值可能是 inf 或者 nan，JSON 标准中没有，按 Python json 模块的习惯写成 Infinity / NaN
+        return json.dumps(reply, ensure_ascii=False)
+
+    # 从 input 逐行读请求，把回复写到 output，直到 input 结束
+    def serve_stream(self, input: TextIO, output: TextIO):
+        for line in input:
+            if not line.strip():
+                continue
+            output.write(self.handle_line(line) + '\n')
+            output.flush()
+
+    # 监听 Unix 套接字，每个连接一个线程
+    def serve_unix(self, path: str):
+        server = self
+        class Handler(socketserver.StreamRequestHandler):
+            def handle(self):
+                reader = io.TextIOWrapper(self.rfile, encoding='utf-8')
+                writer = io.TextIOWrapper(self.wfile, encoding='utf-8', write_through=True)
+                try:
+                    server.serve_stream(reader, writer)
+                except (ConnectionError, BrokenPipeError):
+                    pass
+        # 上次没有正常退出时留下的套接字文件
+        if os.path.exists(path) and stat.S_ISSOCK(os.stat(path).st_mode):
+            os.remove(path)
+        with socketserver.ThreadingUnixStreamServer(path, Handler) as unix_server:
+            unix_server.daemon_threads = True
+            try:
+                unix_server.serve_forever()
+            finally:
+                os.remove(path)
+
+# 以标准输入输出为通道运行服务
+# 协议占用标准输出，slang 程序的输出都放进回复里，诊断信息写到标准错误输出
+def serve(capacity: int = DEFAULT_CAPACITY, cache_dir: str | None = None, use_cache: bool = True,
+          socket_path: str | None = None):
+    server = Server(capacity, cache_dir, use_cache)
+    try:
+        if socket_path is not None:
+            print(f"在 {socket_path} 上监听", file=sys.stderr)
+            server.serve_unix(socket_path)
+        else:
+            server.serve_stream(sys.stdin, sys.stdout)
+    except KeyboardInterrupt:
+        pass
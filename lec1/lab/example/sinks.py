@@ -0,0 +1,105 @@
+import sys
+from typing import Iterable, TextIO
+
+# print 的输出目标 (sink)
+#
+# 内置函数 print 把一次调用的输出格式化成一整行 (format_line，和 Python 的 print(*args) 逐字节相同)，
+# 然后只调用一次输出目标的 write。输出目标可以是任何有 write 方法的对象 (比如 sys.stdout、StringIO)，
+# 也可以是这里的几种:
+#
+#   BufferedSink  攒够 buffer_size 个字符才写一次底层的流，close() (程序结束) 时写出剩下的
+#   LineSink      每一行都立即写出并 flush (和终端上的 sys.stdout 一样)
+#   NullSink      丢掉所有输出，用于测量不含 I/O 的执行时间
+#   CaptureSink   保存在内存中，用于测试和评分
+#
+#   with BufferedSink() as sink:
+#       interpret(module, context=RunContext(output=sink))
+#
+# 不支持 output 参数的后端用 contextlib.redirect_stdout(sink) (见 slang.py)。
+
+DEFAULT_BUFFER_SIZE = 1 << 16
+
+SINKS = ('buffered', 'line', 'null')
+
+def format_line(args: Iterable[float]) -> str:
+    return ' '.join(map(str, args)) + '\n'
+
+class BufferedSink:
+    # stream 默认为创建时的 sys.stdout
+    def __init__(self, stream: TextIO | None = None, buffer_size: int = DEFAULT_BUFFER_SIZE):
+        if buffer_size <= 0:
+            raise ValueError("buffer_size must be positive")
+        self.stream = stream if stream is not None else sys.stdout
+        self.buffer_size = buffer_size
+        self.parts: list[str] = []
+        self.size = 0
+
+    def write(self, text: str) -> int:
+        self.parts.append(text)
+        self.size += len(text)
+        if self.size >= self.buffer_size:
+            self.flush()
+        return len(text)
+
+    def flush(self):
+        if self.parts:
+            self.stream.write(''.join(self.parts))
+            self.parts.clear()
+            self.size = 0
+        self.stream.flush()
+
+    def close(self):
+        self.flush()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+class LineSink(BufferedSink):
+    def __init__(self, stream: TextIO | None = None):
+        super().__init__(stream, 1)
+
+    def write(self, text: str) -> int:
+        self.stream.write(text)
+        self.stream.flush()
+        return len(text)
+
+class NullSink:
+    def write(self, text: str) -> int:
+        return len(text)
+
+    def flush(self):
+        pass
+
+    def close(self):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        pass
+
+class CaptureSink(NullSink):
+    def __init__(self):
+        self.parts: list[str] = []
+
+    def write(self, text: str) -> int:
+        self.parts.append(text)
+        return len(text)
+
+    def getvalue(self) -> str:
+        return ''.join(self.parts)
+
+    def lines(self) -> list[str]:
+        return self.getvalue().splitlines()
+
+# 按名字 (SINKS 之一) 创建输出目标
+def open_sink(kind: str, stream: TextIO | None = None) -> BufferedSink | NullSink:
+    match kind:
+        case 'buffered': return BufferedSink(stream)
+        case 'line': return LineSink(stream)
+        case 'null': return NullSink()
+        case _: raise ValueError(f"Unknown output sink: {kind}")
@@ -1,20 +1,183 @@
+import argparse
+import contextlib
 import sys
-from tokenizer import tokenize
-from parser import parse
+from tokenizer import iter_tokens_from_file
+from iterative_parser import parse_iterative
+from resolver import resolve
+from optimizer import optimize, PASSES
 from interpreter import interpret
+from purity import MemoTable
+from profiler import Profiler
+from tracing import TraceJIT, DEFAULT_THRESHOLD, DEFAULT_MAX_TRACE_LENGTH
+from flat_ast import flatten, interpret_flat
+from ir_passes import optimize_module, IR_PASSES
+from sinks import open_sink, SINKS
+import cache
+import server
+import incremental
+import closure
+import transpiler
+import compiler
+import vm
+import ir
+import ir_exec
 
 def main():
-    if len(sys.argv) < 2:
-        print("使用方法: python slang.py <源文件>")
+    arg_parser = argparse.ArgumentParser(description="slang 语言的解释器")
+    arg_parser.add_argument('filename', nargs='?', help="源文件 (--serve 时不需要)")
+    arg_parser.add_argument('--backend', choices=['tree', 'flat', 'closure', 'vm', 'py', 'ir'], default='tree',
+                            help="执行方式: tree 为语法树解释器 (默认)，flat 为扁平语法树解释器，closure 为闭包编译，vm 为字节码虚拟机，py 为翻译成 Python 执行，ir 为转换成 SSA 中间表示、优化后执行")
+    arg_parser.add_argument('--right-nested', action='store_true',
+                            help="二元运算按右结合解析 (a - b - c 即 a - (b - c))，和 parser.py 的递归下降解析器一致")
+    arg_parser.add_argument('--cache-dir', default=None,
+                            help="编译缓存的目录，默认为环境变量 SLANG_CACHE_DIR 或者 ~/.cache/slang")
+    arg_parser.add_argument('--no-cache', action='store_true', help="不读也不写编译缓存")
+    arg_parser.add_argument('--dump-py', metavar='FILE',
+                            help="和 --backend=py 一起使用，把生成的 Python 源代码写到文件里，- 表示标准错误输出")
+    arg_parser.add_argument('--dump-ir', metavar='FILE',
+                            help="和 --backend=ir 一起使用，把优化后的中间表示写到文件里，- 表示标准错误输出")
+    arg_parser.add_argument('--disable-ir-pass', action='append', choices=IR_PASSES, default=[],
+                            help="和 --backend=ir 一起使用，关闭某一种中间表示上的优化，可以指定多次")
+    arg_parser.add_argument('--memoize', metavar='SIZE', type=int, nargs='?', const=4096, default=None,
+                            help="和 --backend=tree 一起使用，记忆纯函数的调用结果，SIZE 为记忆表的大小 (默认 4096)")
+    arg_parser.add_argument('--profile', action='store_true',
+                            help="和 --backend=tree 一起使用，执行结束后把各函数、循环和语句的剖析报告写到标准错误输出")
+    arg_parser.add_argument('--profile-stacks', metavar='FILE',
+                            help="和 --profile 一起使用，把折叠栈格式的剖析结果写到文件里，可以用火焰图工具查看")
+    arg_parser.add_argument('--jit', action='store_true',
+                            help="和 --backend=tree 一起使用，把热的 while 循环跟踪编译成 Python 函数执行，结束后把统计写到标准错误输出")
+    arg_parser.add_argument('--jit-threshold', metavar='N', type=int, default=DEFAULT_THRESHOLD,
+                            help=f"和 --jit 一起使用，循环体执行多少次之后开始跟踪 (默认 {DEFAULT_THRESHOLD})")
+    arg_parser.add_argument('--jit-max-trace', metavar='N', type=int, default=DEFAULT_MAX_TRACE_LENGTH,
+                            help=f"和 --jit 一起使用，跟踪最多包含的语法树结点个数，超过时放弃编译 (默认 {DEFAULT_MAX_TRACE_LENGTH})")
+    arg_parser.add_argument('--max-depth', metavar='N', type=int, default=None,
+                            help=f"和 --backend=vm 一起使用，函数调用的最大深度 (默认 {vm.DEFAULT_MAX_DEPTH})")
+    arg_parser.add_argument('--serve', action='store_true',
+                            help="作为常驻服务运行，从标准输入 (或者 --socket) 读 JSON Lines 请求，见 server.py")
+    arg_parser.add_argument('--socket', metavar='PATH', help="和 --serve 一起使用，监听这个 Unix 套接字")
+    arg_parser.add_argument('--serve-capacity', metavar='N', type=int, default=server.DEFAULT_CAPACITY,
+                            help=f"和 --serve 一起使用，内存中最多保留的模块个数 (默认 {server.DEFAULT_CAPACITY})")
+    arg_parser.add_argument('--output', choices=SINKS, default=None,
+                            help="print 的输出方式: buffered 攒够一大块再写，line 每行写出并 flush，null 丢掉输出 "
+                                 "(默认直接写 sys.stdout)")
+    arg_parser.add_argument('--watch', action='store_true',
+                            help="监视源文件，每次保存后增量地重新分析并执行 (只支持 --backend=tree)")
+    arg_parser.add_argument('-O', '--optimize', action='store_true', help="执行前优化语法树")
+    arg_parser.add_argument('--disable-pass', action='append', choices=PASSES, default=[],
+                            help="和 -O 一起使用，关闭某一种优化，可以指定多次")
+    args = arg_parser.parse_args()
+    if args.serve:
+        if args.filename is not None:
+            arg_parser.error("--serve 不需要源文件")
+        if args.serve_capacity <= 0:
+            arg_parser.error("--serve-capacity 必须是正数")
+        server.serve(args.serve_capacity, args.cache_dir, not args.no_cache, args.socket)
         return
+    if args.filename is None:
+        arg_parser.error("需要源文件")
+    if args.socket is not None:
+        arg_parser.error("--socket 只能和 --serve 一起使用")
+    if (args.dump_ir is not None or args.disable_ir_pass) and args.backend != 'ir':
+        arg_parser.error("--dump-ir 和 --disable-ir-pass 只能和 --backend=ir 一起使用")
+    if args.memoize is not None and args.backend != 'tree':
+        arg_parser.error("--memoize 只能和 --backend=tree 一起使用")
+    if args.memoize is not None and args.memoize <= 0:
+        arg_parser.error("--memoize 的大小必须是正数")
+    if args.profile and args.backend != 'tree':
+        arg_parser.error("--profile 只能和 --backend=tree 一起使用")
+    if args.profile_stacks is not None and not args.profile:
+        arg_parser.error("--profile-stacks 只能和 --profile 一起使用")
+    if args.jit and args.backend != 'tree':
+        arg_parser.error("--jit 只能和 --backend=tree 一起使用")
+    if args.jit and args.profile:
+        arg_parser.error("--jit 不能和 --profile 一起使用")
+    if args.jit_threshold <= 0 or args.jit_max_trace <= 0:
+        arg_parser.error("--jit-threshold 和 --jit-max-trace 必须是正数")
+    if args.max_depth is not None and args.backend != 'vm':
+        arg_parser.error("--max-depth 只能和 --backend=vm 一起使用")
+    if args.max_depth is not None and args.max_depth <= 0:
+        arg_parser.error("--max-depth 必须是正数")
 
-    filename = sys.argv[1]
-    with open(filename, 'r', encoding='utf-8') as f:
-        source = f.read()
+    if args.watch:
+        if args.backend != 'tree' or args.optimize or args.memoize is not None or args.profile or args.jit:
+            arg_parser.error("--watch 只能和 --backend=tree 一起使用，不能和 -O、--memoize、--profile、--jit 一起使用")
 
-    tokens = tokenize(source)
-    module = parse(tokens)
-    return_value = interpret(module)
+        def run(module):
+            # 复用的结点上作用域解析和链接的结果已经过期，interpret 会重新做这两步
+            resolve(module, strict=True)
+            sink = open_sink(args.output) if args.output is not None else sys.stdout
+            try:
+                with contextlib.redirect_stdout(sink):
+                    return_value = interpret(module)
+            finally:
+                sink.flush()
+            print(f"主函数的返回值是: {return_value}")
+        incremental.watch(args.filename, run, right_nested=args.right_nested)
+        return
+
+    passes = [name for name in PASSES if name not in args.disable_pass] if args.optimize else None
+    stats: dict[str, int] = {}
+    # 找不到的变量在执行之前就报错 (见 resolver.py 的 strict)
+    if args.no_cache:
+        # 词元边读文件边产生，直接交给语法分析器，不需要先把整个文件和全部词元放进内存
+        tokens = iter_tokens_from_file(args.filename)
+        module = resolve(parse_iterative(tokens, right_nested=args.right_nested), strict=True)
+        if passes is not None:
+            optimize(module, passes, stats)
+    else:
+        # 缓存命中时完全跳过词法分析、语法分析和优化
+        options = dict(right_nested=args.right_nested, passes=passes, stats=stats, strict=True)
+        if args.backend == 'flat':
+            flat = cache.compile_file(args.filename, args.cache_dir, **options)
+        else:
+            module = cache.compile_file(args.filename, args.cache_dir, as_tree=True, **options)
+    if stats:
+        summary = ', '.join(f"{name}: {count}" for name, count in stats.items())
+        print(f"优化删除了 {sum(stats.values())} 个结点 ({summary})", file=sys.stderr)
+    # 程序的输出都经过 sink (不支持 output 参数的后端也一样)，出错时也会写出缓冲的内容
+    sink = open_sink(args.output) if args.output is not None else sys.stdout
+    try:
+        with contextlib.redirect_stdout(sink):
+            match args.backend:
+                case 'tree':
+                    memo = MemoTable(args.memoize) if args.memoize is not None else None
+                    profiler = Profiler() if args.profile else None
+                    jit = TraceJIT(args.jit_threshold, args.jit_max_trace) if args.jit else None
+                    return_value = interpret(module, memo, profiler, jit=jit)
+                    if jit is not None:
+                        print(jit.report(), file=sys.stderr)
+                    if memo is not None:
+                        print(f"记忆表: 命中 {memo.hits} 次，未命中 {memo.misses} 次，淘汰 {memo.evictions} 次", file=sys.stderr)
+                    if profiler is not None:
+                        print(profiler.report(), file=sys.stderr)
+                        if args.profile_stacks is not None:
+                            with open(args.profile_stacks, 'w', encoding='utf-8') as f:
+                                f.write(profiler.collapsed_stacks())
+                case 'flat': return_value = interpret_flat(flatten(module) if args.no_cache else flat)
+                case 'closure': return_value = closure.compile_module(module)()
+                case 'vm':
+                    max_depth = args.max_depth if args.max_depth is not None else vm.DEFAULT_MAX_DEPTH
+                    return_value = vm.run(compiler.compile_module(module), max_depth)
+                case 'py':
+                    py_module = transpiler.compile_module(module)
+                    if args.dump_py == '-':
+                        print(py_module.__source__, file=sys.stderr)
+                    elif args.dump_py is not None:
+                        with open(args.dump_py, 'w', encoding='utf-8') as f:
+                            f.write(py_module.__source__)
+                    return_value = py_module.run()
+                case 'ir':
+                    ir_passes = [name for name in IR_PASSES if name not in args.disable_ir_pass]
+                    if args.dump_ir is not None:
+                        text = ir.dump(optimize_module(ir.lower_module(module), ir_passes))
+                        if args.dump_ir == '-':
+                            print(text, file=sys.stderr)
+                        else:
+                            with open(args.dump_ir, 'w', encoding='utf-8') as f:
+                                f.write(text)
+                    return_value = ir_exec.run_ir(module, ir_passes)
+    finally:
+        sink.flush()
     print(f"主函数的返回值是: {return_value}")
 
 if __name__ == '__main__':
@@ -1,4 +1,9 @@
+import re
+from array import array
+from bisect import bisect_right
 from dataclasses import dataclass
+from enum import IntEnum
+from typing import Generator, Iterator
 
 @dataclass
 class Token(object):
@@ -6,7 +11,8 @@ class Token(object):
     text: str
 
 # 简单的遍历一遍构造出所有 token
-def tokenize(source_code: str) -> list[Token]:
+# 这是最直观的写法，便于理解；实际使用的是下面基于正则表达式的 tokenize，两者结果完全一致
+def tokenize_simple(source_code: str) -> list[Token]:
     tokens: list[Token] = []
     offset = 0
     maxlen = len(source_code)
@@ -132,3 +138,248 @@ def tokenize(source_code: str) -> list[Token]:
             raise NotImplementedError(f"Unknown character: {char}")
         
     return tokens
+
+# 关键字和运算符词元没有文本内容，每种只需要一个实例，扫描时直接复用，省去大量对象创建
+KEYWORD_TOKENS = {
+    keyword: Token(keyword, '')
+    for keyword in ('function', 'if', 'else', 'while', 'continue', 'break', 'return')
+}
+OPERATOR_TOKENS = {
+    operator: Token(operator, '')
+    for operator in (',', ';', '(', ')', '{', '}', '+', '-', '*', '/',
+                     '=', '==', '!', '!=', '<', '<=', '>', '>=')
+}
+
+# 把所有词元的规则合成一个正则表达式，由正则引擎 (C 实现) 完成逐字符的扫描
+# 每次匹配先吃掉前面的空白，再匹配一个注释或词元，分组编号就是下面的 SKIP ... OTHER
+# 正则只处理 ASCII 字符。标识符和数字用否定的向前查看保证匹配到的是完整的词元，
+# 后面紧跟非 ASCII 字符 (可能是 Unicode 字母或数字) 时匹配失败，
+# 和遇到非 ASCII 字符一样由 OTHER 分组接住，交给 scan_token 按 tokenize_simple 的规则处理，保证结果完全一致
+TOKEN_PATTERN = re.compile(r"""
+    [\t-\r\x1c-\x20]*
+    (?:
+        (\#[^\n]*)
+      | ([0-9]+(?:\.[0-9]*)?)(?![0-9.]|[^\x00-\x7f])
+      | ([A-Za-z][A-Za-z0-9]*)(?![A-Za-z0-9]|[^\x00-\x7f])
+      | ([=!<>]=?|[-+*/,;(){}])
+      | (.)
+    )
+""", re.VERBOSE | re.DOTALL)
+SKIP, NUMBER, IDENTIFIER, OPERATOR, OTHER = 1, 2, 3, 4, 5
+
+# 从 offset 开始扫描一个词元，规则和 tokenize_simple 相同
+# 返回 (词元, 结束位置)，空白和注释返回的词元为 None
+def scan_token(source_code: str, offset: int) -> tuple[Token | None, int]:
+    maxlen = len(source_code)
+    char = source_code[offset]
+    start = offset
+
+    if char.isspace():
+        while offset < maxlen and source_code[offset].isspace():
+            offset += 1
+        return None, offset
+
+    if char == '#':
+        while offset < maxlen and source_code[offset] != '\n':
+            offset += 1
+        return None, offset
+
+    if char in '=!<>':
+        if offset + 1 < maxlen and source_code[offset + 1] == '=':
+            return OPERATOR_TOKENS[char + '='], offset + 2
+        return OPERATOR_TOKENS[char], offset + 1
+
+    if char in ',;(){}+-*/':
+        return OPERATOR_TOKENS[char], offset + 1
+
+    if char.isalpha():
+        while offset < maxlen and source_code[offset].isalnum():
+            offset += 1
+        text = source_code[start:offset]
+        if text in KEYWORD_TOKENS:
+            return KEYWORD_TOKENS[text], offset
+        return Token('identifier', text), offset
+
+    if char.isdigit():
+        while offset < maxlen and source_code[offset].isdigit():
+            offset += 1
+        if offset < maxlen and source_code[offset] == '.':
+            offset += 1
+            while offset < maxlen and source_code[offset].isdigit():
+                offset += 1
+        return Token('number', source_code[start:offset]), offset
+
+    raise NotImplementedError(f"Unknown character: {char}")
+
+# 扫描 source_code[offset:] 中的词元，返回值是扫描停止的位置
+# final 为 False 表示后面还有没读进来的内容: 紧贴着末尾的词元可能还不完整 (比如 '=' 后面也许是 '=')，
+# 这时停在这个词元之前，等读入更多内容后再继续
+def _scan(source_code: str, offset: int, final: bool) -> Generator[Token, None, int]:
+    maxlen = len(source_code)
+    keyword_tokens = KEYWORD_TOKENS
+    operator_tokens = OPERATOR_TOKENS
+    while offset < maxlen:
+        for m in TOKEN_PATTERN.finditer(source_code, offset):
+            kind = m.lastindex
+            if kind == OTHER:
+                offset = m.start(OTHER)
+                break
+            end = m.end()
+            if end == maxlen and not final:
+                return offset
+            offset = end
+            if kind == OPERATOR:
+                yield operator_tokens[m[OPERATOR]]
+            elif kind == IDENTIFIER:
+                text = m[IDENTIFIER]
+                token = keyword_tokens.get(text)
+                yield Token('identifier', text) if token is None else token
+            elif kind == NUMBER:
+                yield Token('number', m[NUMBER])
+        else:
+            # OTHER 可以匹配任意字符，循环正常结束说明已经扫描到了末尾
+            return offset
+
+        # 正则处理不了的位置，退回到逐字符扫描
+        token, end = scan_token(source_code, offset)
+        if end == maxlen and not final:
+            return offset
+        offset = end
+        if token is not None:
+            yield token
+    return offset
+
+# 逐个产生词元的生成器，词法分析和语法分析可以交替进行，不用先把所有词元都存下来
+def iter_tokens(source_code: str) -> Iterator[Token]:
+    yield from _scan(source_code, 0, True)
+
+# 分块读取文件并逐个产生词元，不需要把整个文件读进内存
+def iter_tokens_from_file(filename: str, chunk_size: int = 1 << 20) -> Iterator[Token]:
+    with open(filename, 'r', encoding='utf-8') as f:
+        buffer = ''
+        while True:
+            chunk = f.read(chunk_size)
+            final = not chunk
+            buffer += chunk
+            offset = yield from _scan(buffer, 0, final)
+            if final:
+                return
+            # 没扫描完的部分留到下一轮
+            buffer = buffer[offset:]
+
+# 一次性得到所有词元
+def tokenize(source_code: str) -> list[Token]:
+    return list(_scan(source_code, 0, True))
+
+# 紧凑的词元表示: 词元类型用小整数表示，起止位置存在 array 里，
+# 标识符和数字的文本只在需要时才从源代码中切出来。
+# 每个词元只占 9 个字节，而一个 Token 对象要占上百个字节
+class TokenKind(IntEnum):
+    IDENTIFIER = 0
+    NUMBER = 1
+    FUNCTION = 2
+    IF = 3
+    ELSE = 4
+    WHILE = 5
+    CONTINUE = 6
+    BREAK = 7
+    RETURN = 8
+    COMMA = 9
+    SEMICOLON = 10
+    LEFT_PAREN = 11
+    RIGHT_PAREN = 12
+    LEFT_BRACE = 13
+    RIGHT_BRACE = 14
+    PLUS = 15
+    MINUS = 16
+    STAR = 17
+    SLASH = 18
+    ASSIGN = 19
+    EQUAL = 20
+    NOT = 21
+    NOT_EQUAL = 22
+    LESS = 23
+    LESS_EQUAL = 24
+    GREATER = 25
+    GREATER_EQUAL = 26
+
+# 下标为 TokenKind，值为 Token.type 中使用的类型名
+KIND_NAMES = [
+    'identifier', 'number', 'function', 'if', 'else', 'while', 'continue', 'break', 'return',
+    ',', ';', '(', ')', '{', '}', '+', '-', '*', '/', '=', '==', '!', '!=', '<', '<=', '>', '>=',
+]
+KIND_OF_TYPE = { name: kind for kind, name in enumerate(KIND_NAMES) }
+
+class TokenBuffer:
+    __slots__ = ('source_code', 'kinds', 'starts', 'ends', '_line_starts')
+
+    def __init__(self, source_code: str):
+        self.source_code = source_code
+        self.kinds = array('B')
+        self.starts = array('I')
+        self.ends = array('I')
+        self._line_starts: list[int] | None = None
+
+    def __len__(self) -> int:
+        return len(self.kinds)
+
+    def append(self, kind: int, start: int, end: int) -> None:
+        self.kinds.append(kind)
+        self.starts.append(start)
+        self.ends.append(end)
+
+    def type(self, index: int) -> str:
+        return KIND_NAMES[self.kinds[index]]
+
+    # 标识符和数字返回源代码中的文本，其他词元和 Token 一样返回空串
+    def text(self, index: int) -> str:
+        if self.kinds[index] <= TokenKind.NUMBER:
+            return self.source_code[self.starts[index]:self.ends[index]]
+        return ''
+
+    # 需要时才构造 Token，便于和使用 Token 列表的代码对照
+    def token(self, index: int) -> Token:
+        return Token(self.type(index), self.text(index))
+
+    # 词元所在的行号和列号 (都从 1 开始)，只在报错时用到，行首位置表第一次用时才建立
+    def position(self, index: int) -> tuple[int, int]:
+        if self._line_starts is None:
+            self._line_starts = [0] + [m.end() for m in re.finditer('\n', self.source_code)]
+        offset = self.starts[index]
+        line = bisect_right(self._line_starts, offset)
+        return line, offset - self._line_starts[line - 1] + 1
+
+# 扫描得到紧凑的词元表，规则和 tokenize 完全一致
+def tokenize_compact(source_code: str) -> TokenBuffer:
+    buffer = TokenBuffer(source_code)
+    kinds, starts, ends = buffer.kinds, buffer.starts, buffer.ends
+    keyword_kinds = { keyword: KIND_OF_TYPE[keyword] for keyword in KEYWORD_TOKENS }
+    operator_kinds = { operator: KIND_OF_TYPE[operator] for operator in OPERATOR_TOKENS }
+    maxlen = len(source_code)
+    offset = 0
+    while offset < maxlen:
+        for m in TOKEN_PATTERN.finditer(source_code, offset):
+            kind = m.lastindex
+            if kind == OTHER:
+                offset = m.start(OTHER)
+                break
+            offset = m.end()
+            if kind == SKIP:
+                continue
+            if kind == OPERATOR:
+                kinds.append(operator_kinds[m[OPERATOR]])
+            elif kind == IDENTIFIER:
+                kinds.append(keyword_kinds.get(m[IDENTIFIER], TokenKind.IDENTIFIER))
+            else:
+                kinds.append(TokenKind.NUMBER)
+            starts.append(m.start(kind))
+            ends.append(offset)
+        else:
+            break
+
+        # 正则处理不了的位置，退回到逐字符扫描
+        token, end = scan_token(source_code, offset)
+        if token is not None:
+            buffer.append(KIND_OF_TYPE[token.type], offset, end)
+        offset = end
+    return buffer
@@ -0,0 +1,243 @@
+import math
+from dataclasses import dataclass, field
+from parser import *
+from natives import NativeFunction
+
+# 热循环的跟踪编译 (tracing JIT)
+#
+# interpret(module, jit=TraceJIT()) 时，解释器记下每个 while 循环执行了多少次循环体。
+# 次数达到 threshold 后，下一次循环体执行时记录下走过的路径 (每个 if 走了哪个分支)，
+# 然后把 "判断循环条件 + 沿这条路径执行一遍循环体" 翻译成一个 Python 函数，用 compile() 编译:
+#
+#   - 路径上的 if 变成守卫 (guard): 条件和记录时不一样就退出跟踪，由语法树解释器接着执行
+#     另一个分支和循环体中剩下的语句，然后再回到跟踪
+#   - 常量直接写进代码，变量按槽位确定，局部变量放在 Python 的局部变量里，退出跟踪时写回
+#   - 被调用的函数在编译时就已经确定 (见 natives.py)，内置函数直接调用
+#   - 内层的 while 循环不展开，交给解释器执行 (它自己也会被跟踪编译)
+#
+# 之后每次执行到这个循环都直接调用编译好的函数，由它在 Python 的 while 循环中一次次执行循环体。
+#
+# 跟踪中读到的局部变量和全局变量在进入跟踪时检查一次是否已经赋值 (没有赋值时退出跟踪，
+# 这一次循环由解释器执行并照常报错)。变量一旦赋值就不会再变回未赋值的状态，所以之后不需要再检查。
+# 有 fallback_slot 的全局变量 (见 resolver.py) 被赋值时也要在进入时检查，已经初始化时它就是普通的全局变量。
+
+DEFAULT_THRESHOLD = 50
+DEFAULT_MAX_TRACE_LENGTH = 500
+
+# 跟踪退出的原因，run() 返回的第一个值是 Trace.exits 的下标
+ENTRY, DONE, BREAK_EXIT, RETURN_EXIT, GUARD = 'entry', 'done', 'break', 'return', 'guard'
+
+@dataclass
+class TraceExit:
+    kind: str
+    # GUARD: 守卫失败之后由解释器依次执行的语句 (另一个分支，以及外层语句块中剩下的语句)
+    statements: list[StatementNode] = field(default_factory=list)
+
+@dataclass
+class Trace:
+    source: str
+    # run(局部变量表, 全局变量表) -> (退出的下标, 返回值, 在跟踪中执行的循环体次数)
+    run: object
+    exits: list[TraceExit]
+
+class TraceJIT:
+    def __init__(self, threshold: int = DEFAULT_THRESHOLD, max_trace_length: int = DEFAULT_MAX_TRACE_LENGTH):
+        if threshold <= 0:
+            raise ValueError("threshold must be positive")
+        if max_trace_length <= 0:
+            raise ValueError("max_trace_length must be positive")
+        self.threshold = threshold
+        self.max_trace_length = max_trace_length
+        # 编译出的跟踪个数，太长放弃编译的次数
+        self.traces_compiled = 0
+        self.traces_aborted = 0
+        # 守卫失败退出跟踪的次数，进入时变量没有赋值而没有执行跟踪的次数
+        self.guard_exits = 0
+        self.entry_exits = 0
+        # 在跟踪中执行的循环体次数
+        self.trace_iterations = 0
+        self.sources: list[str] = []
+
+    def report(self) -> str:
+        return (f"跟踪编译: 编译 {self.traces_compiled} 个，放弃 {self.traces_aborted} 个，"
+                f"跟踪中执行循环体 {self.trace_iterations} 次，守卫退出 {self.guard_exits} 次，"
+                f"进入时退出 {self.entry_exits} 次")
+
+# 按记录下的路径 (outcomes: id(IfStat) -> 条件是否为真) 编译循环 stat
+# invoke(function, args) 调用 slang 函数，exec_stat(stat) 由解释器执行一条语句，output 为 print 的输出目标
+# 路径上的结点数超过 max_length 时返回 None
+def compile_trace(stat: WhileStat, outcomes: dict[int, bool], invoke, exec_stat, output,
+                  max_length: int) -> Trace | None:
+    namespace: dict[str, object] = {'invoke': invoke, 'exec_stat': exec_stat}
+    exits = [TraceExit(ENTRY)]
+    body: list[str] = []
+    # 跟踪中用到、赋值过的局部变量槽位；在本次循环体中被赋值之前就读取的变量 (进入时要检查)
+    used_locals: set[int] = set()
+    assigned_locals: set[int] = set()
+    exposed_locals: set[int] = set()
+    exposed_globals: set[int] = set()
+    # 沿路径已经赋值过的变量
+    defined_locals: set[int] = set()
+    defined_globals: set[int] = set()
+    length = 0
+
+    class TooLong(Exception):
+        pass
+
+    def count(node: SyntaxTreeNode):
+        nonlocal length
+        length += 1
+        if length > max_length:
+            raise TooLong()
+
+    def bind(prefix: str, value: object) -> str:
+        name = f'{prefix}{len(namespace)}'
+        namespace[name] = value
+        return name
+
+    def constant(value: float) -> str:
+        if math.isfinite(value):
+            return f'({value!r})'
+        return bind('k', value)
+
+    def emit(line: str):
+        body.append(line)
+
+    # 退出跟踪: 先写回局部变量
+    def emit_exit(indent: str, kind: str, value: str = 'None', statements: list[StatementNode] | None = None):
+        exits.append(TraceExit(kind, statements or []))
+        emit(f'{indent}__WRITEBACK__')
+        emit(f'{indent}return {len(exits) - 1}, {value}, n')
+
+    def assign_local(slot: int) -> str:
+        used_locals.add(slot)
+        assigned_locals.add(slot)
+        defined_locals.add(slot)
+        return f'l{slot}'
+
+    # boolean 为真表示只关心结果的真假，比较不需要转成 0.0 / 1.0 (和 transpiler.py 一样)
+    def gen_expr(expr: ExpressionNode, boolean: bool = False) -> str:
+        count(expr)
+        match expr:
+            case NumberConstant(value):
+                return constant(value)
+            case Variable() if expr.is_global:
+                if expr.slot not in defined_globals:
+                    exposed_globals.add(expr.slot)
+                return f'G[{expr.slot}]'
+            case Variable():
+                used_locals.add(expr.slot)
+                if expr.slot not in defined_locals:
+                    exposed_locals.add(expr.slot)
+                return f'l{expr.slot}'
+            case BinaryExpr(operator='=', left=Variable()) if expr.left.is_global:
+                value = gen_expr(expr.right)
+                if expr.left.fallback_slot >= 0 and expr.left.slot not in defined_globals:
+                    exposed_globals.add(expr.left.slot)
+                defined_globals.add(expr.left.slot)
+                return f'set_global(G, {expr.left.slot}, {value})'
+            case BinaryExpr(operator='=', left=Variable()):
+                value = gen_expr(expr.right)
+                return f'({assign_local(expr.left.slot)} := {value})'
+            case BinaryExpr(operator='+' | '-' | '*' | '/' as op):
+                return f'({gen_expr(expr.left)} {op} {gen_expr(expr.right)})'
+            case BinaryExpr(operator='==' | '!=' | '<' | '<=' | '>' | '>=' as op):
+                comparison = f'({gen_expr(expr.left)} {op} {gen_expr(expr.right)})'
+                return comparison if boolean else f'float{comparison}'
+            case UnaryExpr(operator='+'):
+                return gen_expr(expr.operand, boolean)
+            case UnaryExpr(operator='-'):
+                return f'(-{gen_expr(expr.operand)})'
+            case UnaryExpr(operator='!'):
+                negation = f'(not {gen_expr(expr.operand, True)})'
+                return negation if boolean else f'float{negation}'
+            case CallExpr():
+                args = [gen_expr(arg) for arg in expr.arguments]
+                if type(expr.target) is NativeFunction:
+                    if expr.target.writes_output:
+                        args.append(f"output={bind('o', output)}")
+                    return f"float({bind('n', expr.target.function)}({', '.join(args)}))"
+                return f"invoke({bind('f', expr.target)}, [{', '.join(args)}])"
+            case _:
+                raise NotImplementedError(f"Unknown expression: {expr}")
+
+    # 沿路径生成 stat 的代码，rest 为 stat 之后 (直到循环体结束) 还要执行的语句
+    # 返回 False 表示这一次循环体在 stat 中结束了 (break / continue / return)
+    def gen_stat(stat: StatementNode, rest: list[StatementNode]) -> bool:
+        indent = ' ' * 8
+        count(stat)
+        match stat:
+            case BlockStat():
+                for i, s in enumerate(stat.statements):
+                    if not gen_stat(s, stat.statements[i + 1:] + rest):
+                        return False
+                return True
+            case IfStat():
+                taken = outcomes[id(stat)]
+                condition = gen_expr(stat.condition, True)
+                emit(f'{indent}if {"not " if taken else ""}{condition}:')
+                other = stat.branch_false if taken else stat.branch_true
+                emit_exit(indent + '    ', GUARD, statements=([other] if other is not None else []) + rest)
+                branch = stat.branch_true if taken else stat.branch_false
+                return gen_stat(branch, rest) if branch is not None else True
+            case WhileStat():
+                # 内层循环交给解释器执行，前后同步局部变量
+                emit(f'{indent}__WRITEBACK__')
+                emit(f"{indent}signal = exec_stat({bind('s', stat)})")
+                emit(f'{indent}__RELOAD__')
+                emit(f'{indent}if signal is not None:')
+                emit_exit(indent + '    ', RETURN_EXIT, 'signal')
+                return True
+            case BreakStat():
+                emit_exit(indent, BREAK_EXIT)
+                return False
+            case ContinueStat():
+                emit(f'{indent}continue')
+                return False
+            case ExprEvalStat(expr=BinaryExpr(operator='=', left=Variable(is_global=False))):
+                # 语句中的赋值不需要 :=
+                count(stat.expr)
+                value = gen_expr(stat.expr.right)
+                emit(f'{indent}{assign_local(stat.expr.left.slot)} = {value}')
+                return True
+            case ExprEvalStat():
+                emit(f'{indent}{gen_expr(stat.expr)}')
+                return True
+            case ReturnStat():
+                value = gen_expr(stat.return_value) if stat.return_value is not None else '0.0'
+                emit(f'{indent}value = {value}')
+                emit_exit(indent, RETURN_EXIT, 'value')
+                return False
+            case _:
+                raise NotImplementedError(f"Unknown statement: {stat}")
+
+    try:
+        condition = gen_expr(stat.condition, True)
+        emit(f'        if not {condition}:')
+        emit_exit(' ' * 12, DONE)
+        emit('        n += 1')
+        gen_stat(stat.body, [])
+    except TooLong:
+        return None
+
+    load = [f'l{slot} = L[{slot}]' for slot in sorted(used_locals)]
+    writeback = '; '.join(f'L[{slot}] = l{slot}' for slot in sorted(assigned_locals)) or 'pass'
+    reload = '; '.join(load) or 'pass'
+    checks = [f'l{slot} is None' for slot in sorted(exposed_locals)]
+    checks += [f'G[{slot}] is None' for slot in sorted(exposed_globals)]
+    lines = ['def trace(L, G):']
+    lines += [f'    {line}' for line in load]
+    if checks:
+        lines.append(f"    if {' or '.join(checks)}:")
+        lines.append('        return 0, None, 0')
+    lines += ['    n = 0', '    while True:']
+    lines += [line.replace('__WRITEBACK__', writeback).replace('__RELOAD__', reload) for line in body]
+    source = '\n'.join(lines) + '\n'
+
+    namespace['set_global'] = set_global
+    exec(compile(source, '<trace>', 'exec'), namespace)
+    return Trace(source, namespace['trace'], exits)
+
+def set_global(global_vars: list[float | None], slot: int, value: float) -> float:
+    global_vars[slot] = value
+    return value
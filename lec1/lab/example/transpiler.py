@@ -0,0 +1,243 @@
+import itertools
+import linecache
+import math
+import types
+import weakref
+from typing import Callable
+from parser import *
+from resolver import resolve
+from natives import link_calls, NativeFunction
+
+# 翻译成 Python: 把整个模块翻译成一段 Python 源代码，用 compile() 编译后交给 CPython 执行
+#
+#   - 每个 slang 函数翻译成一个 def，局部变量就是 Python 的局部变量
+#   - 全局变量是生成的 Python 模块的全局变量，函数里给全局变量赋值时加上 global 声明
+#   - 赋值是表达式，翻译成海象运算符 :=
+#   - while / if / break / continue 直接用 Python 的语句，比较的结果用 float(...) 转成 0.0 / 1.0
+#     (if / while 的条件只关心真假，不需要转换)
+#
+# 语义和 interpret() 一致:
+#   - 读取还没有赋值的局部变量: Python 抛出 UnboundLocalError，它是 NameError 的子类
+#   - 函数没有 return 时返回 0.0
+#   - 调用不存在的函数、实参个数不对在翻译 (链接) 时就抛出 NameError / TypeError (见 natives.py)
+#   - 循环外的 break / continue 执行到时才抛出 SyntaxError
+#   - 有 fallback_slot 的全局变量 (见 resolver.py): 全局变量已经初始化时读写它，否则读写同名的局部变量
+# 内置函数 (包括 print) 不翻译，生成的代码按名字 (前缀 n_) 调用，执行之前由 compile_module() 放进模块。
+# 名字都加上前缀 (函数 f_，局部变量 v_，全局变量 g_，内置函数 n_)，不会和 Python 的关键字或者生成代码中的辅助函数冲突；
+# 非 ASCII 的名字可能不是合法的 Python 标识符 (或者被 Python 规范化成另一个名字)，改用编号
+#
+# CPython 对语法有一些限制 (比如 while 最多嵌套 20 层)，超过限制的程序 compile() 会报错
+
+# 每个编译出的模块用不同的文件名登记到 linecache，后编译的模块不会覆盖先编译的模块的源代码
+_module_numbers = itertools.count()
+
+PRELUDE = '''\
+def _outside_loop(statement):
+    raise SyntaxError(f"'{statement}' outside loop")
+
+def _store_late(name, value):
+    if name in globals():
+        globals()[name] = value
+    return value
+'''
+
+# natives 不为 None 时，填入生成的代码用到的内置函数 (生成的名字 -> Python 函数)
+def transpile(module: ModuleNode, natives: dict[str, Callable[..., float]] | None = None) -> str:
+    resolve(module)
+    link_calls(module)
+    if natives is None:
+        natives = {}
+    lines: list[str] = [PRELUDE]
+
+    def emit(indent: int, line: str):
+        lines.append('    ' * indent + line)
+
+    # ASCII 名字原样加前缀，其余的按第一次出现的顺序编号 (编号的名字没有下划线，不会和前者重复)
+    numbered_names: dict[str, int] = {}
+    def mangle(prefix: str, name: str) -> str:
+        if name.isascii():
+            return f'{prefix}_{name}'
+        if name not in numbered_names:
+            numbered_names[name] = len(numbered_names)
+        return f'{prefix}{numbered_names[name]}'
+
+    def variable_name(var: Variable) -> str:
+        return mangle('g' if var.is_global else 'v', var.name)
+
+    function_map: dict[str, FunctionNode] = {}
+    for function in module.functions:
+        function_map[function.name] = function
+
+    def constant(value: float) -> str:
+        if math.isfinite(value):
+            return f'({value!r})'
+        return f"float('{value}')"
+
+    # boolean 为真表示只关心结果的真假 (if / while 的条件，! 的操作数)，比较不需要转成 0.0 / 1.0
+    def gen_expr(expr: ExpressionNode, boolean: bool = False) -> str:
+        match expr:
+            case NumberConstant(value):
+                return constant(value)
+            case Variable() if expr.fallback_slot >= 0:
+                return f"({variable_name(expr)} if {variable_name(expr)!r} in globals() else {mangle('v', expr.name)})"
+            case Variable():
+                return variable_name(expr)
+            case BinaryExpr(operator='=', left=Variable()) if expr.left.fallback_slot >= 0:
+                value = f"({mangle('v', expr.left.name)} := {gen_expr(expr.right)})"
+                return f'_store_late({variable_name(expr.left)!r}, {value})'
+            case BinaryExpr(operator='=', left=Variable()):
+                return f'({variable_name(expr.left)} := {gen_expr(expr.right)})'
+            case BinaryExpr(operator='+' | '-' | '*' | '/' as op):
+                return f'({gen_expr(expr.left)} {op} {gen_expr(expr.right)})'
+            case BinaryExpr(operator='==' | '!=' | '<' | '<=' | '>' | '>=' as op):
+                comparison = f'({gen_expr(expr.left)} {op} {gen_expr(expr.right)})'
+                return comparison if boolean else f'float{comparison}'
+            case UnaryExpr(operator='+'):
+                return gen_expr(expr.operand)
+            case UnaryExpr(operator='-'):
+                return f'(-{gen_expr(expr.operand)})'
+            case UnaryExpr(operator='!'):
+                negation = f'(not {gen_expr(expr.operand, True)})'
+                return negation if boolean else f'float{negation}'
+            case CallExpr():
+                return gen_call_expr(expr)
+            case BinaryExpr() | UnaryExpr():
+                raise NotImplementedError(f"Unknown operator: {expr.operator}")
+            case _:
+                raise NotImplementedError(f"Unknown expression: {expr}")
+
+    def gen_call_expr(expr: CallExpr) -> str:
+        args = [gen_expr(arg) for arg in expr.arguments]
+        # 被调用的函数已经在链接时确定 (内置函数优先)，实参个数也检查过了
+        if type(expr.target) is NativeFunction:
+            name = mangle('n', expr.target.name)
+            natives[name] = expr.target.function
+            # 没有 output 参数，输出写到当时的 sys.stdout
+            if expr.target.writes_output:
+                args.append('output=None')
+            return f"float({name}({', '.join(args)}))"
+        return f"{mangle('f', expr.callee)}({', '.join(args)})"
+
+    def gen_stat(stat: StatementNode, indent: int, in_loop: bool):
+        match stat:
+            case BlockStat():
+                if not stat.statements:
+                    emit(indent, 'pass')
+                for s in stat.statements:
+                    gen_stat(s, indent, in_loop)
+            case IfStat():
+                emit(indent, f'if {gen_expr(stat.condition, True)}:')
+                gen_stat(stat.branch_true, indent + 1, in_loop)
+                if stat.branch_false is not None:
+                    emit(indent, 'else:')
+                    gen_stat(stat.branch_false, indent + 1, in_loop)
+            case WhileStat():
+                emit(indent, f'while {gen_expr(stat.condition, True)}:')
+                gen_stat(stat.body, indent + 1, True)
+            case BreakStat():
+                emit(indent, 'break' if in_loop else "_outside_loop('break')")
+            case ContinueStat():
+                emit(indent, 'continue' if in_loop else "_outside_loop('continue')")
+            case ExprEvalStat():
+                emit(indent, gen_expr(stat.expr))
+            case ReturnStat():
+                value = gen_expr(stat.return_value) if stat.return_value is not None else '0.0'
+                emit(indent, f'return {value}')
+            case _:
+                raise NotImplementedError(f"Unknown statement: {stat}")
+
+    # 函数中被赋值的全局变量，需要 global 声明
+    def assigned_globals(stat: StatementNode) -> list[str]:
+        names: dict[str, None] = {}
+        def visit_expr(expr: ExpressionNode):
+            match expr:
+                case BinaryExpr(operator='=', left=Variable()):
+                    if expr.left.is_global and expr.left.fallback_slot < 0:
+                        names[variable_name(expr.left)] = None
+                    visit_expr(expr.right)
+                case BinaryExpr():
+                    visit_expr(expr.left)
+                    visit_expr(expr.right)
+                case UnaryExpr():
+                    visit_expr(expr.operand)
+                case CallExpr():
+                    for arg in expr.arguments:
+                        visit_expr(arg)
+        def visit_stat(stat: StatementNode):
+            match stat:
+                case BlockStat():
+                    for s in stat.statements:
+                        visit_stat(s)
+                case IfStat():
+                    visit_expr(stat.condition)
+                    visit_stat(stat.branch_true)
+                    if stat.branch_false is not None:
+                        visit_stat(stat.branch_false)
+                case WhileStat():
+                    visit_expr(stat.condition)
+                    visit_stat(stat.body)
+                case ExprEvalStat():
+                    visit_expr(stat.expr)
+                case ReturnStat():
+                    if stat.return_value is not None:
+                        visit_expr(stat.return_value)
+        visit_stat(stat)
+        return list(names)
+
+    for name, function in function_map.items():
+        # 形参重名时以后一个为准，前面的同名形参换成用不到的名字
+        params: list[str] = []
+        for i, param in enumerate(function.parameters):
+            last = len(function.parameters) - 1 - function.parameters[::-1].index(param)
+            params.append(mangle('v', param) if i == last else f'_unused{i}')
+        lines.append('')
+        emit(0, f"def {mangle('f', name)}({', '.join(params)}):")
+        global_names = assigned_globals(function.body)
+        if global_names:
+            emit(1, f"global {', '.join(global_names)}")
+        gen_stat(function.body, 1, False)
+        emit(1, 'return 0.0')
+
+    # 按 slang 中的名字查找翻译后的函数
+    lines.append('')
+    emit(0, 'FUNCTIONS = {' + ', '.join(f"{name!r}: {mangle('f', name)}" for name in function_map) + '}')
+
+    # init() 初始化全局变量，每次都从干净的状态开始: 先删掉上次运行留下的全局变量，再按顺序初始化
+    global_names = [mangle('g', name) for name in module.global_names]
+    lines.append('')
+    emit(0, f'GLOBAL_NAMES = {global_names!r}')
+    lines.append('')
+    emit(0, 'def init():')
+    emit(1, 'for name in GLOBAL_NAMES:')
+    emit(2, 'globals().pop(name, None)')
+    if global_names:
+        emit(1, f"global {', '.join(global_names)}")
+    for var in module.global_vars:
+        emit(1, f'{variable_name(var.left)} = {gen_expr(var.right)}')
+    lines.append('')
+    emit(0, 'def run():')
+    emit(1, 'init()')
+    if 'main' in function_map:
+        emit(1, f"return {gen_call_expr(CallExpr('main', []))}")
+    else:
+        emit(1, 'return 0.0')
+    return '\n'.join(lines) + '\n'
+
+# 翻译并编译，返回生成的 Python 模块，调用它的 run() 执行程序
+# 也可以先调用 init() 初始化全局变量，再通过 FUNCTIONS[函数名] 直接调用某个函数，
+# GLOBAL_NAMES 是各个全局变量 (按槽位的顺序) 在生成的模块中的名字
+# 生成的源代码保存在模块的 __source__ 中，也以 __filename__ 登记到 linecache，出错时的 traceback 能显示生成的代码；
+# 模块被回收时从 linecache 中删掉
+def compile_module(module: ModuleNode, name: str = 'slang_program') -> types.ModuleType:
+    natives: dict[str, Callable[..., float]] = {}
+    source = transpile(module, natives)
+    filename = f'<slang-py-{next(_module_numbers)}>'
+    code = compile(source, filename, 'exec')
+    linecache.cache[filename] = (len(source), None, source.splitlines(True), filename)
+    py_module = types.ModuleType(name)
+    py_module.__source__ = source
+    py_module.__filename__ = filename
+    weakref.finalize(py_module, linecache.cache.pop, filename, None)
+    py_module.__dict__.update(natives)
+    exec(code, py_module.__dict__)
+    return py_module
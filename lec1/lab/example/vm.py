@@ -0,0 +1,148 @@
+from compiler import *
+
+# 栈式虚拟机: 执行 compiler.py 编译出来的字节码
+# 所有函数共享一个操作数栈，调用信息保存在显式的调用栈里，
+# 所以 slang 的函数调用不会占用 Python 的调用栈，递归的深度只受 max_depth 限制
+# 尾调用 (return f(...)) 复用当前的栈帧，尾递归不会加深调用栈
+# 每次调用的局部变量是按槽位下标访问的列表，还没有赋值的变量是 None
+
+DEFAULT_MAX_DEPTH = 100000
+
+# slang 程序的调用栈溢出
+# 是 RecursionError 的子类，原来捕获 Python 递归过深的代码不需要修改
+class StackOverflowError(RecursionError):
+    pass
+
+def run(program: Program, max_depth: int = DEFAULT_MAX_DEPTH) -> float:
+    constants = program.constants
+    names = program.names
+    global_names = program.global_names
+    natives = program.natives
+
+    # 把名字下标对应到函数; 编译时已经链接过，CALL 用到的名字都能找到，实参个数也检查过了
+    function_by_name = { function.name: function for function in program.functions }
+    function_table: list[tuple[list[int], list[str]] | None] = [None] * len(names)
+    for index, name in enumerate(names):
+        if name in function_by_name:
+            function = function_by_name[name]
+            # array 便于紧凑存储，执行时转成 list 下标访问更快
+            function_table[index] = (function.code.tolist(), function.local_names)
+
+    global_vars: list[float | None] = [None] * len(global_names)
+    local_vars: list[float | None] = [None] * len(program.entry.local_names)
+    stack: list[float] = []
+    # 调用栈中每一项保存调用者的 (代码, 返回地址, 局部变量, 局部变量表)
+    frames: list[tuple[list[int], int, list[float | None], list[str]]] = []
+
+    code = program.entry.code.tolist()
+    local_names = program.entry.local_names
+    pc = 0
+
+    while True:
+        op = code[pc]
+        arg = code[pc + 1]
+        pc += 2
+
+        # 按指令出现频率大致排序，减少比较次数
+        if op == LOAD_LOCAL:
+            value = local_vars[arg]
+            if value is None: raise NameError(f"Variable not found: {local_names[arg]}")
+            stack.append(value)
+        elif op == LOAD_CONST:
+            stack.append(constants[arg])
+        elif op == JUMP_IF_FALSE:
+            if not stack.pop():
+                pc = arg
+        elif op == JUMP:
+            pc = arg
+        elif op == STORE_LOCAL:
+            local_vars[arg] = stack[-1]
+        elif op == LOAD_GLOBAL:
+            value = global_vars[arg]
+            if value is None: raise NameError(f"Variable not found: {global_names[arg]}")
+            stack.append(value)
+        elif op == POP:
+            stack.pop()
+        elif op == ADD:
+            right = stack.pop(); stack[-1] = stack[-1] + right
+        elif op == SUB:
+            right = stack.pop(); stack[-1] = stack[-1] - right
+        elif op == MUL:
+            right = stack.pop(); stack[-1] = stack[-1] * right
+        elif op == DIV:
+            right = stack.pop(); stack[-1] = stack[-1] / right
+        elif op == EQ:
+            right = stack.pop(); stack[-1] = float(stack[-1] == right)
+        elif op == NE:
+            right = stack.pop(); stack[-1] = float(stack[-1] != right)
+        elif op == LT:
+            right = stack.pop(); stack[-1] = float(stack[-1] < right)
+        elif op == LE:
+            right = stack.pop(); stack[-1] = float(stack[-1] <= right)
+        elif op == GT:
+            right = stack.pop(); stack[-1] = float(stack[-1] > right)
+        elif op == GE:
+            right = stack.pop(); stack[-1] = float(stack[-1] >= right)
+        elif op == NEG:
+            stack[-1] = -stack[-1]
+        elif op == NOT:
+            stack[-1] = float(not stack[-1])
+        elif op == POS:
+            pass
+        elif op == CALL:
+            argc = code[pc + 1]
+            pc += 2
+            if len(frames) >= max_depth:
+                raise StackOverflowError(f"Stack overflow: call depth exceeds {max_depth} (calling {names[arg]})")
+            frames.append((code, pc, local_vars, local_names))
+            code, local_names = function_table[arg]
+            # 实参就是局部变量表的开头 (见 resolver.py)
+            if argc:
+                local_vars = stack[-argc:]
+                del stack[-argc:]
+                local_vars.extend([None] * (len(local_names) - argc))
+            else:
+                local_vars = [None] * len(local_names)
+            pc = 0
+        elif op == TAIL_CALL:
+            argc = code[pc + 1]
+            # 不压入新的栈帧，被调用的函数返回时直接回到当前函数的调用者
+            code, local_names = function_table[arg]
+            if argc:
+                local_vars = stack[-argc:]
+                del stack[-argc:]
+                local_vars.extend([None] * (len(local_names) - argc))
+            else:
+                local_vars = [None] * len(local_names)
+            pc = 0
+        elif op == RETURN:
+            if not frames:
+                return stack.pop()
+            code, pc, local_vars, local_names = frames.pop()
+        elif op == CALL_BUILTIN:
+            argc = code[pc + 1]
+            pc += 2
+            args = stack[len(stack) - argc:]
+            del stack[len(stack) - argc:]
+            native = natives[arg]
+            # 没有 output 参数，输出写到当时的 sys.stdout
+            if native.writes_output:
+                stack.append(float(native.function(*args, output=None)))
+            else:
+                stack.append(float(native.function(*args)))
+        elif op == STORE_GLOBAL:
+            global_vars[arg] = stack[-1]
+        elif op == LOAD_LATE:
+            value = global_vars[arg]
+            if value is None: value = local_vars[code[pc + 1]]
+            if value is None: raise NameError(f"Variable not found: {global_names[arg]}")
+            stack.append(value)
+            pc += 2
+        elif op == STORE_LATE:
+            if global_vars[arg] is not None: global_vars[arg] = stack[-1]
+            else: local_vars[code[pc + 1]] = stack[-1]
+            pc += 2
+        elif op == RAISE:
+            raise SyntaxError(OUTSIDE_LOOP[arg])
+        else:
+            raise NotImplementedError(f"Unknown opcode: {op}")
@@ -0,0 +1,129 @@
+import contextlib
+import io
+import os
+import sys
+import unittest
+
+# 测试放在 example 目录之外，和 benchmarks 一样手动把 example 加进模块搜索路径
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(HERE, '..', 'example'))
+
+from tokenizer import tokenize
+from parser import parse
+from interpreter import interpret
+from optimizer import optimize
+from flat_ast import flatten, interpret_flat, view
+import closure
+import transpiler
+import compiler
+import vm
+import ir_exec
+
+# 各个执行后端在同一程序上的输出、返回值和报错必须和树遍历解释器一致
+# (benchmarks/compare_backends.py 比较耗时，这里比较结果)
+BACKENDS = {
+    'tree': interpret,
+    'optimized': lambda module: interpret(optimize(module)),
+    'flat': lambda module: interpret_flat(flatten(module)),
+    'view': lambda module: interpret(view(flatten(module))),
+    'closure': lambda module: closure.compile_module(module)(),
+    'vm': lambda module: vm.run(compiler.compile_module(module)),
+    'py': lambda module: transpiler.compile_module(module).run(),
+    'ir': ir_exec.run_ir,
+}
+
+PROGRAMS = [
+    os.path.join(HERE, '..', 'example', 'example.slang'),
+    os.path.join(HERE, '..', 'todo', 'example.slang'),
+    os.path.join(HERE, '..', 'benchmarks', 'fib.slang'),
+]
+
+# 返回 (输出, 返回值)；出错时返回值是异常的类型
+# 每次都重新分析源代码，后端会在语法树上写入作用域解析和链接的结果
+def run(backend: str, source: str) -> tuple[str, object]:
+    output = io.StringIO()
+    with contextlib.redirect_stdout(output):
+        try:
+            result = BACKENDS[backend](parse(tokenize(source)))
+        except Exception as e:
+            result = type(e)
+    return output.getvalue(), result
+
+class BackendTestCase(unittest.TestCase):
+    # 每个后端的结果都是 expected；-0.0 和 0.0 相等，所以返回值连同 repr 一起比较
+    # 报错允许是子类: py 后端读未赋值的局部变量时抛出的是 UnboundLocalError
+    def assert_all_backends(self, source: str, output: str, result: object):
+        for backend in BACKENDS:
+            with self.subTest(backend=backend):
+                actual_output, actual_result = run(backend, source)
+                self.assertEqual(actual_output, output)
+                if isinstance(result, type):
+                    self.assertIsInstance(actual_result, type)
+                    self.assertTrue(issubclass(actual_result, result), actual_result)
+                else:
+                    self.assertEqual((actual_result, repr(actual_result)), (result, repr(result)))
+
+class TestAgreement(BackendTestCase):
+    def test_programs(self):
+        for filename in PROGRAMS:
+            with open(filename, 'r', encoding='utf-8') as f:
+                source = f.read()
+            expected = run('tree', source)
+            with self.subTest(program=os.path.basename(filename)):
+                self.assert_all_backends(source, *expected)
+
+    def test_global_initialization_order(self):
+        # 初始化表达式调用的函数给还没有初始化的全局变量赋值时写的是局部变量 (见 resolver.py)
+        source = "a = f(); b = 2; function f() { b = 5; return b; } function main() { print(a, b); return f(); }"
+        self.assert_all_backends(source, '5.0 2.0\n', 5.0)
+
+    def test_unknown_names(self):
+        self.assert_all_backends("function main() { if (0) x = 1; return x; }", '', NameError)
+        self.assert_all_backends("function main() { print(1); return q(); }", '', NameError)
+        self.assert_all_backends("function f(x) { return x; } function main() { return f(1, 2); }", '', TypeError)
+
+class TestNegativeZero(BackendTestCase):
+    def test_constant(self):
+        self.assert_all_backends("function main() { print(-0, 0 * -1); return -0; }", '-0.0 -0.0\n', -0.0)
+
+    def test_not_simplified_away(self):
+        # x + 0 不能化简成 x: -0.0 + 0.0 是 0.0
+        self.assert_all_backends("function f(x) { return x + 0; } function main() { return f(-0); }", '', 0.0)
+        self.assert_all_backends("function f(x) { return x * 1; } function main() { return f(-0); }", '', -0.0)
+
+    def test_comparison(self):
+        self.assert_all_backends("function main() { return -0 == 0; }", '', 1.0)
+
+class TestDivisionByZero(BackendTestCase):
+    def test_constant_division(self):
+        # 常量折叠不能提前报错，也不能把这个除法删掉
+        self.assert_all_backends("function main() { print(1); return 1 / 0; }", '1.0\n', ZeroDivisionError)
+
+    def test_unused_result(self):
+        self.assert_all_backends("function main() { 1 / 0; return 2; }", '', ZeroDivisionError)
+
+    def test_dead_branch(self):
+        self.assert_all_backends("function main() { if (0) return 1 / 0; return 2; }", '', 2.0)
+
+    def test_negative_zero_divisor(self):
+        self.assert_all_backends("function f(x) { return 1 / x; } function main() { return f(-0); }", '', ZeroDivisionError)
+
+class TestOutsideLoop(BackendTestCase):
+    # 循环外的 break / continue 执行到时才抛出 SyntaxError
+    def test_break_at_runtime(self):
+        self.assert_all_backends("function main() { print(1); break; }", '1.0\n', SyntaxError)
+
+    def test_continue_not_executed(self):
+        self.assert_all_backends("function f() { continue; } function main() { if (0) f(); return 2; }", '', 2.0)
+
+    def test_does_not_leave_function(self):
+        # 被调用的函数中的 break 不会跳出调用者的循环
+        self.assert_all_backends("function f() { break; } function main() { while (1) { f(); } return 1; }",
+                                 '', SyntaxError)
+
+    def test_inside_loop(self):
+        source = "function main() { i = 0; while (i < 5) { i = i + 1; if (i == 2) continue; if (i == 4) break; print(i); } return i; }"
+        self.assert_all_backends(source, '1.0\n3.0\n', 4.0)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,49 +1,297 @@
+import argparse
+import contextlib
+import hashlib
+import io
+import json
+import math
+import os
+import subprocess
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
 
-# 测试你有没有不小心破坏原本的功能
-def test_original_code() -> bool:
+# 评分器
+#
+# 一份提交 (submission) 是一个目录，结构和 example 目录相同: 至少有 tokenizer.py (tokenize)、
+# parser.py (parse) 和 interpreter.py (interpret)。默认评测 grader.py 所在的目录。
+#
+# 每个测试点用提交的解释器运行一个 slang 程序，把 print 的输出和 main 的返回值与 golden 目录中的标准答案比较。
+# 每个 (提交, 测试点) 在单独的子进程里运行，互不影响:
+#   - 墙钟时间超过 --timeout 秒的子进程直接杀掉，死循环不会卡住整个评测
+#   - 提交的代码每执行一行算一步，超过 --max-steps 步就中止 (比墙钟时间更稳定，不受机器负载影响)
+#   - 子进程在临时目录中运行，支持的系统上还会限制内存
+# 多个子进程由 --jobs 个线程同时调度。
+#
+# 结果按 (提交的代码, 测试程序, 标准答案, 评分器, 限制) 的哈希缓存，没有修改过的提交不会重新评测。
+#
+#   python grader.py                              评测当前目录
+#   python grader.py sub1 sub2 ... --jobs 8       评测多份提交，输出汇总表
+#   python grader.py sub* --report report.json    同时输出 JSON 报告
+#   python grader.py --build-golden REFERENCE     用参考实现重新生成标准答案
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+GOLDEN_DIR = os.path.join(HERE, 'golden')
+
+# 测试点名字 -> 测试程序
+TESTS = {
+    "测试原功能": 'example.slang',
+    "测试 for 语法": 'for.slang',
+    "测试添加内置函数": 'builtin.slang',
+}
+
+DEFAULT_TIMEOUT = 10.0
+DEFAULT_MAX_STEPS = 5_000_000
+MEMORY_LIMIT = 1024 * 1024 * 1024
+
+def default_cache_dir() -> str:
+    return os.environ.get('SLANG_GRADER_CACHE_DIR') or os.path.join(os.path.expanduser('~'), '.cache', 'slang-grader')
+
+class StepLimitExceeded(Exception):
+    pass
+
+# 在子进程中运行: 载入提交的解释器，执行测试程序，把结果以 JSON 写到标准输出
+def run_worker(submission: str, test_file: str, max_steps: int):
     try:
+        import resource
+        resource.setrlimit(resource.RLIMIT_AS, (MEMORY_LIMIT, MEMORY_LIMIT))
+    except (ImportError, ValueError, OSError):
         pass
-    except:
-        return False
-    return True
+    sys.setrecursionlimit(10000)
+    submission = os.path.abspath(submission)
+    sys.path.insert(0, submission)
+    with open(test_file, 'r', encoding='utf-8') as f:
+        source = f.read()
 
-# 测试你的 "添加 for 语法" 这一任务的完成度
-def test_for() -> bool:
+    # 只统计提交目录中的代码执行的行数
+    prefix = submission + os.sep
+    steps = 0
+    def trace_line(frame, event, arg):
+        nonlocal steps
+        if event == 'line':
+            steps += 1
+            if steps > max_steps:
+                raise StepLimitExceeded(f"exceeded {max_steps} steps")
+        return trace_line
+    def trace_call(frame, event, arg):
+        return trace_line if frame.f_code.co_filename.startswith(prefix) else None
+
+    output = io.StringIO()
+    result: dict = {'status': 'ok', 'return_value': None, 'error': None}
     try:
-        pass
-    except:
-        return False
-    return True
+        with contextlib.redirect_stdout(output):
+            from tokenizer import tokenize
+            from parser import parse
+            from interpreter import interpret
+            sys.settrace(trace_call)
+            try:
+                result['return_value'] = float(interpret(parse(tokenize(source))))
+            finally:
+                sys.settrace(None)
+    except StepLimitExceeded as e:
+        result.update(status='step_limit', error=str(e))
+    except BaseException as e:
+        result.update(status='error', error=f"{type(e).__name__}: {e}")
+    result['output'] = output.getvalue()
+    result['steps'] = steps
+    sys.stdout.write(json.dumps(result))
 
-# 测试你的 "添加内置函数 sin cos tan abs" 这一任务的完成度
-def test_builtin_functions() -> bool:
+# 在子进程中运行一个测试点，返回 run_worker 的结果，超时或者子进程崩溃时返回相应的状态
+def run_isolated(submission: str, test_file: str, timeout: float, max_steps: int) -> dict:
+    command = [sys.executable, '-I', os.path.abspath(__file__), '--worker',
+               os.path.abspath(submission), os.path.abspath(test_file), str(max_steps)]
+    start = time.perf_counter()
+    with tempfile.TemporaryDirectory() as cwd:
+        try:
+            completed = subprocess.run(command, cwd=cwd, capture_output=True, timeout=timeout,
+                                       stdin=subprocess.DEVNULL)
+        except subprocess.TimeoutExpired:
+            return {'status': 'timeout', 'return_value': None, 'output': '',
+                    'error': f"timed out after {timeout}s", 'time': time.perf_counter() - start}
+    elapsed = time.perf_counter() - start
     try:
-        pass
-    except:
+        result = json.loads(completed.stdout.decode('utf-8'))
+    except (UnicodeDecodeError, json.JSONDecodeError):
+        stderr = completed.stderr.decode('utf-8', 'replace').strip().splitlines()
+        return {'status': 'crash', 'return_value': None, 'output': '',
+                'error': stderr[-1] if stderr else f"exit code {completed.returncode}", 'time': elapsed}
+    result['time'] = elapsed
+    return result
+
+def load_golden(test: str) -> dict:
+    with open(os.path.join(GOLDEN_DIR, os.path.splitext(test)[0] + '.json'), 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+# 返回值允许有很小的误差 (比如 tan 用 sin / cos 实现)，输出必须完全一致
+def matches(result: dict, golden: dict) -> bool:
+    if result['status'] != 'ok' or result['output'] != golden['output']:
         return False
-    return True
+    actual, expected = result['return_value'], golden['return_value']
+    if math.isnan(expected):
+        return math.isnan(actual)
+    return math.isclose(actual, expected, rel_tol=1e-9, abs_tol=1e-12)
 
-def main():
-    tests = {
-        "测试原功能": test_original_code,
-        "测试 for 语法": test_for,
-        "测试添加内置函数": test_builtin_functions
-    }
-    
+def _hash_file(digest, path: str):
+    with open(path, 'rb') as f:
+        digest.update(f.read())
+
+# 提交目录中所有 .py 文件的哈希
+def submission_hash(submission: str) -> str:
+    digest = hashlib.blake2b(digest_size=16)
+    for root, dirs, files in os.walk(submission):
+        dirs[:] = sorted(d for d in dirs if d != '__pycache__' and not d.startswith('.'))
+        for name in sorted(files):
+            if name.endswith('.py'):
+                path = os.path.join(root, name)
+                digest.update(os.path.relpath(path, submission).encode('utf-8') + b'\0')
+                _hash_file(digest, path)
+    return digest.hexdigest()
+
+def test_key(submission_digest: str, test: str, timeout: float, max_steps: int) -> str:
+    digest = hashlib.blake2b(digest_size=16)
+    digest.update(submission_digest.encode('ascii'))
+    _hash_file(digest, os.path.join(HERE, test))
+    _hash_file(digest, os.path.join(GOLDEN_DIR, os.path.splitext(test)[0] + '.json'))
+    _hash_file(digest, os.path.abspath(__file__))
+    digest.update(f"{timeout}:{max_steps}".encode('ascii'))
+    return digest.hexdigest()
+
+# 评测一个测试点，能用缓存就用缓存
+def grade_test(submission: str, submission_digest: str, test: str, timeout: float, max_steps: int,
+               cache_dir: str | None) -> dict:
+    path = None
+    if cache_dir is not None:
+        path = os.path.join(cache_dir, test_key(submission_digest, test, timeout, max_steps) + '.json')
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                result = json.load(f)
+            result['cached'] = True
+            return result
+        except (OSError, json.JSONDecodeError):
+            pass
+    result = run_isolated(submission, os.path.join(HERE, test), timeout, max_steps)
+    result['passed'] = matches(result, load_golden(test))
+    if path is not None:
+        try:
+            os.makedirs(cache_dir, exist_ok=True)
+            temp_path = path + f'.{os.getpid()}.tmp'
+            with open(temp_path, 'w', encoding='utf-8') as f:
+                json.dump(result, f)
+            os.replace(temp_path, path)
+        except OSError:
+            pass
+    result['cached'] = False
+    return result
+
+# 并行评测多份提交，返回 {提交: {测试点名字: 结果}}
+def grade(submissions: list[str], jobs: int | None = None, timeout: float = DEFAULT_TIMEOUT,
+          max_steps: int = DEFAULT_MAX_STEPS, cache_dir: str | None = None) -> dict[str, dict[str, dict]]:
+    digests = { submission: submission_hash(submission) for submission in submissions }
+    with ThreadPoolExecutor(max_workers=jobs or os.cpu_count()) as executor:
+        futures = { (submission, name): executor.submit(grade_test, submission, digests[submission], test,
+                                                        timeout, max_steps, cache_dir)
+                    for submission in submissions for name, test in TESTS.items() }
+        return { submission: { name: futures[submission, name].result() for name in TESTS }
+                 for submission in submissions }
+
+# 用参考实现运行所有测试程序，生成标准答案
+def build_golden(reference: str, timeout: float, max_steps: int):
+    os.makedirs(GOLDEN_DIR, exist_ok=True)
+    for test in TESTS.values():
+        result = run_isolated(reference, os.path.join(HERE, test), timeout, max_steps)
+        if result['status'] != 'ok':
+            print(f"{test}: 参考实现运行失败 ({result['status']}: {result['error']})，没有更新")
+            continue
+        with open(os.path.join(GOLDEN_DIR, os.path.splitext(test)[0] + '.json'), 'w', encoding='utf-8') as f:
+            json.dump({'output': result['output'], 'return_value': result['return_value']}, f, ensure_ascii=False, indent=2)
+            f.write('\n')
+        print(f"{test}: 已更新")
+
+# 评测单份提交时的测试点，和原来一样可以单独调用
+def test_original_code() -> bool:
+    return grade([HERE], jobs=1)[HERE]["测试原功能"]['passed']
+
+def test_for() -> bool:
+    return grade([HERE], jobs=1)[HERE]["测试 for 语法"]['passed']
+
+def test_builtin_functions() -> bool:
+    return grade([HERE], jobs=1)[HERE]["测试添加内置函数"]['passed']
+
+def describe(result: dict) -> str:
+    if result['passed']:
+        return '通过'
+    if result['status'] == 'ok':
+        return '结果错误'
+    return {'timeout': '超时', 'step_limit': '超出步数', 'crash': '崩溃'}.get(result['status'], '出错')
+
+def print_single(results: dict[str, dict]):
     score = 0
-    max_score = len(tests)
-    for name, func in tests.items():
-        if func():
+    for name, result in results.items():
+        if result['passed']:
             print(f"测试点 {name} 已通过")
             score += 1
         else:
-            print(f"测试点 {name} 未通过")
+            print(f"测试点 {name} 未通过 ({describe(result)}{': ' + result['error'] if result['error'] else ''})")
 
-    print(f"你在本次测试中获得了 {score} / {max_score} 分")
-    if score == max_score:
+    print(f"你在本次测试中获得了 {score} / {len(results)} 分")
+    if score == len(results):
         print("恭喜你通过了测试!")
     else:
         print("仍有测试未通过，加油哦")
 
+# 每行用提交的相对路径标识，不同目录下同名的提交不会混在一起
+def print_summary(results: dict[str, dict[str, dict]]):
+    width = max(len(os.path.relpath(s)) for s in results) + 2
+    print(f"{'提交':<{width}}" + ''.join(f"{name:<16}" for name in TESTS) + '得分')
+    for submission, tests in results.items():
+        score = sum(result['passed'] for result in tests.values())
+        cells = ''.join(f"{describe(result):<16}" for result in tests.values())
+        print(f"{os.path.relpath(submission):<{width}}{cells}{score} / {len(tests)}")
+    graded = sum(not result['cached'] for tests in results.values() for result in tests.values())
+    print(f"共 {len(results)} 份提交，实际运行 {graded} 个测试点，其余来自缓存")
+
+def main():
+    if len(sys.argv) == 5 and sys.argv[1] == '--worker':
+        run_worker(sys.argv[2], sys.argv[3], int(sys.argv[4]))
+        return
+
+    arg_parser = argparse.ArgumentParser(description="slang 实验评分器")
+    arg_parser.add_argument('submissions', nargs='*', default=[HERE], help="提交的目录 (默认为评分器所在的目录)")
+    arg_parser.add_argument('--jobs', '-j', type=int, default=None, help="同时运行的测试点个数 (默认为 CPU 核数)")
+    arg_parser.add_argument('--timeout', type=float, default=DEFAULT_TIMEOUT, help="每个测试点的墙钟时间限制 (秒)")
+    arg_parser.add_argument('--max-steps', type=int, default=DEFAULT_MAX_STEPS, help="每个测试点最多执行提交代码的行数")
+    arg_parser.add_argument('--report', metavar='FILE', help="把详细结果写成 JSON")
+    arg_parser.add_argument('--cache-dir', default=None, help="结果缓存目录 (默认为 ~/.cache/slang-grader)")
+    arg_parser.add_argument('--no-cache', action='store_true', help="不读也不写结果缓存")
+    arg_parser.add_argument('--build-golden', metavar='REFERENCE', help="用参考实现的目录重新生成标准答案")
+    args = arg_parser.parse_args()
+
+    if args.build_golden is not None:
+        build_golden(args.build_golden, args.timeout, args.max_steps)
+        return
+    cache_dir = None if args.no_cache else (args.cache_dir or default_cache_dir())
+    # 同一个目录 (比如 lab 和 ./lab) 只评测一次
+    submissions: dict[str, str] = {}
+    for submission in args.submissions:
+        submissions.setdefault(os.path.abspath(submission), submission)
+    results = grade(list(submissions.values()), args.jobs, args.timeout, args.max_steps, cache_dir)
+    if len(results) == 1:
+        print_single(next(iter(results.values())))
+    else:
+        print_summary(results)
+    if args.report is not None:
+        report = {
+            'tests': TESTS,
+            'limits': {'timeout': args.timeout, 'max_steps': args.max_steps},
+            'submissions': { os.path.abspath(submission): {
+                'score': sum(result['passed'] for result in tests.values()),
+                'max_score': len(tests),
+                'tests': tests,
+            } for submission, tests in results.items() },
+        }
+        with open(args.report, 'w', encoding='utf-8') as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+            f.write('\n')
+
 if __name__ == "__main__":
     main()